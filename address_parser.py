@@ -1,10 +1,13 @@
 import os
-import time
 import psycopg2
-import requests
 import configparser
 
 from psycopg2.extras import Json
+from seen_ids import SeenIds
+from http_client import HttpClient
+from rate_limiter import RateLimiter
+from geocode_cache import GeocodeCache
+from viertel_index import get_viertel_index
 
 # path of script
 script_path = os.path.dirname(os.path.realpath(__file__))
@@ -23,9 +26,14 @@ osm_ids_sql = """
     SELECT osm_id FROM gis.osm;
     """
 
+osm_exists_sql = """
+    SELECT 1 FROM gis.osm WHERE osm_id = %s;
+    """
+
 insert_osm_ids = """
     INSERT INTO gis.osm (osm_id, fc, city)
-    VALUES (%s,%s,%s);
+    VALUES (%s,%s,%s)
+    ON CONFLICT DO NOTHING;
     """
 
 update_city_sql = """
@@ -62,29 +70,55 @@ inserate = cur.fetchall()
 print(f"Noch {len(inserate)} inserate")
 
 # get stored osm_ids
-cur.execute(osm_ids_sql)
-rows = cur.fetchall()
-osm_ids = [int(x[0]) for x in rows] if len(rows) > 0 else []
+osm_ids = SeenIds.from_config(
+    config, "osm", cur, osm_ids_sql, exists_sql=osm_exists_sql
+)
 print(f"Bisher {len(osm_ids)} osm_ids")
 
-def http_get(url):
-    try:
-        r = requests.get(url)
-        if r.tatus_code == 200:
-            return r
-        else:
-            raise requests.HTTPError(
-                f"Request failed with status_code {r.status_code}"
-            )
-    except requests.ConnectionError as e:
-        print(e, url + " probably offline!")
+# shared, pooled http client
+# nominatim usage policy: max. 1 request per second; keep 2s
+rate_limiter = RateLimiter.from_config(
+    config, "nominatim", hosts=["nominatim.openstreetmap.org"],
+    rate=0.5, max_rate=0.5
+)
+client = HttpClient(rate_limiter=rate_limiter)
+http_get = client.get
+
+# persistent nominatim cache; only misses hit the network
+geocode_cache = GeocodeCache(
+    config.get(
+        "GEOCODE", "cache", fallback=script_path + "/geocode_cache.sqlite"
+    )
+)
+def nominatim_search(query_str):
+    """
+
+    nominatim search with persistent cache
+    rate limit only applies to cache misses
+
+    :query_str: nominatim search url (string)
+    :returns: FeatureCollection (dict) or None if nothing was found
+
+    """
+    hit, fc = geocode_cache.get(query_str)
+    if hit:
+        return fc
+
+    r = http_get(query_str)
+    fc = r.json()
+    if not fc["features"]:
+        fc = None
+    geocode_cache.set(query_str, fc)
+
+    return fc
 
 def parse_address(address_str):
     query_str = "https://nominatim.openstreetmap.org/search?" \
         f"q={address_str}&format=geojson&addressdetails=1"
     print(query_str)
-    r = requests.get(query_str)
-    fc = r.json()
+    fc = nominatim_search(query_str)
+    if fc is None:
+        return None
     feats = fc["features"]
 
     # bahnhof features rausfiltern
@@ -109,16 +143,6 @@ def parse_address(address_str):
     elif "village" in feat["properties"]["address"]:
         city = feat["properties"]["address"]["village"]
 
-    if city != "Augsburg":
-        viertel = None
-    elif feat["properties"]["type"] == "hamlet":
-        viertel = None
-    else:
-        viertel = feat["properties"]["address"]["suburb"] + "_" + city
-        # map "Haunstetten" to "Haunstetten-Siebenbrunn"
-        if viertel == "Haunstetten_Augsburg":
-            viertel = "Haunstetten-Siebenbrunn_Augsburg"
-
     # bei folgenden Feature Types keine Strasse
     exclude_types = ("neighbourhood",
                      "suburb",
@@ -162,11 +186,19 @@ def parse_address(address_str):
     lon = feat["geometry"]["coordinates"][0]
     lat = feat["geometry"]["coordinates"][1]
 
+    # viertel via local point-in-polygon lookup instead of
+    # nominatim's "suburb"; None outside of known viertel
+    viertel_index = get_viertel_index(city)
+    if viertel_index is None or feat["properties"]["type"] == "hamlet":
+        viertel = None
+    else:
+        viertel = viertel_index.lookup(lon, lat)
+
     # insert osm if necessary
     if osm_id not in osm_ids:
         cur.execute(insert_osm_ids, [osm_id, Json(fc), city])
-        # add new osm_id to list
-        osm_ids.append(osm_id)
+        # add new osm_id to index
+        osm_ids.add(osm_id)
 
     ret_d = {
         "osm_id": osm_id,
@@ -193,6 +225,9 @@ for i in inserate:
     print(i[3] + " .... " + address_str)
     osm_data = parse_address(address_str)
     print(osm_data)
+    if osm_data is None:
+        print("---keine Treffer----")
+        continue
     if i[2] != osm_data["city"]:
         print(f"---replacing {osm_data['city']} for {i[2]}----")
     if i[1] != osm_data["viertel"]:
@@ -211,8 +246,11 @@ for i in inserate:
         i[0],
     ))
     """
-    time.sleep(2)
     print()
 
+osm_ids.save()
+geocode_cache.close()
+print(client.stats_summary())
+client.close()
 cur.close()
 conn.close()
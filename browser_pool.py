@@ -0,0 +1,202 @@
+import queue
+import threading
+
+from contextlib import contextmanager
+
+# records the bodies of fetch/XHR responses of the page that contain
+# needle; read (and emptied) with take_captured. installed on a loaded
+# page, it sees every request the page makes afterwards
+capture_js = """
+var needle = arguments[0];
+if (!window.__captured) {
+    window.__captured = [];
+    var keep = function(text) {
+        if (typeof text === "string" && text.indexOf(needle) !== -1) {
+            window.__captured.push(text);
+        }
+    };
+    var fetch_ = window.fetch;
+    if (fetch_) {
+        window.fetch = function() {
+            return fetch_.apply(this, arguments).then(function(r) {
+                r.clone().text().then(keep, function() {});
+                return r;
+            });
+        };
+    }
+    var send_ = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        this.addEventListener("load", function() {
+            if (this.responseType === "" || this.responseType === "text") {
+                keep(this.responseText);
+            }
+        });
+        return send_.apply(this, arguments);
+    };
+}
+"""
+
+
+def install_capture(driver, needle):
+    """
+
+    start recording fetch/XHR responses of the loaded page
+
+    :driver: selenium WebDriver
+    :needle: only responses containing this are kept (string)
+
+    """
+    driver.execute_script(capture_js, needle)
+
+
+def take_captured(driver):
+    """
+
+    :driver: selenium WebDriver with install_capture
+    :returns: response bodies recorded since the last call (list)
+
+    """
+    return driver.execute_script(
+        "return window.__captured ? window.__captured.splice(0) : [];"
+    )
+
+
+def firefox_factory(headless=True, remote_url=None):
+    """
+
+    :headless: run without window (bool)
+    :remote_url: selenium server, e.g. http://localhost:4444/wd/hub;
+                 default a local Firefox (string)
+    :returns: function that starts a Firefox WebDriver
+
+    """
+    def factory():
+        # imported here, only the spk scraper needs selenium
+        from selenium import webdriver
+        from selenium.webdriver.firefox.options import Options
+
+        options = Options()
+        if headless:
+            options.add_argument("-headless")
+        if remote_url:
+            return webdriver.Remote(
+                command_executor=remote_url, options=options
+            )
+
+        return webdriver.Firefox(options=options)
+
+    return factory
+
+
+class BrowserPool:
+
+    """
+
+    Pool of browser sessions of one run
+
+    a browser is started on first demand and handed back after use
+    instead of quitting it, so further searches (cities) of the same
+    run do not pay the browser startup; at most size browsers run at
+    once. the sessions end with close, every run starts new ones (with
+    a remote_url a new session on the selenium server)
+
+    """
+
+    def __init__(self, factory, size=1):
+        """
+
+        :factory: function -> new WebDriver
+        :size: max. browsers (int)
+
+        """
+        self.factory = factory
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.started = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+
+        :config: ConfigParser of cfg.ini; [BROWSER] size, headless and
+                 remote_url
+
+        """
+        return cls(
+            firefox_factory(
+                headless=config.getboolean(
+                    "BROWSER", "headless", fallback=True
+                ),
+                remote_url=config.get("BROWSER", "remote_url", fallback=None)
+            ),
+            size=config.getint("BROWSER", "size", fallback=1)
+        )
+
+    def acquire(self):
+        """
+
+        :returns: idle or new WebDriver; blocks if size are in use
+
+        """
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            start = self.started < self.size
+            if start:
+                self.started += 1
+        if not start:
+            return self.idle.get()
+        try:
+            return self.factory()
+        except Exception:
+            with self.lock:
+                self.started -= 1
+            raise
+
+    def release(self, driver, broken=False):
+        """
+
+        :driver: WebDriver of acquire
+        :broken: quit it instead of keeping it, e.g. after a crash
+
+        """
+        if broken:
+            try:
+                driver.quit()
+            finally:
+                with self.lock:
+                    self.started -= 1
+            return
+        # next user starts without the state of the last search
+        driver.delete_all_cookies()
+        self.idle.put(driver)
+
+    @contextmanager
+    def session(self):
+        """
+
+        with pool.session() as driver: ...
+
+        """
+        driver = self.acquire()
+        try:
+            yield driver
+        except Exception:
+            self.release(driver, broken=True)
+            raise
+        self.release(driver)
+
+    def close(self):
+        while True:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                driver.quit()
+            finally:
+                with self.lock:
+                    self.started -= 1
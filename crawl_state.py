@@ -0,0 +1,202 @@
+import os
+import json
+
+from datetime import datetime
+
+# path of script
+script_path = os.path.dirname(os.path.realpath(__file__))
+
+
+class CrawlState:
+
+    """
+
+    Resumable checkpoint of one crawl (source, city, wtype)
+
+    stored as json in <dir>/<source>_<city>_<wtype>.json and replaced
+    atomically on every checkpoint: the current results page and the
+    listings of it that are already written. an interrupted run
+    resumes there; a completed run is recorded and the next one
+    starts again at the first page
+
+    """
+
+    def __init__(self, path, first_page=0, legacy_counter=None):
+        """
+
+        :path: json file (string)
+        :first_page: number of the first results page (int)
+        :legacy_counter: old wg_counter file; its page is taken over
+                         if there is no state yet (string)
+
+        """
+        self.path = path
+        self.first_page = first_page
+        try:
+            with open(path) as f:
+                self.state = json.load(f)
+        except FileNotFoundError:
+            self.state = {
+                "status": "complete",
+                "page": first_page,
+                "done": [],
+                "started": None,
+                "updated": None,
+                "completed": None
+            }
+            if legacy_counter and os.path.exists(legacy_counter):
+                with open(legacy_counter) as f:
+                    self.state["page"] = int(f.read().strip() or first_page)
+                self.state["status"] = "running"
+        self.done = set(self.state["done"])
+
+    @classmethod
+    def from_config(cls, config, source, city, wtype, first_page=0,
+                    legacy_counter=None):
+        """
+
+        :config: ConfigParser of cfg.ini; [CRAWL_STATE] dir is the
+                 directory, default crawl_state/ next to the scripts
+        :source: e.g. "wg_gesucht", "immoscout", "spk" (string)
+        :city: city (string)
+        :wtype: wohnungstype code (string/int)
+
+        """
+        state_dir = config.get(
+            "CRAWL_STATE", "dir", fallback=script_path + "/crawl_state"
+        )
+        os.makedirs(state_dir, exist_ok=True)
+        name = f"{source}_{city.lower()}_{wtype}.json"
+
+        return cls(
+            os.path.join(state_dir, name), first_page, legacy_counter
+        )
+
+    @property
+    def page(self):
+        return self.state["page"]
+
+    @property
+    def last_completed(self):
+        """
+
+        :returns: end of the last completed run (datetime or None)
+
+        """
+        completed = self.state["completed"]
+        return datetime.fromisoformat(completed) if completed else None
+
+    def begin(self):
+        """
+
+        resume an interrupted run or start a new one at first_page
+
+        :returns: page to start at (int)
+
+        """
+        if self.state["status"] == "running":
+            print(
+                f"Resume at page {self.page}, "
+                f"{len(self.done)} inserate of it done"
+            )
+        else:
+            self.state["status"] = "running"
+            self.state["page"] = self.first_page
+            self.state["started"] = datetime.now().isoformat()
+            self.done = set()
+            self.save()
+
+        return self.page
+
+    def is_done(self, listing_id):
+        return str(listing_id) in self.done
+
+    def listings_done(self, listing_ids):
+        """
+
+        checkpoint written listings of the current page
+
+        :listing_ids: ids of listings (iterable)
+
+        """
+        self.done.update(str(x) for x in listing_ids)
+        self.save()
+
+    def page_done(self, page):
+        """
+
+        checkpoint: page is finished, continue with the next one
+
+        :page: finished page (int)
+
+        """
+        self.state["page"] = page + 1
+        self.done = set()
+        self.save()
+
+    def complete(self):
+        """
+
+        record a finished run; the next one starts at first_page
+
+        """
+        self.state["status"] = "complete"
+        self.state["page"] = self.first_page
+        self.state["completed"] = datetime.now().isoformat()
+        self.done = set()
+        self.save()
+
+    def save(self):
+        self.state["done"] = sorted(self.done)
+        self.state["updated"] = datetime.now().isoformat()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class KnownPages:
+
+    """
+
+    Stop rule of the incremental crawl
+
+    results are sorted newest first, so after n consecutive pages
+    without a single new listing everything older is known as well
+
+    """
+
+    def __init__(self, n=2):
+        """
+
+        :n: consecutive all-known pages before stopping;
+            0 crawls all pages (int)
+
+        """
+        self.n = n
+        self.count = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+
+        :config: ConfigParser of cfg.ini; [CRAWL] known_pages is n
+
+        """
+        return cls(config.getint("CRAWL", "known_pages", fallback=2))
+
+    def update(self, new_listings):
+        """
+
+        :new_listings: number of new listings on the current page (int)
+        :returns: True if the crawl should stop (bool)
+
+        """
+        if new_listings:
+            self.count = 0
+        else:
+            self.count += 1
+
+        return bool(self.n) and self.count >= self.n
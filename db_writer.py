@@ -0,0 +1,160 @@
+import io
+import re
+
+from datetime import date, datetime
+from psycopg2.extras import Json, execute_values
+
+# INSERT INTO schema.table (col, ...) VALUES (%s, ...)
+# [ON CONFLICT ...];
+insert_re = re.compile(
+    r"INSERT\s+INTO\s+([\w.]+)\s*\((.*?)\)\s*VALUES\s*(\(.*?\))"
+    r"\s*(ON\s+CONFLICT\b.*?)?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+named_param_re = re.compile(r"%\((\w+)\)s")
+
+
+class BulkWriter:
+
+    """
+
+    Buffered writer for INSERT statements
+
+    rows are collected per statement and written in one transaction
+    on flush: with execute_values for small batches and
+    COPY ... FROM STDIN for large ones.
+
+    the statements and params the scrapers already use are accepted
+    unchanged: positional (%s + list/tuple) and named (%(name)s + dict).
+    an ON CONFLICT clause is kept; COPY has no conflict handling, so
+    those rows are copied into a temporary staging table and moved
+    with INSERT ... SELECT ... ON CONFLICT
+
+    """
+
+    def __init__(self, conn, copy_threshold=1000):
+        """
+
+        :conn: psycopg2 connection
+        :copy_threshold: batches with at least this many rows use COPY (int)
+
+        """
+        self.conn = conn
+        self.copy_threshold = copy_threshold
+        # sql string -> rows; dicts keep insertion order, so
+        # inserate are written before their images (foreign key)
+        self.buffer = {}
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.buffer.values())
+
+    def add(self, sql, params):
+        """
+
+        buffer one row
+
+        :sql: INSERT statement with one VALUES tuple (string)
+        :params: params for sql (list, tuple or dict)
+
+        """
+        self.buffer.setdefault(sql, []).append(params)
+
+    def flush(self):
+        """
+
+        write all buffered rows in one transaction
+
+        :returns: number of written rows (int)
+
+        """
+        if not self.buffer:
+            return 0
+
+        n = len(self)
+        autocommit = self.conn.autocommit
+        self.conn.autocommit = False
+        try:
+            with self.conn.cursor() as cur:
+                for sql, rows in self.buffer.items():
+                    if len(rows) >= self.copy_threshold:
+                        self._copy(cur, sql, rows)
+                    else:
+                        self._execute_values(cur, sql, rows)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.conn.autocommit = autocommit
+        self.buffer = {}
+
+        return n
+
+    def _split(self, sql):
+        match = insert_re.match(sql.strip())
+        assert match, f"Unsupported statement for BulkWriter: {sql}"
+        table, columns, template, on_conflict = match.groups()
+        columns = [x.strip() for x in columns.split(",")]
+
+        return table, columns, template, on_conflict or ""
+
+    def _execute_values(self, cur, sql, rows):
+        table, columns, template, on_conflict = self._split(sql)
+        execute_values(
+            cur,
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s "
+            + on_conflict,
+            rows,
+            template=template,
+            page_size=len(rows)
+        )
+
+    def _copy(self, cur, sql, rows):
+        table, columns, template, on_conflict = self._split(sql)
+        names = named_param_re.findall(template)
+        f = io.StringIO()
+        for row in rows:
+            # dicts are ordered by the named params of the template
+            values = [row[x] for x in names] if names else row
+            f.write(",".join(self._csv_value(x) for x in values) + "\n")
+        f.seek(0)
+        columns = ", ".join(columns)
+        target = table
+        if on_conflict:
+            target = "bulk_writer_staging"
+            cur.execute(
+                f"CREATE TEMP TABLE {target} "
+                f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+        cur.copy_expert(
+            f"COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv)", f
+        )
+        if on_conflict:
+            cur.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"SELECT {columns} FROM {target} {on_conflict}"
+            )
+            cur.execute(f"DROP TABLE {target}")
+
+    @staticmethod
+    def _csv_value(value):
+        """
+
+        format value as csv field for COPY;
+        unquoted empty field is NULL, everything else is quoted
+
+        """
+        if value is None:
+            return ""
+        if isinstance(value, Json):
+            value = value.dumps(value.adapted)
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            value = "\\x" + bytes(value).hex()
+        elif isinstance(value, bool):
+            value = "t" if value else "f"
+        elif isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        else:
+            value = str(value)
+
+        return '"' + value.replace('"', '""') + '"'
@@ -0,0 +1,41 @@
+from bs4 import BeautifulSoup
+
+
+class DetailPage:
+
+    """
+
+    wg-gesucht detail page of one inserat
+
+    all panel headlines ("Angaben zum Objekt", "WG-Details",
+    "Verfügbarkeit", "Adresse", ...) are indexed in one traversal,
+    so field extractors do not walk the page again for every panel
+
+    """
+
+    panel_class = "headline headline-detailed-view-panel-title"
+
+    def __init__(self, page):
+        """
+
+        :page: html (string or bytes) or BeautifulSoup object
+
+        """
+        if isinstance(page, BeautifulSoup):
+            self.soup = page
+        else:
+            self.soup = BeautifulSoup(page, "lxml")
+        # headline text -> h3 element; first one wins
+        self.panels = {}
+        for h3 in self.soup.find_all("h3", class_=self.panel_class):
+            self.panels.setdefault(h3.text.strip(), h3)
+
+    def panel(self, title):
+        """
+
+        :title: text of panel headline (string)
+        :returns: h3 element of panel
+        :raises: KeyError if the page has no such panel
+
+        """
+        return self.panels[title]
@@ -0,0 +1,95 @@
+import json
+import time
+import sqlite3
+
+
+class GeocodeCache:
+
+    """
+
+    Persistent cache for geocoding (nominatim) responses
+
+    stored in a local SQLite file, keyed on the normalized query string.
+    Queries without result are cached as well (negative caching),
+    with their own, shorter ttl.
+
+    """
+
+    create_sql = """
+        CREATE TABLE IF NOT EXISTS geocode (
+            query TEXT PRIMARY KEY,
+            response TEXT,
+            fetched REAL NOT NULL
+        );
+        """
+
+    select_sql = """
+        SELECT response, fetched FROM geocode WHERE query = ?;
+        """
+
+    upsert_sql = """
+        INSERT OR REPLACE INTO geocode (query, response, fetched)
+        VALUES (?, ?, ?);
+        """
+
+    def __init__(self, path, ttl=90 * 86400, negative_ttl=7 * 86400):
+        """
+
+        :path: sqlite file (string)
+        :ttl: seconds a result stays valid (int)
+        :negative_ttl: seconds a "no result" stays valid (int)
+
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(self.create_sql)
+        self.conn.commit()
+
+    @staticmethod
+    def normalize(query):
+        """
+
+        "Augsburg+Hauptstraße  5" -> "augsburg hauptstraße 5"
+
+        :query: query string (string)
+        :returns: cache key (string)
+
+        """
+        return " ".join(query.replace("+", " ").lower().split())
+
+    def get(self, query):
+        """
+
+        :query: query string (string)
+        :returns: (hit, response); response is None for cached "no result"
+
+        """
+        row = self.conn.execute(
+            self.select_sql, (self.normalize(query),)
+        ).fetchone()
+        if row is None:
+            return False, None
+        response, fetched = row
+        ttl = self.ttl if response is not None else self.negative_ttl
+        if time.time() - fetched > ttl:
+            return False, None
+
+        return True, None if response is None else json.loads(response)
+
+    def set(self, query, response):
+        """
+
+        :query: query string (string)
+        :response: json serializable response; None for "no result"
+
+        """
+        self.conn.execute(self.upsert_sql, (
+            self.normalize(query),
+            None if response is None else json.dumps(response),
+            time.time()
+        ))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
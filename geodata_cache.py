@@ -0,0 +1,60 @@
+import os
+import pickle
+
+# path of script
+script_path = os.path.dirname(os.path.realpath(__file__))
+cache_dir = os.path.join(script_path, ".geodata_cache")
+
+# process-wide cache: name -> (mtimes, GeoDataFrame)
+_cache = {}
+
+
+def _mtimes(paths):
+    return {p: os.path.getmtime(p) for p in paths}
+
+
+def read_geodata(name, paths):
+    """
+
+    GeoDataFrame of all files in paths (concatenated)
+
+    cached per process and as pickle in .geodata_cache/<name>.pickle;
+    both are invalidated if the mtime of any source file changes
+
+    :name: cache name (string)
+    :paths: geojson/shapefile paths (list of strings)
+    :returns: GeoDataFrame
+
+    """
+    paths = sorted(paths)
+    mtimes = _mtimes(paths)
+
+    if name in _cache and _cache[name][0] == mtimes:
+        return _cache[name][1]
+
+    cache_path = os.path.join(cache_dir, name + ".pickle")
+    try:
+        with open(cache_path, "rb") as f:
+            cached_mtimes, gdf = pickle.load(f)
+        if cached_mtimes != mtimes:
+            gdf = None
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        gdf = None
+
+    if gdf is None:
+        # geopandas only needed to (re)build the cache
+        import geopandas as gpd
+        import pandas as pd
+
+        gdf = gpd.GeoDataFrame(
+            pd.concat([gpd.read_file(p) for p in paths])
+        )
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((mtimes, gdf), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+
+    _cache[name] = (mtimes, gdf)
+
+    return gdf
@@ -0,0 +1,153 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+# path of script
+script_path = os.path.dirname(os.path.realpath(__file__))
+
+
+class HttpCache:
+
+    """
+
+    Validators of fetched pages for conditional GETs
+
+    stored in a local SQLite file, keyed on the url: ETag,
+    Last-Modified and the sha256 of the body. The next GET sends
+    If-None-Match / If-Modified-Since; a 304 or a body with the same
+    hash means the page is unchanged and needs no parsing.
+
+    a page is only stored once its processing is finished (set), so
+    an interrupted run never skips a page it did not process
+
+    """
+
+    create_sql = """
+        CREATE TABLE IF NOT EXISTS http_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body_hash TEXT NOT NULL,
+            fetched REAL NOT NULL
+        );
+        """
+
+    select_sql = """
+        SELECT etag, last_modified, body_hash, fetched
+        FROM http_cache WHERE url = ?;
+        """
+
+    upsert_sql = """
+        INSERT OR REPLACE INTO http_cache
+            (url, etag, last_modified, body_hash, fetched)
+        VALUES (?, ?, ?, ?, ?);
+        """
+
+    def __init__(self, path, ttl=7 * 86400):
+        """
+
+        :path: sqlite file (string)
+        :ttl: seconds after which a page is treated as changed, so it
+              is parsed again at least that often (int)
+
+        """
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(self.create_sql)
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+
+        :config: ConfigParser of cfg.ini; [HTTP_CACHE] path is the
+                 sqlite file, default http_cache.sqlite next to the
+                 scripts; ttl_days the ttl
+
+        """
+        return cls(
+            config.get(
+                "HTTP_CACHE", "path",
+                fallback=script_path + "/http_cache.sqlite"
+            ),
+            ttl=config.getfloat("HTTP_CACHE", "ttl_days", fallback=7) * 86400
+        )
+
+    @staticmethod
+    def body_hash(body):
+        return hashlib.sha256(body).hexdigest()
+
+    def _row(self, url):
+        row = self.conn.execute(self.select_sql, (url,)).fetchone()
+        if row is None or time.time() - row[3] > self.ttl:
+            return None
+
+        return row
+
+    def headers(self, url):
+        """
+
+        :url: page url (string)
+        :returns: conditional request headers for url (dict)
+
+        """
+        row = self._row(url)
+        if row is None:
+            return {}
+        etag, last_modified, _, _ = row
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        return headers
+
+    def unchanged(self, url, r):
+        """
+
+        :url: page url (string)
+        :r: requests Response of the conditional GET
+        :returns: True for a 304 or the stored body (bool)
+
+        """
+        if r.status_code == 304:
+            unchanged = True
+        else:
+            row = self._row(url)
+            unchanged = (
+                row is not None and row[2] == self.body_hash(r.content)
+            )
+        if unchanged:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        return unchanged
+
+    def set(self, url, r):
+        """
+
+        store the validators of a processed page
+
+        :url: page url (string)
+        :r: requests Response with status 200
+
+        """
+        self.conn.execute(self.upsert_sql, (
+            url,
+            r.headers.get("ETag"),
+            r.headers.get("Last-Modified"),
+            self.body_hash(r.content),
+            time.time()
+        ))
+        self.conn.commit()
+
+    def summary(self):
+        return f"http cache: {self.hits} unchanged, {self.misses} changed"
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,256 @@
+import time
+import requests
+
+from bs4 import BeautifulSoup
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+from collections import defaultdict
+from urllib3.util.retry import Retry
+from requests.adapters import HTTPAdapter
+from requests.exceptions import TooManyRedirects
+
+# urllib3 only decodes brotli if one of the brotli packages is installed
+try:
+    import brotli  # noqa: F401
+    accept_encoding = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        accept_encoding = "gzip, deflate, br"
+    except ImportError:
+        accept_encoding = "gzip, deflate"
+
+
+def retry_after(r):
+    """
+
+    :r: requests Response
+    :returns: seconds of its Retry-After header or None (float)
+
+    """
+    value = r.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # http date
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+
+    """
+
+    Shared HTTP client for all scrapers
+
+    one requests Session with a keep-alive connection pool per host,
+    default timeouts, retries with backoff on 429/5xx and
+    per-host request/latency/bytes counters
+
+    with a RateLimiter every request waits for its slot and reports
+    back; 429s and captchas then slow the host down and are retried
+    after its cooldown instead of failing the run
+
+    """
+
+    retry_status = (429, 500, 502, 503, 504)
+
+    def __init__(self, headers=None, timeout=(10, 30), retries=3,
+                 backoff_factor=1, pool_size=10, stop_url=None,
+                 archive=None, rate_limiter=None, captcha_retries=1):
+        """
+
+        :headers: default headers for every request (dict)
+        :timeout: (connect, read) timeout in seconds (tuple)
+        :retries: retries on connection errors and retry_status (int)
+        :backoff_factor: sleep backoff_factor * 2 ** (retry - 1) seconds
+                         between retries; Retry-After is respected (float)
+        :pool_size: keep-alive connections kept per host (int)
+        :stop_url: a redirect to this url raises TooManyRedirects,
+                   e.g. wg-gesucht captcha (string)
+        :archive: PageArchive; every fetched html page is stored there
+        :rate_limiter: RateLimiter; paces the requests per host
+        :captcha_retries: retries after a captcha cooldown before
+                          TooManyRedirects is raised; needs a
+                          rate_limiter (int)
+
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.stop_url = stop_url
+        self.archive = archive
+        self.rate_limiter = rate_limiter
+        self.captcha_retries = captcha_retries
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        # never announce an encoding we are not able to decode
+        self.session.headers["Accept-Encoding"] = accept_encoding
+        # the rate limiter has to see the 429s, so they are retried here;
+        # urllib3 would otherwise still retry a 429 with Retry-After
+        retry_status = self.retry_status
+        if rate_limiter is not None:
+            retry_status = [x for x in retry_status if x != 429]
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=retry_status,
+            respect_retry_after_header=rate_limiter is None,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # host -> {"requests": ..., "bytes": ..., "seconds": ...}
+        self.stats = defaultdict(
+            lambda: {"requests": 0, "bytes": 0, "seconds": 0.0}
+        )
+
+    def get(self, url, **kwargs):
+        """
+
+        HTTP GET url over the pooled session and validate
+
+        :url: the url to get (string)
+        :kwargs: passed on to requests.Session.get
+        :returns: requests Response object
+
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        host_stats = self.stats[host]
+        limiter = self.rate_limiter
+        throttled = 0
+        captchas = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire(host)
+            start = time.perf_counter()
+            try:
+                r = self.session.get(url, **kwargs)
+            except requests.ConnectionError as e:
+                print(url + " probably offline!")
+                raise e
+            finally:
+                latency = time.perf_counter() - start
+                host_stats["requests"] += 1
+                host_stats["seconds"] += latency
+
+            # streamed bodies are counted by the consumer
+            if not kwargs.get("stream"):
+                host_stats["bytes"] += len(r.content)
+
+            # check if captcha
+            if self.stop_url and self.stop_url in r.url:
+                if limiter is None or captchas >= self.captcha_retries:
+                    raise TooManyRedirects("Captcha appeared! Exit")
+                captchas += 1
+                limiter.captcha(host)
+                print(
+                    f"Captcha appeared! {host} paused for "
+                    f"{limiter.captcha_cooldown:.0f}s"
+                )
+                r.close()
+                continue
+
+            if (r.status_code == 429 and limiter is not None
+                    and throttled < self.retries):
+                throttled += 1
+                limiter.throttled(host, retry_after(r))
+                r.close()
+                continue
+
+            break
+
+        # 304 is a valid answer to a conditional GET (get_if_changed)
+        headers = kwargs.get("headers") or {}
+        not_modified = r.status_code == 304 and (
+            "If-None-Match" in headers or "If-Modified-Since" in headers
+        )
+        if not_modified:
+            if limiter is not None:
+                limiter.success(host, latency)
+            return r
+
+        if r.status_code == 200:
+            if limiter is not None:
+                limiter.success(host, latency)
+            content_type = r.headers.get("Content-Type", "")
+            if (self.archive is not None and not kwargs.get("stream")
+                    and "text/html" in content_type):
+                self.archive.add(url, r.content, r.status_code, content_type)
+            return r
+        else:
+            raise requests.HTTPError(
+                f"Request failed with status_code {r.status_code}",
+                response=r
+            )
+
+    def get_if_changed(self, url, cache, **kwargs):
+        """
+
+        conditional GET with the validators stored in cache
+
+        :url: the url to get (string)
+        :cache: HttpCache
+        :kwargs: passed on to requests.Session.get
+        :returns: (requests Response, changed); changed is False for a
+                  304 or a body identical to the cached one
+
+        """
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.update(cache.headers(url))
+        r = self.get(url, headers=headers, **kwargs)
+
+        return r, not cache.unchanged(url, r)
+
+    def get_to_soup(self, url, **kwargs):
+        """
+
+        HTTP GET url and transform text-content to BeautifulSoup object
+
+        :url: http-string (string)
+        :returns: BeautifulSoup object
+
+        """
+        r = self.get(url, **kwargs)
+        # only allow content type "text/html"
+        if "text/html" in r.headers["Content-Type"]:
+            return BeautifulSoup(r.text, "lxml")
+
+        else:
+            print(f"Expected Content Type text/html, but got \
+                  {r.headers['Content-Type']} instead")
+            raise TypeError
+
+    def stats_summary(self):
+        """
+
+        :returns: one line per host with requests, bytes and latency (string)
+
+        """
+        lines = []
+        for host, s in self.stats.items():
+            avg = s["seconds"] / s["requests"] if s["requests"] else 0
+            lines.append(
+                f"{host}: {s['requests']} requests, "
+                f"{s['bytes'] / 1024:.0f} KiB, {avg * 1000:.0f} ms avg"
+            )
+        if self.rate_limiter is not None and self.rate_limiter.buckets:
+            lines.append(self.rate_limiter.summary())
+
+        return "\n".join(lines)
+
+    def close(self):
+        self.session.close()
+        if self.archive is not None:
+            self.archive.close()
@@ -0,0 +1,151 @@
+import io
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+from image_store import ImageStore
+
+# Pillow is optional; without it images are stored as downloaded
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+defaults = {
+    "thumbnail": 320,
+    "max_size": 1600,
+    "format": "webp",
+    "quality": 80,
+    "keep_original": False
+}
+
+
+def encode_image(root, image_hash, options):
+    """
+
+    write thumbnail and size-capped variant of a stored image;
+    runs in a worker thread
+
+    :root: directory of the ImageStore (string)
+    :image_hash: sha256 hex digest of the original (string)
+    :options: see defaults (dict)
+
+    :returns: dict variant -> size in bytes; None if the original
+              is no readable image (it is kept then)
+
+    """
+    store = ImageStore(root)
+    fmt = options["format"].upper()
+    try:
+        with Image.open(store.path(image_hash)) as img:
+            img = ImageOps.exif_transpose(img)
+            # jpeg has no alpha channel
+            mode = "RGB" if fmt == "JPEG" else "RGBA"
+            if img.mode not in ("RGB", "L", mode):
+                img = img.convert(mode)
+
+            sizes = {}
+            for variant, max_size in (
+                ("display", options["max_size"]),
+                ("thumb", options["thumbnail"])
+            ):
+                aux = img.copy()
+                # only shrinks, keeps aspect ratio
+                aux.thumbnail((max_size, max_size))
+                buf = io.BytesIO()
+                aux.save(buf, format=fmt, quality=options["quality"])
+                store.put_variant(image_hash, variant, buf.getvalue())
+                sizes[variant] = buf.tell()
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Image {image_hash} not encoded: {e}")
+        return None
+
+    if not options["keep_original"]:
+        os.remove(store.path(image_hash))
+
+    return sizes
+
+
+class ImageEncoder:
+
+    """
+
+    Optional re-encode stage for downloaded images
+
+    every new image gets a thumbnail and a re-encoded (WebP/JPEG)
+    variant capped to max_size; encoding runs in a bounded thread
+    pool. the original is only kept with keep_original
+
+    threads, not processes: Pillow releases the GIL while it decodes,
+    resizes and encodes, so they run in parallel. a forked pool would
+    be started from the download threads (risk of inheriting a held
+    lock), and spawn/forkserver children re-run the scraper scripts,
+    which have no __main__ guard
+
+    """
+
+    def __init__(self, store, max_workers=2, **options):
+        """
+
+        :store: ImageStore
+        :max_workers: encoding threads (int)
+        :options: thumbnail, max_size (px), format ("webp"/"jpeg"),
+                  quality, keep_original; see defaults
+
+        """
+        self.store = store
+        self.options = dict(defaults, **options)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    @classmethod
+    def from_config(cls, config, source, store):
+        """
+
+        encoder for source if cfg.ini has a section [IMAGES_<SOURCE>],
+        e.g. [IMAGES_SPK] with thumbnail, max_size, format, quality
+        and keep_original; [IMAGES] encode_workers sizes the pool
+
+        :config: ConfigParser of cfg.ini
+        :source: e.g. "wg_gesucht", "immoscout", "spk" (string)
+        :store: ImageStore
+
+        :returns: ImageEncoder; None if not configured or Pillow is
+                  not installed
+
+        """
+        section = "IMAGES_" + source.upper()
+        if not config.has_section(section):
+            return None
+        if Image is None:
+            print(f"[{section}] ignored: Pillow is not installed")
+            return None
+
+        s = config[section]
+        return cls(
+            store,
+            max_workers=config.getint("IMAGES", "encode_workers", fallback=2),
+            thumbnail=s.getint("thumbnail", defaults["thumbnail"]),
+            max_size=s.getint("max_size", defaults["max_size"]),
+            format=s.get("format", defaults["format"]).lower(),
+            quality=s.getint("quality", defaults["quality"]),
+            keep_original=s.getboolean(
+                "keep_original", defaults["keep_original"]
+            )
+        )
+
+    def submit(self, image_hash):
+        """
+
+        :image_hash: sha256 hex digest of a stored original (string)
+        :returns: Future of encode_image
+
+        """
+        return self.executor.submit(
+            encode_image, self.store.root, image_hash, self.options
+        )
+
+    def encode(self, image_hash):
+        return self.submit(image_hash).result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,354 @@
+import os
+import hashlib
+import tempfile
+import threading
+
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from requests.exceptions import RequestException, TooManyRedirects
+
+# path of script
+script_path = os.path.dirname(os.path.realpath(__file__))
+
+
+class ImageStore:
+
+    """
+
+    Content-addressed image store on local disk
+
+    every image is stored once as <root>/<h[:2]>/<h[2:4]>/<h>,
+    h being the sha256 of its bytes; the DB rows keep only h.
+    re-encoded variants (see image_encoder.py) are stored beside it
+    as <h>.<variant>; the original may then be dropped
+
+    """
+
+    def __init__(self, root):
+        """
+
+        :root: directory of the store (string)
+
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+
+        :config: ConfigParser of cfg.ini; [IMAGES] store is the
+                 directory, default images/ next to the scripts
+
+        """
+        return cls(
+            config.get("IMAGES", "store", fallback=script_path + "/images")
+        )
+
+    def path(self, image_hash, variant=None):
+        path = os.path.join(
+            self.root, image_hash[:2], image_hash[2:4], image_hash
+        )
+        if variant:
+            path += "." + variant
+
+        return path
+
+    def __contains__(self, image_hash):
+        return (
+            os.path.exists(self.path(image_hash))
+            or os.path.exists(self.path(image_hash, "display"))
+        )
+
+    def get(self, image_hash, variant=None):
+        """
+
+        :image_hash: sha256 hex digest of the original (string)
+        :variant: e.g. "thumb" or "display"; None for the original,
+                  or the display variant if the original was not kept
+        :returns: image (bytes)
+
+        """
+        path = self.path(image_hash, variant)
+        if variant is None and not os.path.exists(path):
+            path = self.path(image_hash, "display")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def tmp_file(self):
+        """
+
+        :returns: open temporary file inside the store; pass its name
+                  to put_file once written
+
+        """
+        return tempfile.NamedTemporaryFile(
+            dir=self.root, suffix=".part", delete=False
+        )
+
+    def put_file(self, tmp_path, image_hash):
+        """
+
+        move a written temporary file to its place in the store
+
+        :tmp_path: file from tmp_file (string)
+        :image_hash: sha256 hex digest of its content (string)
+        :returns: False if the image was stored already (bool)
+
+        """
+        if image_hash in self:
+            os.remove(tmp_path)
+            return False
+        path = self.path(image_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+        return True
+
+    def put_variant(self, image_hash, variant, data):
+        """
+
+        :image_hash: sha256 hex digest of the original (string)
+        :variant: name of the variant, e.g. "thumb" (string)
+        :data: encoded variant (bytes)
+
+        """
+        path = self.path(image_hash, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.tmp_file() as f:
+            f.write(data)
+        os.replace(f.name, path)
+
+    def put(self, data):
+        """
+
+        :data: image (bytes)
+        :returns: sha256 hex digest of data (string)
+
+        """
+        image_hash = hashlib.sha256(data).hexdigest()
+        if image_hash not in self:
+            with self.tmp_file() as f:
+                f.write(data)
+            self.put_file(f.name, image_hash)
+
+        return image_hash
+
+
+class ImagePipeline:
+
+    """
+
+    Parallel image downloads into an ImageStore
+
+    images are streamed to disk by a pool of worker threads and hashed
+    on the way; every url is downloaded once per process (a failed
+    download again on the next submit) and every distinct image is
+    stored once
+
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, client, store, max_workers=8, encoder=None):
+        """
+
+        :client: HttpClient
+        :store: ImageStore
+        :max_workers: parallel downloads (int)
+        :encoder: ImageEncoder for new images (optional)
+
+        """
+        self.client = client
+        self.store = store
+        self.encoder = encoder
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # url -> Future of image hash
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.stats = {"downloaded": 0, "stored": 0, "failed": 0}
+
+    @classmethod
+    def from_config(cls, client, config, source):
+        """
+
+        pipeline with store and, if configured for source,
+        re-encode stage (see ImageEncoder.from_config)
+
+        :client: HttpClient
+        :config: ConfigParser of cfg.ini
+        :source: e.g. "wg_gesucht", "immoscout", "spk" (string)
+
+        """
+        from image_encoder import ImageEncoder
+
+        store = ImageStore.from_config(config)
+        return cls(
+            client, store,
+            max_workers=config.getint("IMAGES", "workers", fallback=8),
+            encoder=ImageEncoder.from_config(config, source, store)
+        )
+
+    def submit(self, url, slots=None):
+        """
+
+        start download of url in the background
+
+        :url: image url (string)
+        :slots: threading.Semaphore shared by a group of downloads,
+                e.g. one listing; blocks until a slot is free and
+                releases it when the download is done (optional)
+        :returns: Future of the image hash (string or None if the
+                  download failed)
+
+        """
+        future = self.futures.get(url)
+        if future is None:
+            if slots is not None:
+                slots.acquire()
+            future = self.executor.submit(self._download, url)
+            self.futures[url] = future
+            # a failed download is tried again on the next submit
+            future.add_done_callback(lambda f: self._forget_failed(url, f))
+            if slots is not None:
+                future.add_done_callback(lambda f: slots.release())
+
+        return future
+
+    def _forget_failed(self, url, future):
+        if not future.cancelled() and future.exception() is None \
+                and future.result() is None:
+            with self.lock:
+                if self.futures.get(url) is future:
+                    del self.futures[url]
+
+    def fetch_all(self, urls, max_concurrent=None):
+        """
+
+        :urls: image urls (list of strings); None entries are skipped
+        :max_concurrent: max. downloads of these urls at once, on top
+                         of max_workers of the whole pipeline (int)
+        :returns: dict url -> image hash (string or None)
+
+        """
+        slots = None
+        if max_concurrent:
+            slots = threading.Semaphore(max_concurrent)
+        futures = {url: self.submit(url, slots) for url in urls if url}
+
+        return {url: f.result() for url, f in futures.items()}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _download(self, url):
+        try:
+            r = self.client.get(url, stream=True)
+        except TooManyRedirects:
+            raise
+        except RequestException as e:
+            # images get deleted; missing images are not an error
+            print(f"Image {url} failed: {e}")
+            self._count("failed")
+            return None
+
+        h = hashlib.sha256()
+        size = 0
+        f = None
+        try:
+            with r, self.store.tmp_file() as f:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    h.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except Exception as e:
+            # no half written files in the store
+            if f is not None:
+                os.remove(f.name)
+            if not isinstance(e, RequestException):
+                raise
+            # connection lost while streaming the body
+            print(f"Image {url} failed: {e}")
+            self._count("failed")
+            return None
+        finally:
+            self.client.stats[urlsplit(url).netloc]["bytes"] += size
+
+        if not size:
+            os.remove(f.name)
+            self._count("failed")
+            return None
+
+        image_hash = h.hexdigest()
+        self._count("downloaded")
+        if self.store.put_file(f.name, image_hash):
+            self._count("stored")
+            if self.encoder:
+                # waits for the encoder threads; bounded by max_workers
+                self.encoder.encode(image_hash)
+
+        return image_hash
+
+    def summary(self):
+        return (
+            f"images: {self.stats['downloaded']} downloaded, "
+            f"{self.stats['stored']} new, {self.stats['failed']} failed"
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.encoder:
+            self.encoder.close()
+
+
+if __name__ == "__main__":
+    # move images stored as bytea into the store; needs sql/images_hash.sql
+    import configparser
+    import psycopg2
+
+    from psycopg2.extras import execute_values
+
+    tables = (
+        "wg_gesucht.images_inserate",
+        "immoscout.images_inserate",
+        "immoscout.images_eigentum_inserate",
+        "spk.images_inserate_json"
+    )
+
+    select_sql = """
+        SELECT ctid::text, image FROM {}
+        WHERE image IS NOT NULL AND image_hash IS NULL;
+        """
+
+    update_sql = """
+        UPDATE {} AS i
+        SET image_hash = v.image_hash, image = NULL
+        FROM (VALUES %s) AS v (row_id, image_hash)
+        WHERE i.ctid = v.row_id::tid;
+        """
+
+    config = configparser.ConfigParser()
+    config.read(script_path + "/cfg.ini")
+    conn = psycopg2.connect(
+        dbname=config["DATABASE"]["dbname"],
+        user=config["DATABASE"]["user"],
+        host=config["DATABASE"]["host"]
+    )
+    store = ImageStore.from_config(config)
+
+    for table in tables:
+        # named cursor: images are streamed, not loaded at once
+        read_cur = conn.cursor(name="images")
+        read_cur.execute(select_sql.format(table))
+        updates = [
+            (row_id, store.put(bytes(image))) for row_id, image in read_cur
+        ]
+        read_cur.close()
+        with conn.cursor() as cur:
+            execute_values(cur, update_sql.format(table), updates,
+                           page_size=1000)
+        conn.commit()
+        print(f"{table}: {len(updates)} images moved")
+
+    conn.close()
@@ -3,13 +3,25 @@ import re
 import sys
 import random
 import psycopg2
-import requests
 import configparser
 
 from bs4 import BeautifulSoup
 from datetime import datetime
-from requests.exceptions import TooManyRedirects, HTTPError
-
+from seen_ids import SeenIds
+from db_writer import BulkWriter
+from http_client import HttpClient
+from http_cache import HttpCache
+from rate_limiter import RateLimiter
+from page_archive import PageArchive
+from crawl_state import CrawlState, KnownPages
+from pipeline import Pipeline
+from image_store import ImagePipeline
+
+
+# --reparse: parse the archived pages again, without network
+reparse = "--reparse" in sys.argv
+if reparse:
+    sys.argv.remove("--reparse")
 
 assert (len(sys.argv) == 3), "Too few/many arguments"
 wtype = sys.argv[1]
@@ -47,10 +59,16 @@ if wtype == "1":
     inserat_select_sql = """
         SELECT inserat_id FROM immoscout.inserate_eigentum;
         """
+    inserat_exists_sql = """
+        SELECT 1 FROM immoscout.inserate_eigentum WHERE inserat_id = %s;
+        """
 else:
     inserat_select_sql = """
         SELECT inserat_id FROM immoscout.inserate;
         """
+    inserat_exists_sql = """
+        SELECT 1 FROM immoscout.inserate WHERE inserat_id = %s;
+        """
 
 inserat_eigentum_insert_sql = """
     INSERT INTO immoscout.inserate_eigentum(
@@ -76,7 +94,8 @@ inserat_eigentum_insert_sql = """
     %(energieausweis)s,%(energieausweis_art)s,%(energieeffizienzklasse)s,
     %(baujahr_gebaeude)s,%(zimmer_anzahl)s,%(schlafzimmer)s,%(wohnflaeche)s,
     %(nutzflaeche)s,%(schufa_auskunft)s,%(online_besichtigung)s,%(such_str)s,
-    %(hausgeld)s,%(wg_geeignet)s,%(ferienwohnung_geeignet)s);
+    %(hausgeld)s,%(wg_geeignet)s,%(ferienwohnung_geeignet)s)
+    ON CONFLICT DO NOTHING;
     """
 
 inserat_insert_sql = """
@@ -102,19 +121,22 @@ inserat_insert_sql = """
     %(heizungsart)s,%(energieausweis)s,%(energieausweis_art)s,
     %(energieeffizienzklasse)s,%(baujahr_gebaeude)s,
     %(zimmer_anzahl)s,%(schlafzimmer)s,%(wohnflaeche)s,%(nutzflaeche)s,
-    %(schufa_auskunft)s,%(online_besichtigung)s,%(such_str)s);
+    %(schufa_auskunft)s,%(online_besichtigung)s,%(such_str)s)
+    ON CONFLICT DO NOTHING;
     """
 
 images_eigentum_insert_sql = """
     INSERT INTO immoscout.images_eigentum_inserate(
-    image, id)
+    image_hash, id)
     VALUES (%s, %s)
+    ON CONFLICT DO NOTHING;
     """
 
 images_insert_sql = """
     INSERT INTO immoscout.images_inserate(
-    image, id)
+    image_hash, id)
     VALUES (%s, %s)
+    ON CONFLICT DO NOTHING;
     """
 
 haustier_d = {
@@ -231,6 +253,227 @@ energietraeger_d = {
     "KWK bio": 26
 }
 
+# regex to extract floats
+# https://stackoverflow.com/questions/4703390/how-to-extract-a-floating-number-from-a-string
+float_re = re.compile(r"\d*\.*\d+")
+date_re = re.compile(r"\d{2,4}?[/.,-]\d{2}[/.,-]\d{2,4}")
+sofort_re = re.compile(r"[sS].+t|[vV]ereinbarung")
+
+# marks fields without default; a missing label is an error
+required = object()
+
+
+def floater(a):
+    # string in korrekte floats formatieren
+    # 1.382,75 -> 1382.75
+    return a.replace(".", "").replace(",", ".")
+
+
+def first_float(s):
+    """
+
+    :s: criteria text (string)
+    :returns: first number in s (string)
+    :raises: IndexError if s contains no number
+
+    """
+    match = float_re.search(floater(s))
+    if match is None:
+        raise IndexError(f"Keine Zahl in {s!r}")
+
+    return match.group()
+
+
+def parse_etage(e_item):
+    # wenn Etagen Gesamtzahl angegeben wird dan "1 von 3"
+    if "von" in e_item:
+        etage_split = e_item.split("von")
+        etage = [x for x in etage_split[0] if x.isdigit()][0]
+        return etage, etage_split[1].strip()
+
+    return e_item.split("Etage")[1].strip(), None
+
+
+def parse_frei_ab(f_item):
+    date_str = f_item.split("Bezugsfrei ab")[1].strip()
+    if sofort_re.search(date_str):
+        return datetime.now().date()
+    date_str = date_re.search(date_str)
+    if date_str:
+        return get_date(date_str.group())
+
+    return datetime.now().date()
+
+
+def parse_garage(garage_item):
+    garage_item = garage_item.strip()
+    # Anzahl an Garagenplätzen ist optional
+    cnt = float_re.search(garage_item)
+    return garage_d[garage_item.split()[-1]], cnt.group() if cnt else None
+
+
+def parse_provision(provision):
+    if any([x in provision.lower() for x in ("nein", "ohne")]):
+        return None
+
+    return first_float(provision)
+
+
+def parse_baujahr(baujahr_item):
+    baujahr_item = baujahr_item.split()[1]
+    if "unbekannt" in baujahr_item:
+        return None
+
+    return int(baujahr_item)
+
+
+def parse_energietraeger(energietraeger_item):
+    energietraeger_item = " ".join(energietraeger_item.split()[2:])
+    # nur das erste Item wird als primärer Energieträger gezählt
+    return energietraeger_d[energietraeger_item.split(",")[0]]
+
+
+# field tables: (label, field(s), parser, default)
+# the criteria item containing label is passed to parser; parsers
+# returning several values name their fields as tuple.
+# default is used if the label is missing or parser raises IndexError
+details_fields = (
+    ("Bonitätsauskunft", "schufa_auskunft",
+     lambda x: "erforderlich" in x, False),
+    ("Typ", "wohnungs_type",
+     lambda x: wohnungs_type_d[x.split("Typ")[1].strip()], None),
+    (" Etage ", ("etage", "etage_all"), parse_etage, (None, None)),
+    ("Wohnfläche", "wohnflaeche", first_float, required),
+    ("Nutzfläche", "nutzflaeche", first_float, None),
+    ("Bezugsfrei", "frei_ab", parse_frei_ab, None),
+    ("Schlafzimmer", "schlafzimmer", first_float, None),
+    ("Badezimmer", "badezimmer", first_float, None),
+    ("Zimmer", "zimmer_anzahl", first_float, required),
+    # 0 = keine Angabe
+    ("Haustier", "haustiere", lambda x: haustier_d[x.strip()], 0),
+    ("Garage", ("garage_stellplatz", "garage_stellplatz_cnt"),
+     parse_garage, (0, None))
+)
+
+# bei Eigentum nach "Kaufpreis" suchen, bei Miete nach "Kaltmiete"
+kosten_fields = {
+    "1": (
+        ("Kaufpreis", "kaufpreis", lambda x: float(first_float(x)), required),
+        ("Provision", "provision", parse_provision, None),
+        ("Hausgeld", "hausgeld", first_float, None),
+        ("Garage", "kosten_stellplatz", first_float, None),
+        ("mieteinnahmen", "mieteinnahmen", first_float, None)
+    ),
+    "0": (
+        ("Kaltmiete", "miete_kalt", first_float, required),
+        ("Nebenkosten", "nebenkosten", first_float, None),
+        ("Heizkosten", "miete_heizkosten", first_float, None),
+        ("Kaution", "kaution", first_float, None),
+        ("Miete für Garage", "kosten_stellplatz", first_float, None),
+        ("Gesamtmiete", "miete_gesamt", first_float, None)
+    )
+}
+
+bausubstanz_fields = (
+    ("Baujahr", "baujahr_gebaeude", parse_baujahr, None),
+    ("Modernisierung", "modernisierung_jahr",
+     lambda x: int(x.split("zuletzt")[1]), None),
+    ("Objektzustand", "zustand",
+     lambda x: zustand_d[x.split("Objektzustand")[1].strip()], 1),
+    ("Ausstattung", "ausstattung_qualitaet",
+     lambda x: ausstattung_qualitaet_d[x.split("Ausstattung")[1].strip()], 1),
+    ("Heizungsart", "heizungsart", lambda x: heizungsart_d[x.split()[1]], 1),
+    ("Energieträger", "energietraeger", parse_energietraeger, 1),
+    ("Energieausweis ", "energieausweis", lambda x: energieausweis_d[x], None),
+    ("Energieausweistyp", "energieausweis_art",
+     lambda x: energieausweisart_d[x], None),
+    ("Energieeffizienzklasse", "energieeffizienzklasse",
+     lambda x: x.split("Energieeffizienzklasse")[1].strip(), None)
+)
+
+# Ausstattung: item text -> field; True if listed
+ausstattung_fields = {
+    "Online-Besichtigung möglich": "online_besichtigung",
+    "Einbauküche": "einbaukueche",
+    "Balkon/ Terrasse": "balkon_terrasse",
+    "Keller": "keller",
+    "Personenaufzug": "aufzug",
+    "Gäste-WC": "gaeste_wc",
+    "Garten/ -mitbenutzung": "garten",
+    "WG-geeignet": "wg_geeignet",
+    "Stufenloser Zugang": "barrierefrei",
+    "Wohnberechtigungsschein erforderlich": "wbs",
+    "Als Ferienwohnung geeignet": "ferienwohnung_geeignet"
+}
+
+# "Vermietet" wird mit den Kosten ausgewertet, "Provisionsfrei" ist
+# durch "Kosten" abgedeckt
+ausstattung_other = ("Vermietet", "Provisionsfrei")
+
+
+def index_criteria(items, fields, exclusive=False):
+    """
+
+    single pass over the criteria items of one block
+
+    every item is compared to the labels once; an item is assigned to
+    every label it contains that has no item yet, with exclusive only
+    to the first of them (in field order)
+
+    :items: criteria texts (list of strings)
+    :fields: field table
+    :exclusive: assign every item to at most one label (bool)
+
+    :returns: (dict label -> item, list of unassigned items)
+
+    """
+    found = {}
+    rest = []
+    for item in items:
+        assigned = False
+        for label, *_ in fields:
+            if label in item and label not in found:
+                found[label] = item
+                assigned = True
+                if exclusive:
+                    break
+        if not assigned:
+            rest.append(item)
+
+    return found, rest
+
+
+def parse_fields(found, fields):
+    """
+
+    apply field table to indexed criteria
+
+    :found: dict label -> item (see index_criteria)
+    :fields: field table
+    :returns: dict field -> value
+
+    """
+    ret_d = {}
+    for label, field, parser, default in fields:
+        if label in found:
+            try:
+                value = parser(found[label])
+            except IndexError:
+                if default is required:
+                    raise
+                value = default
+        elif default is required:
+            raise KeyError(f"Pflichtangabe fehlt: {label}")
+        else:
+            value = default
+
+        if isinstance(field, tuple):
+            ret_d.update(zip(field, value))
+        else:
+            ret_d[field] = value
+
+    return ret_d
+
 # headers
 headers = {
     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
@@ -247,46 +490,32 @@ user_agent_l = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36',
 ]
 
-def http_get(url):
-    #user_agent = random.choice(user_agent_l)
-    #headers["User-Agent"] = user_agent
-    #print(user_agent)
-    try:
-        r = requests.get(url, headers=headers)
-        if r.status_code == 200:
-            return r
-        else:
-            raise requests.HTTPError(
-                f"Request failed with status_code {r.status_code}"
-            )
-    except requests.ConnectionError as e:
-        print(url + " probably offline!")
-        raise e
-
-def http_get_to_soup(url):
-    r = http_get(url)
-    # only allow content type "text/html"
-    if "text/html" in r.headers["Content-Type"]:
-        return BeautifulSoup(r.text, "lxml")
-
-    else:
-        print(f"Expected Content Type text/html, but got \
-              {r.headers['Content-Type']} instead")
-        raise TypeError
-
-def get_image(soup):
+# shared, pooled http client
+#user_agent = random.choice(user_agent_l)
+#headers["User-Agent"] = user_agent
+# every fetched page is archived for --reparse
+archive = PageArchive.from_config(config, "immoscout")
+# paced by the adaptive rate limiter
+rate_limiter = RateLimiter.from_config(
+    config, "immoscout", hosts=["www.immobilienscout24.de"]
+)
+client = HttpClient(
+    headers=headers, archive=archive, rate_limiter=rate_limiter
+)
+http_get = client.get
+http_get_to_soup = client.get_to_soup
+# results pages are fetched conditionally; unchanged ones are not parsed
+http_cache = HttpCache.from_config(config)
+# images are downloaded in the background into the content-addressed store
+images = ImagePipeline.from_config(client, config, "immoscout")
+
+def get_image_url(soup):
     gallery_box =  soup.find("div", "is24-expose-gallery-box")
     child = [x for x in list(gallery_box.children) if x != " "][0]
     if "no-header-gallery-image" in child.get("class"):
-        img_raw = None
-    else:
-        img_url = child.find("img").get("src")
-        try:
-            img_raw = http_get(img_url).content
-        except HTTPError:
-            img_raw = None
+        return None
 
-    return img_raw
+    return child.find("img").get("src")
 
 def get_date(date_s):
     date_s = date_s.replace(",", ".")
@@ -302,15 +531,7 @@ def get_date(date_s):
     print(f"Unbekanntes Date Format: {date_s}")
     sys.exit(0)
 
-def parse_expose(soup):
-
-    # regex string to extract floats
-    # https://stackoverflow.com/questions/4703390/how-to-extract-a-floating-number-from-a-string
-    reg = r"\d*\.*\d+"
-
-    # string in korrekte floats formatieren
-    # 1.382,75 -> 1382.75
-    floater = lambda a : a.replace(".", "").replace(",", ".")
+def parse_expose(soup, data_id):
 
     # Titel
     titel = soup.find("h1", id="expose-title").text
@@ -336,6 +557,15 @@ def parse_expose(soup):
         )
         adress_str = adress_combed.replace(",", "")
 
+    ret_d = {
+        "data_id": data_id,
+        "titel": titel,
+        "plz": plz,
+        "adress_str": adress_str,
+        "verfuegbar": True,
+        "such_str": city
+    }
+
     #################### Details #########################################
     details = soup.find_all(
         "div", class_="criteriagroup criteria-group--two-columns")[0]
@@ -345,227 +575,39 @@ def parse_expose(soup):
     exc_strs = (" Internet  Verfügbarkeit prüfen  ")
     details_l = [x for x in details_l if x not in exc_strs]
 
-    # Bonitätsauskunft erforderlich?
-    try:
-        bon_item = [x for x in details_l if "Bonitätsauskunft" in x][0]
-        bon_type_ix = details_l.index(bon_item)
-        schufa_auskunft = "erforderlich" in details_l.pop(bon_type_ix)
-    except IndexError:
-        schufa_auskunft = False
-
-    # wohnungs_type
-    try:
-        w_item = [x for x in details_l if "Typ" in x][0]
-        w_type_ix = details_l.index(w_item)
-        wohnungs_type = details_l.pop(w_type_ix).split("Typ")[1].strip()
-        wohnungs_type = wohnungs_type_d[wohnungs_type]
-    except IndexError:
-        wohnungs_type = None
-
-    # Etage
-    try:
-        e_item = [x for x in details_l if " Etage " in x][0]
-        e_item_ix = details_l.index(e_item)
-        e_item = details_l.pop(e_item_ix)
-        # wenn Etagen Gesamtzahl angegeben wird dan "1 von 3"
-        if "von" in e_item:
-            etage_split = e_item.split("von")
-            etage_all = etage_split[1].strip()
-            etage = [x for x in etage_split[0] if x.isdigit()][0]
-        else:
-            etage = e_item.split("Etage")[1].strip()
-            etage_all = None
-    except IndexError:
-        etage = None
-        etage_all = None
-
-    # groesse
-    # Wohnfläche
-    g_item = [x for x in details_l if "Wohnfläche" in x][0]
-    g_item_ix = details_l.index(g_item)
-    g_item = details_l.pop(g_item_ix)
-    wohnflaeche = re.findall(reg, floater(g_item))[0]
-
-    # Nutzfläche
-    if any(["Nutzfläche" in x for x in details_l]):
-        n_item = [x for x in details_l if "Nutzfläche" in x][0]
-        n_item_ix = details_l.index(n_item)
-        n_item = details_l.pop(n_item_ix)
-        nutzflaeche = re.findall(reg, floater(n_item))[0]
-    else:
-        nutzflaeche = None
-
-    # frei ab
-    if any(["Bezugsfrei" in x for x in details_l]):
-        f_item = [x for x in details_l if "Bezugsfrei" in x][0]
-        f_item_ix = details_l.index(f_item)
-        date_str = details_l.pop(f_item_ix)
-        date_str = date_str.split("Bezugsfrei ab")[1].strip()
-        if re.search(r"[sS].+t|[vV]ereinbarung", date_str):
-            frei_ab = datetime.now().date()
-        else:
-            date_str = re.search(r"\d{2,4}?[/.,-]\d{2}[/.,-]\d{2,4}", date_str)
-            if date_str:
-                frei_ab = get_date(date_str.group())
-            else:
-                frei_ab = datetime.now().date()
-    else:
-        frei_ab = datetime.now().date()
-        f_item = "No"
-
-    # Zimmer
-    # Schlafzimmer
-    if any(["Schlafzimmer" in x for x in details_l]):
-        s_item = [x for x in details_l if "Schlafzimmer" in x][0]
-        s_item_ix = details_l.index(s_item)
-        s_item = details_l.pop(s_item_ix)
-        schlafzimmer = re.findall(reg, floater(s_item))[0]
-    else:
-        schlafzimmer = None
-
-    # Badezimmer
-    if any(["Badezimmer" in x for x in details_l]):
-        b_item = [x for x in details_l if "Badezimmer" in x][0]
-        b_item_ix = details_l.index(b_item)
-        b_item = details_l.pop(b_item_ix)
-        badezimmer = re.findall(reg, floater(b_item))[0]
-    else:
-        badezimmer = None
-
-    # Zimmer gesamt
-    z_item = [x for x in details_l if "Zimmer" in x][0]
-    z_item_ix = details_l.index(z_item)
-    z_item = details_l.pop(z_item_ix)
-    zimmer_anzahl = re.findall(reg, floater(z_item))[0]
-
-    # Haustiere
-    if any(["Haustier" in x for x in details_l]):
-        h_item = [x for x in details_l if "Haustier" in x][0]
-        h_item_ix = details_l.index(h_item)
-        h_item = details_l.pop(h_item_ix).strip()
-        haustiere = haustier_d[h_item]
-    else:
-        # 0 = keine Angabe
-        haustiere = 0
-
-    # Garage
-    if any(["Garage" in x for x in details_l]):
-        garage_item = [x for x in details_l if "Garage" in x][0]
-        garage_item_ix = details_l.index(garage_item)
-        garage_item = details_l.pop(garage_item_ix).strip()
-        # Anzahl an Garagenplätzen ist optional
-        try:
-            garage_stellplatz_cnt = re.findall(reg, garage_item)[0]
-        except IndexError:
-            garage_stellplatz_cnt = None
-        garage_stellplatz = garage_d[garage_item.split()[-1]]
-    else:
-        # 0 = keine Angabe
-        garage_stellplatz = 0
-        garage_stellplatz_cnt = None
-
-    assert len(details_l) == 0
+    details_d, details_rest = index_criteria(
+        details_l, details_fields, exclusive=True
+    )
+    assert len(details_rest) == 0
+    ret_d.update(parse_fields(details_d, details_fields))
+    if ret_d["frei_ab"] is None:
+        ret_d["frei_ab"] = datetime.now().date()
 
     #################### Kosten #########################################
     kosten_h = [x for x in soup.find_all("h4") if x.text == " Kosten "][0]
     kosten_block = list(kosten_h.next_elements)[2]
     kosten_l = [x.text for x in kosten_block.find_all("dl")]
 
-    # bei Eigentum nach "Kaufpreis" suchen, bei Miete nach "Kaltmiete"
-    if wtype == "1":
-        kaufpreis = [x for x in kosten_l if "Kaufpreis" in x][0]
-        kaufpreis = float(re.findall(reg, floater(kaufpreis))[0])
+    kosten_d, _ = index_criteria(kosten_l, kosten_fields[wtype])
+    ret_d.update(parse_fields(kosten_d, kosten_fields[wtype]))
 
+    if wtype == "1":
         # Formel für Kaufnebenkosten, Eigenkapital und Nettodarlehen
         # https://www.immobilienscout24.de/baufinanzierung/finanzierungsrechner/
-        try:
-            provision = [x for x in kosten_l if "Provision" in x][0]
-            if any([x in provision.lower() for x in ("nein", "ohne")]):
-                provision = None
-            else:
-                provision = re.findall(reg, floater(provision))[0]
-                kaufnebenkosten = round(
-                    0.035 * kaufpreis + 0.015 * kaufpreis + 0.005 * \
-                    kaufpreis + float(provision) / 100 * kaufpreis
-                )
-        except IndexError:
-            provision = None
-        finally:
-            kaufnebenkosten = round(
-                0.035 * kaufpreis + 0.015 * kaufpreis + 0.005 * kaufpreis
-            )
-            eigenkapital = round(0.2 * int(kaufpreis))
-            nettodarlehen = kaufpreis + kaufnebenkosten - eigenkapital
-
-        # Hausgeld
-        try:
-            hausgeld = [x for x in kosten_l if "Hausgeld" in x][0]
-            hausgeld = re.findall(reg, floater(hausgeld))[0]
-        except IndexError:
-            hausgeld = None
-
-        # Garage - Stellplatz
-        try:
-            kosten_stellplatz = [x for x in kosten_l if "Garage" in x][0]
-            kosten_stellplatz = re.findall(reg, floater(kosten_stellplatz))[0]
-        except IndexError:
-            kosten_stellplatz = None
+        kaufpreis = ret_d["kaufpreis"]
+        ret_d["kaufnebenkosten"] = round(
+            0.035 * kaufpreis + 0.015 * kaufpreis + 0.005 * kaufpreis
+        )
+        ret_d["eigenkapital"] = round(0.2 * int(kaufpreis))
+        ret_d["nettodarlehen"] = (
+            kaufpreis + ret_d["kaufnebenkosten"] - ret_d["eigenkapital"]
+        )
 
         # Eigentumswohnungen können vermietet sein
         # dann kommen Hausgeld und evtl. Mieteinnahmen hinzu
-        if "vermietet" in f_item:
-            vermietet = True
-            try:
-                mieteinnahmen = [
-                    x for x in kosten_l if "mieteinnahmen" in x
-                ][0]
-                mieteinnahmen = re.findall(reg, floater(mieteinnahmen))[0]
-            except IndexError:
-                mieteinnahmen = None
-        else:
-            vermietet = False
-            mieteinnahmen = None
-
-    # Mietwohnungen
-    else:
-        # Kaltmiete
-        miete_kalt = [x for x in kosten_l if "Kaltmiete" in x][0]
-        miete_kalt = re.findall(reg, floater(miete_kalt))[0]
-
-        # Nebenkosten
-        try:
-            nebenkosten = [x for x in kosten_l if "Nebenkosten" in x][0]
-            nebenkosten = re.findall(reg, floater(nebenkosten))[0]
-        except IndexError:
-            nebenkosten = None
-
-        # Heizkosten
-        try:
-            miete_heizkosten = [x for x in kosten_l if "Heizkosten" in x][0]
-            miete_heizkosten = re.findall(reg, floater(miete_heizkosten))[0]
-        except IndexError:
-            miete_heizkosten = None
-
-        # Kaution
-        try:
-            kaution = [x for x in kosten_l if "Kaution" in x][0]
-            kaution = re.findall(reg, floater(kaution))[0]
-        except IndexError:
-            kaution = None
-
-        # Kosten Stellplatz
-        try:
-            kosten_stellplatz = [x for x in kosten_l if "Miete für Garage" in x][0]
-            kosten_stellplatz = re.findall(reg, floater(kosten_stellplatz))[0]
-        except IndexError:
-            kosten_stellplatz = None
-
-        # Miete gesamt
-        try:
-            miete_gesamt = [x for x in kosten_l if "Gesamtmiete" in x][0]
-            miete_gesamt = re.findall(reg, floater(miete_gesamt))[0]
-        except IndexError:
-            miete_gesamt = None
+        ret_d["vermietet"] = "vermietet" in details_d.get("Bezugsfrei", "")
+        if not ret_d["vermietet"]:
+            ret_d["mieteinnahmen"] = None
 
     #################### Ausstattung #########################################
     ausstattung_l = soup.find(
@@ -576,128 +618,32 @@ def parse_expose(soup):
         ausstattung_l = ausstattung_l.find_all(
             "span", class_=re.compile("^palm-hide")
         )
-        ausstattung_l = [x.text for x in ausstattung_l]
+        ausstattung_s = set(x.text for x in ausstattung_l)
 
-        # Onlinebesichtigung
-        if any(["Online-Besichtigung möglich" in x for x in ausstattung_l]):
-            online_besichtigung = True
-            ausstattung_l.pop(ausstattung_l.index("Online-Besichtigung möglich"))
-        else:
-            online_besichtigung = None
+        for item, field in ausstattung_fields.items():
+            ret_d[field] = True if item in ausstattung_s else None
+        if not ret_d["ferienwohnung_geeignet"]:
+            ret_d["ferienwohnung_geeignet"] = False
 
-        # Einbauküche
-        if any(["Einbauküche" in x for x in ausstattung_l]):
-            einbaukueche = True
-            ausstattung_l.pop(ausstattung_l.index("Einbauküche"))
-        else:
-            einbaukueche = None
+        if "Vermietet" in ausstattung_s:
+            ret_d["vermietet"] = True
 
-        # Balkon Terrasse
-        if any(["Balkon/ Terrasse" in x for x in ausstattung_l]):
-            balkon_terrasse = True
-            ausstattung_l.pop(ausstattung_l.index("Balkon/ Terrasse"))
-        else:
-            balkon_terrasse = None
-
-        # Keller
-        if any(["Keller" in x for x in ausstattung_l]):
-            keller = True
-            ausstattung_l.pop(ausstattung_l.index("Keller"))
-        else:
-            keller = None
-
-        # Aufug
-        if any(["Personenaufzug" in x for x in ausstattung_l]):
-            aufzug = True
-            ausstattung_l.pop(ausstattung_l.index("Personenaufzug"))
-        else:
-            aufzug = None
-
-        # Gäste-WC
-        if any(["Gäste-WC" in x for x in ausstattung_l]):
-            gaeste_wc = True
-            ausstattung_l.pop(ausstattung_l.index("Gäste-WC"))
-        else:
-            gaeste_wc = None
-
-        # Garten/ -mitbenutzung
-        if any(["Garten/ -mitbenutzung" in x for x in ausstattung_l]):
-            garten = True
-            ausstattung_l.pop(ausstattung_l.index("Garten/ -mitbenutzung"))
-        else:
-            garten = None
-
-        # WG-geeignet
-        if any(["WG-geeignet" in x for x in ausstattung_l]):
-            wg_geeignet = True
-            ausstattung_l.pop(ausstattung_l.index("WG-geeignet"))
-        else:
-            wg_geeignet = None
-
-        # barrierefrei
-        if any(["Stufenloser Zugang" in x for x in ausstattung_l]):
-            barrierefrei = True
-            ausstattung_l.pop(ausstattung_l.index("Stufenloser Zugang"))
-        else:
-            barrierefrei = None
-
-        # Vermietet
-        if any(["Vermietet" in x for x in ausstattung_l]):
-            vermietet = True
-            ausstattung_l.pop(
-                ausstattung_l.index("Vermietet")
-            )
-
-        # Wohnberechtigungsschein wbs
-        if any(["Wohnberechtigungsschein" in x for x in ausstattung_l]):
-            wbs = True
-            ausstattung_l.pop(
-                ausstattung_l.index("Wohnberechtigungsschein erforderlich")
-            )
-        else:
-            wbs = None
-
-        # als Ferienwohnung geeignet
-        if any(["Ferienwohnung" in x for x in ausstattung_l]):
-            ferienwohnung_geeignet = True
-            ausstattung_l.pop(
-                ausstattung_l.index("Als Ferienwohnung geeignet")
-            )
-        else:
-            ferienwohnung_geeignet = False
-
-        # Item "Provisonsfrei" wird durch "Kosten" abgedeckt.
-        # Kann entfernt werden
-        try:
-            ausstattung_l.remove("Provisionsfrei")
-        except ValueError:
-            pass
-
-        assert len(ausstattung_l) == 0
+        assert len(
+            ausstattung_s - ausstattung_fields.keys() - set(ausstattung_other)
+        ) == 0
 
     # keine Ausstattung angegeben
     else:
-        online_besichtigung = None
-        einbaukueche =  None
-        balkon_terrasse =  None
-        keller = None
-        aufzug = None
-        gaeste_wc = None
-        garten = None
-        wg_geeignet = None
-        barrierefrei = None
-        wbs = None
-        ferienwohnung_geeignet = None
+        for field in ausstattung_fields.values():
+            ret_d[field] = None
 
     ############################### Bausubstanz ###############################
     s = " Bausubstanz & Energieausweis "
 
     # Bausubstanz optional
-    try:
-        div = [
-            x for x in soup.find_all("h4") if x.text == s
-        ][0]
-        bausubstanz_l = div.next.next.next
+    div = [x for x in soup.find_all("h4") if x.text == s]
+    if div:
+        bausubstanz_l = div[0].next.next.next
         bausubstanz_l = [x.text.strip() for x in bausubstanz_l.find_all("dl")]
         # Escape Sequences z.B. \x entfernen
         bausubstanz_l = [
@@ -708,189 +654,35 @@ def parse_expose(soup):
 
         # replace double whitespace mit single white space
         bausubstanz_l = [x.replace("  ", " ") for x in bausubstanz_l]
+    else:
+        bausubstanz_l = []
 
-        # Baujahr
-        try:
-            baujahr_geb_item = [
-                x for x in bausubstanz_l if "Baujahr" in x
-            ][0].split()[1]
-            if "unbekannt" in baujahr_geb_item:
-                baujahr_gebaeude = None
-            else:
-                baujahr_gebaeude = int(baujahr_geb_item)
-        except IndexError:
-            baujahr_gebaeude = None
-
-        # Modernisierung
-        try:
-            modern_item = [
-                x for x in bausubstanz_l if "Modernisierung" in x
-            ][0]
-            modernisierung_jahr = int(modern_item.split("zuletzt")[1])
-        except IndexError:
-            modernisierung_jahr = None
-
-        # Zustand
-        try:
-            zustand_item = [
-                x for x in bausubstanz_l if "Objektzustand" in x
-            ][0].split("Objektzustand")[1].strip()
-            zustand = zustand_d[zustand_item]
-        except IndexError:
-            zustand = 1
-
-        try:
-            # Ausstattung Qualitaet
-            ausstattung_quali_item = [
-                x for x in bausubstanz_l if "Ausstattung" in x
-            ][0].split("Ausstattung")[1].strip()
-            ausstattung_qualitaet = ausstattung_qualitaet_d[
-                ausstattung_quali_item
-            ]
-        except IndexError:
-            ausstattung_qualitaet = 1
-
-        # Heizungsart
-        try:
-            heizungsart_item = [
-                x for x in bausubstanz_l if "Heizungsart" in x
-            ][0].split()[1]
-            heizungsart = heizungsart_d[heizungsart_item]
-        except IndexError:
-            heizungsart = 1
-
-        # Energieträger
-        try:
-            energietraeger_item = [
-                x for x in bausubstanz_l if "Energieträger" in x
-            ][0]
-            energietraeger_item = " ".join(energietraeger_item.split()[2:])
-            # nur das erste Imte wird als primärer Ebergieträger gezählt
-            energietraeger_item = energietraeger_item.split(",")[0]
-            energietraeger = energietraeger_d[energietraeger_item]
-        except IndexError:
-            energietraeger = 1
-
-        # Energieausweis
-        try:
-            energieausweis_item = [
-                x for x in bausubstanz_l if "Energieausweis " in x
-            ][0]
-            energieausweis = energieausweis_d[energieausweis_item]
-        except IndexError:
-            energieausweis = None
-
-        # Energieausweistyp
-        try:
-            energieausweisart_item = [
-                x for x in bausubstanz_l if "Energieausweistyp" in x
-            ][0]
-            energieausweis_art = energieausweisart_d[energieausweisart_item]
-        except IndexError:
-            energieausweis_art = None
-
-        try:
-            energieklasse_item = [
-                x for x in bausubstanz_l if "Energieeffizienzklasse" in x
-            ][0]
-            energieeffizienzklasse = energieklasse_item.split(
-                "Energieeffizienzklasse"
-            )[1].strip()
-        except IndexError:
-            energieeffizienzklasse = None
-
-    except IndexError:
-        baujahr_gebaeude = None
-        modernisierung_jahr = None
-        zustand = 1
-        ausstattung_qualitaet = 1
-        heizungsart = 1
-        energietraeger = 1
-        energieausweis = None
-        energieausweis_art = None
-        energieeffizienzklasse = None
-
-    ret_d = {
-        "data_id": data_id,
-        "titel": titel,
-        "plz": plz,
-        "adress_str": adress_str,
-        "kosten_stellplatz": kosten_stellplatz,
-        "wohnungs_type": wohnungs_type,
-        "etage": etage,
-        "etage_all": etage_all,
-        "wohnflaeche": wohnflaeche,
-        "nutzflaeche": nutzflaeche,
-        "frei_ab": frei_ab,
-        "schlafzimmer": schlafzimmer,
-        "badezimmer": badezimmer,
-        "zimmer_anzahl": zimmer_anzahl,
-        "haustiere": haustiere,
-        "energietraeger": energietraeger,
-        "garage_stellplatz": garage_stellplatz,
-        "garage_stellplatz_cnt": garage_stellplatz_cnt,
-        "schufa_auskunft": schufa_auskunft,
-        "online_besichtigung": online_besichtigung,
-        "einbaukueche": einbaukueche,
-        "balkon_terrasse": balkon_terrasse,
-        "keller": keller,
-        "aufzug": aufzug,
-        "gaeste_wc": gaeste_wc,
-        "garten": garten,
-        "wg_geeignet": wg_geeignet,
-        "barrierefrei": barrierefrei,
-        "baujahr_gebaeude": baujahr_gebaeude,
-        "modernisierung_jahr": modernisierung_jahr,
-        "zustand": zustand,
-        "ausstattung_qualitaet": ausstattung_qualitaet,
-        "heizungsart": heizungsart,
-        "energieausweis": energieausweis,
-        "energieausweis_art": energieausweis_art,
-        "energieeffizienzklasse": energieeffizienzklasse,
-        "verfuegbar": True,
-        "such_str": city
-    }
+    bausubstanz_d, _ = index_criteria(bausubstanz_l, bausubstanz_fields)
+    ret_d.update(parse_fields(bausubstanz_d, bausubstanz_fields))
 
-    if wtype == "1":
-        # Items für Eigenttum hinzufügen
-        ret_d["kaufpreis"] = kaufpreis
-        ret_d["kaufnebenkosten"] = kaufnebenkosten
-        ret_d["eigenkapital"] = eigenkapital
-        ret_d["nettodarlehen"] = nettodarlehen
-        ret_d["provision"] = provision
-        ret_d["vermietet"] = vermietet
-        ret_d["mieteinnahmen"] = mieteinnahmen
-        ret_d["hausgeld"] = hausgeld
-        ret_d["ferienwohnung_geeignet"] = ferienwohnung_geeignet
+    return ret_d
 
-    else:
-        # Items für Miete hinzufügen
-        ret_d["miete_gesamt"] = miete_gesamt
-        ret_d["miete_heizkosten"] = miete_heizkosten
-        ret_d["miete_kalt"] = miete_kalt
-        ret_d["nebenkosten"] = nebenkosten
-        ret_d["kaution"] = kaution
-        ret_d["wbs"] = wbs
+def fetch_expose(job):
+    print("Parsing expose: " + expo_url + job["data_id"] + "#/")
+    return http_get(expo_url + job["data_id"] + "#/").content
 
-    return ret_d
+def parse_expose_page(job, html):
+    # runs in a worker process of the pipeline
+    soup = BeautifulSoup(html, "lxml")
+    data = parse_expose(soup, job["data_id"])
+    data["realtor"] = job["realtor"]
+    data["img_url"] = get_image_url(soup)
 
-# bisher gespeicherte ids holen
-cur.execute(inserat_select_sql)
-rows = cur.fetchall()
-inserat_ids = [str(x[0]) for x in rows] if len(rows) > 0 else []
-print(f"Bisher {len(inserat_ids)} inserate")
+    return data
 
-# page counter
-count = 1
-get_string = f"{url}Suche/de/bayern/{city}/{wtype_d[wtype]}?pagenumber="
+def get_jobs(soup):
+    """
 
-# get max pagenumber
-soup = http_get_to_soup(get_string + str(count))
-select_wrapper = soup.find("div", class_="select-input-wrapper")
-max_page_n = int(select_wrapper.find_all("option")[-1].text)
+    :soup: results page (BeautifulSoup)
+    :returns: data_id and realtor of all exposes not in the db yet
+              (list of dicts)
 
-while count <= max_page_n:
-    soup = http_get_to_soup(get_string + str(count))
+    """
     items_l = soup.find("ul", id="resultListItems")
     result_l = items_l.find_all("li", class_="result-list__listing")
 
@@ -907,25 +699,170 @@ while count <= max_page_n:
     ]
 
     # bereits geparste exposes filtern
-    data_zipped = [
-        [x, y] for x, y in zip(data_ids, realtors) if x not in inserat_ids
+    return [
+        {"data_id": x, "realtor": y}
+        for x, y in zip(data_ids, realtors) if x not in inserat_ids
     ]
 
-    for data_id, realtor in data_zipped:
-        print("Parsing expose: " + expo_url + data_id + "#/")
-        soup = http_get_to_soup(expo_url + data_id + "#/")
-        data = parse_expose(soup)
-        data["realtor"] = realtor
-        print(data)
-        print()
-
-        img_data = get_image(soup)
-
+def write_image_rows():
+    # images of the page were downloading meanwhile
+    for future, data_id in image_futures:
+        image_hash = future.result() if future else None
         if wtype == "1":
-            cur.execute(inserat_eigentum_insert_sql, data)
-            cur.execute(images_eigentum_insert_sql, (img_data, data_id))
+            writer.add(images_eigentum_insert_sql, (image_hash, data_id))
         else:
-            cur.execute(inserat_insert_sql, data)
-            cur.execute(images_insert_sql, (img_data, data_id))
+            writer.add(images_insert_sql, (image_hash, data_id))
+    image_futures.clear()
+
+def write_expose(job, data):
+    img_url = data.pop("img_url")
+    print(data)
+    print()
+
+    # no image downloads in --reparse mode
+    if img_url and not reparse:
+        image_futures.append((images.submit(img_url), job["data_id"]))
+    else:
+        image_futures.append((None, job["data_id"]))
+
+    if wtype == "1":
+        writer.add(inserat_eigentum_insert_sql, data)
+    else:
+        writer.add(inserat_insert_sql, data)
+    inserat_ids.add(job["data_id"])
+    written.append(job["data_id"])
+    if len(written) >= checkpoint_every:
+        checkpoint()
+
+def checkpoint():
+    # commit written exposes, then record them in the crawl state
+    write_image_rows()
+    writer.flush()
+    inserat_ids.save()
+    # --reparse does not touch the state of the live crawl
+    if not reparse:
+        state.listings_done(written)
+    written.clear()
+
+# bisher gespeicherte ids holen
+inserat_ids = SeenIds.from_config(
+    config, f"immoscout_{wtype}", cur, inserat_select_sql,
+    exists_sql=inserat_exists_sql
+)
+print(f"Bisher {len(inserat_ids)} inserate")
+
+# exposes are fetched in threads and parsed in worker processes;
+# stage sizes in [PIPELINE] of cfg.ini. the workers fork here, after
+# the parse functions and before any thread (images, fetchers) exist
+pipeline = Pipeline.from_config(
+    config, fetch_expose, parse_expose_page, write_expose
+)
+# inserate and images are written in one transaction per checkpoint
+writer = BulkWriter(conn)
+# crawl progress: page and written exposes of it
+state = CrawlState.from_config(config, "immoscout", city, wtype, first_page=1)
+checkpoint_every = config.getint(
+    "CRAWL_STATE", "checkpoint_every", fallback=10
+)
+# ids written since the last checkpoint
+written = []
+
+# (Future of image hash, data_id); filled by write_expose
+image_futures = []
+
+# sorting=2: newest first, so the incremental crawl can stop early
+results_url = f"{url}Suche/de/bayern/{city}/{wtype_d[wtype]}"
+get_string = results_url + "?sorting=2&pagenumber="
+
+def reparse_archive():
+    """
+
+    run the current parsers over all archived results pages (oldest
+    first) and the newest archived expose of every listing;
+    exposes not in the db yet are written. no network
 
-    count += 1
+    :returns: number of written exposes (int)
+
+    """
+    entries = archive.index()
+    exposes = archive.latest(entries)
+
+    def fetch_archived(job):
+        return archive.read(exposes[expo_url + job["data_id"] + "#/"]).body
+
+    n_new = 0
+    for entry in entries:
+        # results pages of any sorting
+        if not entry.url.startswith(results_url + "?"):
+            continue
+        soup = BeautifulSoup(archive.read(entry).body, "lxml")
+        # exposes never fetched can not be parsed offline
+        jobs = [
+            x for x in get_jobs(soup)
+            if expo_url + x["data_id"] + "#/" in exposes
+        ]
+        print(f"{entry.url}: {len(jobs)} exposes")
+        n_new += pipeline.run(jobs, fetch=fetch_archived)
+        checkpoint()
+
+    return n_new
+
+def crawl():
+    """
+
+    incremental crawl: resume an interrupted run or start at page 1
+    and stop after [CRAWL] known_pages consecutive pages without new
+    exposes
+
+    :returns: number of new exposes (int)
+
+    """
+    # page counter
+    count = state.begin()
+
+    # get max pagenumber
+    soup = http_get_to_soup(get_string + "1")
+    select_wrapper = soup.find("div", class_="select-input-wrapper")
+    max_page_n = int(select_wrapper.find_all("option")[-1].text)
+
+    known_pages = KnownPages.from_config(config)
+    n_new = 0
+    while count <= max_page_n:
+        page_url = get_string + str(count)
+        page, changed = client.get_if_changed(page_url, http_cache)
+        if changed:
+            jobs = get_jobs(BeautifulSoup(page.text, "lxml"))
+        else:
+            # processed by an earlier run and unchanged since
+            print(f"{page_url} unverändert")
+            jobs = []
+        if known_pages.update(len(jobs)):
+            print(f"{datetime.now()} keine neuen Exposes mehr für {city}")
+            break
+        # written before an interruption
+        jobs = [x for x in jobs if not state.is_done(x["data_id"])]
+        n_new += pipeline.run(jobs)
+
+        checkpoint()
+        if changed:
+            http_cache.set(page_url, page)
+        state.page_done(count)
+        count += 1
+
+    state.complete()
+
+    return n_new
+
+if reparse:
+    n_new = reparse_archive()
+else:
+    n_new = crawl()
+print(f"{n_new} neue Exposes für {city}")
+
+pipeline.close()
+images.close()
+print(images.summary())
+print(http_cache.summary())
+http_cache.close()
+print(client.stats_summary())
+client.close()
@@ -0,0 +1,119 @@
+import io
+import re
+
+from lxml import etree
+from collections import namedtuple
+
+# lightweight record of one listing card of a wg-gesucht results page
+ListingCard = namedtuple(
+    "ListingCard",
+    ["id", "href", "img_style", "realtor", "online", "deactivated"]
+)
+
+card_id_prefix = "liste-details-ad"
+
+charset_re = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# filters are evaluated on the card element only
+excluded_xpath = etree.XPath(
+    ".//span[@title='übernachtung' or @title='tauschangebot']"
+)
+info_xpath = etree.XPath(".//div[@class='col-sm-12 flex_space_between']")
+deactivated_xpath = etree.XPath(
+    ".//span[contains(concat(' ', normalize-space(@class), ' '),"
+    " ' ribbon-deactivated ')]"
+)
+
+
+def charset(content_type, default="utf-8"):
+    """
+
+    "text/html; charset=ISO-8859-1" -> "ISO-8859-1"
+
+    :content_type: Content-Type header (string or None)
+    :default: if the header has no charset; wg-gesucht serves utf-8
+              and libxml2 would otherwise guess latin-1 (string)
+    :returns: charset (string)
+
+    """
+    m = charset_re.search(content_type or "")
+
+    return m.group(1) if m else default
+
+
+def _text(el):
+    return "".join(el.itertext())
+
+
+def _card(el):
+    """
+
+    build ListingCard from card element
+
+    :el: div element with id "liste-details-ad..."
+    :returns: ListingCard or None for hidden, übernachtung and
+              tauschangebot cards
+
+    """
+    card_id = el.get("id")
+    # filter out "hidden" items, "übernachtung" and "tauschangebot"
+    if "hidden" in card_id or excluded_xpath(el):
+        return None
+
+    a = el.find(".//a")
+    # last info row: "<realtor> ... online: <since>"
+    info_spans = info_xpath(el)[-1].findall(".//span")
+
+    return ListingCard(
+        id=card_id.split("-")[-1],
+        href=a.get("href"),
+        img_style=a.get("style"),
+        realtor=_text(info_spans[0]),
+        online=_text(info_spans[-1]),
+        deactivated=bool(deactivated_xpath(el))
+    )
+
+
+def iter_listing_cards(html, encoding="utf-8"):
+    """
+
+    single streaming pass over a wg-gesucht results page
+
+    parsed with lxml iterparse; every element outside of a card is
+    discarded as soon as it is closed and every card right after its
+    record was built, so peak memory is about one card, not one page
+
+    :html: results page (bytes)
+    :encoding: charset of html, see charset(Content-Type) (string)
+    :returns: generator of ListingCard
+
+    """
+    context = etree.iterparse(
+        io.BytesIO(html), events=("start", "end"), tag="div", html=True,
+        encoding=encoding
+    )
+    # nesting depth of divs inside the current card
+    card_depth = 0
+    for event, el in context:
+        is_card = (el.get("id") or "").startswith(card_id_prefix)
+        if event == "start":
+            if card_depth or is_card:
+                card_depth += 1
+            continue
+
+        if card_depth:
+            card_depth -= 1
+            if not is_card:
+                # part of the card; needed until the card closes
+                continue
+            card = _card(el)
+            if card:
+                yield card
+
+        # free the element and its already processed predecessors
+        el.clear()
+        parent = el.getparent()
+        if parent is not None:
+            while el.getprevious() is not None:
+                del parent[0]
+    del context
@@ -0,0 +1,192 @@
+import os
+import gzip
+import json
+import time
+import threading
+
+from collections import namedtuple
+
+# zstd if available, gzip otherwise; segments of both can be read
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# path of script
+script_path = os.path.dirname(os.path.realpath(__file__))
+
+# one archived page
+Record = namedtuple(
+    "Record", ["url", "ts", "status", "content_type", "body"]
+)
+# position of a record: segment file, offset and length of its frame
+IndexEntry = namedtuple(
+    "IndexEntry", ["url", "ts", "segment", "offset", "length"]
+)
+
+
+def _compress(data, segment):
+    if segment.endswith(".zst"):
+        return zstandard.ZstdCompressor(level=3).compress(data)
+
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, segment):
+    if segment.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"zstandard needed to read {segment}")
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    return gzip.decompress(data)
+
+
+class PageArchive:
+
+    """
+
+    Archive of raw fetched pages on local disk
+
+    WARC-like: every page is one compressed frame (zstd or gzip) with
+    a json header line (url, ts, status, content type) and the body,
+    appended to segment files <root>/<source>/<start>-<pid>-<n>.seg.zst;
+    a sidecar .idx (json lines) holds url, ts, offset and length of
+    every frame for random access
+
+    """
+
+    def __init__(self, root, source, segment_size=256 * 1024 ** 2):
+        """
+
+        :root: archive directory (string)
+        :source: e.g. "wg_gesucht", "immoscout" (string)
+        :segment_size: start a new segment above this size (bytes)
+
+        """
+        self.path = os.path.join(root, source)
+        self.segment_size = segment_size
+        self.ext = ".seg.zst" if zstandard else ".seg.gz"
+        self.lock = threading.Lock()
+        self.segment = None
+        self.segment_n = 0
+        self.f = None
+        self.idx = None
+        os.makedirs(self.path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, source):
+        """
+
+        :config: ConfigParser of cfg.ini; [ARCHIVE] dir is the
+                 directory, default archive/ next to the scripts
+        :source: e.g. "wg_gesucht", "immoscout" (string)
+
+        """
+        return cls(
+            config.get("ARCHIVE", "dir", fallback=script_path + "/archive"),
+            source,
+            segment_size=config.getint(
+                "ARCHIVE", "segment_mb", fallback=256
+            ) * 1024 ** 2
+        )
+
+    def _open_segment(self):
+        self.close()
+        self.segment_n += 1
+        name = (
+            time.strftime("%Y%m%d-%H%M%S")
+            + f"-{os.getpid()}-{self.segment_n}" + self.ext
+        )
+        self.segment = os.path.join(self.path, name)
+        self.f = open(self.segment, "ab")
+        self.idx = open(self.segment + ".idx", "a")
+
+    def add(self, url, body, status=200, content_type=None, ts=None):
+        """
+
+        append one page
+
+        :url: requested url (string)
+        :body: raw page (bytes)
+        :status: http status code (int)
+        :content_type: Content-Type header (string)
+        :ts: fetch time, default now (unix timestamp)
+
+        """
+        ts = time.time() if ts is None else ts
+        header = json.dumps({
+            "url": url, "ts": ts, "status": status,
+            "content_type": content_type
+        })
+        with self.lock:
+            if self.f is None or self.f.tell() >= self.segment_size:
+                self._open_segment()
+            frame = _compress(header.encode() + b"\n" + body, self.segment)
+            offset = self.f.tell()
+            self.f.write(frame)
+            self.f.flush()
+            self.idx.write(json.dumps({
+                "url": url, "ts": ts, "offset": offset, "length": len(frame)
+            }) + "\n")
+            self.idx.flush()
+
+    def index(self):
+        """
+
+        :returns: IndexEntry of every archived page, oldest first (list)
+
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".idx"):
+                continue
+            segment = os.path.join(self.path, name[:-len(".idx")])
+            with open(segment + ".idx") as f:
+                for line in f:
+                    # last line of a killed run may be incomplete
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries.append(IndexEntry(
+                        e["url"], e["ts"], segment, e["offset"], e["length"]
+                    ))
+
+        return sorted(entries, key=lambda x: x.ts)
+
+    def latest(self, entries=None):
+        """
+
+        :entries: IndexEntry list, default the whole index
+        :returns: dict url -> IndexEntry of the newest capture
+
+        """
+        if entries is None:
+            entries = self.index()
+
+        return {e.url: e for e in entries}
+
+    def read(self, entry):
+        """
+
+        :entry: IndexEntry
+        :returns: Record
+
+        """
+        with open(entry.segment, "rb") as f:
+            f.seek(entry.offset)
+            data = _decompress(f.read(entry.length), entry.segment)
+        header, body = data.split(b"\n", 1)
+        header = json.loads(header)
+
+        return Record(
+            header["url"], header["ts"], header["status"],
+            header["content_type"], body
+        )
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.idx.close()
+            self.f = None
+            self.idx = None
@@ -0,0 +1,167 @@
+import os
+import queue
+import threading
+import multiprocessing
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _ready():
+    # no-op; forks the worker processes
+    return True
+
+
+class Pipeline:
+
+    """
+
+    fetch -> parse -> write pipeline
+
+    fetch threads push raw pages onto a bounded queue, a process pool
+    turns them into result dicts and a single writer (the calling
+    thread) persists them; parsing overlaps with the network and uses
+    all cores
+
+    the pool forks, so the scrapers can pass their module level parse
+    functions and the workers see the globals (wtype, city, ...) as
+    they were when the pipeline was created. all workers are forked in
+    __init__: create the pipeline after the parse functions are defined
+    and before any thread runs (download threads, fetchers), so no
+    child inherits a lock held by another thread
+
+    """
+
+    def __init__(self, fetch, parse, write, fetch_workers=2,
+                 parse_workers=None, queue_size=32):
+        """
+
+        :fetch: job -> raw page (bytes); runs in fetch threads
+        :parse: (job, raw page) -> result; module level function,
+                runs in the worker processes
+        :write: (job, result) -> None; runs in the calling thread
+        :fetch_workers: parallel fetches (int)
+        :parse_workers: parse processes; default all cores (int)
+        :queue_size: max. pages fetched but not yet written (int)
+
+        """
+        self.fetch = fetch
+        self.parse = parse
+        self.write = write
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers or os.cpu_count()
+        self.queue_size = queue_size
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.parse_workers,
+            mp_context=multiprocessing.get_context("fork")
+        )
+        # a fork context starts all workers on the first submit
+        self.executor.submit(_ready).result()
+
+    @classmethod
+    def from_config(cls, config, fetch, parse, write):
+        """
+
+        stage sizes from cfg.ini section [PIPELINE]: fetch_workers,
+        parse_workers (0 = all cores) and queue_size
+
+        :config: ConfigParser of cfg.ini
+
+        """
+        return cls(
+            fetch, parse, write,
+            fetch_workers=config.getint(
+                "PIPELINE", "fetch_workers", fallback=2
+            ),
+            parse_workers=config.getint(
+                "PIPELINE", "parse_workers", fallback=0
+            ) or None,
+            queue_size=config.getint("PIPELINE", "queue_size", fallback=32)
+        )
+
+    def _fetcher(self, fetch, job_q, raw_q, stop):
+        while not stop.is_set():
+            try:
+                job = job_q.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                raw = fetch(job)
+            except Exception as e:
+                raw = e
+            raw_q.put((job, raw))
+        # this fetcher is done
+        raw_q.put(None)
+
+    def run(self, jobs, fetch=None):
+        """
+
+        fetch, parse and write all jobs; results are written in the
+        order their pages arrived
+
+        :jobs: jobs for fetch, e.g. dicts with an url (iterable)
+        :fetch: fetch for this run instead of the one of __init__,
+                e.g. from the archive (optional)
+        :returns: number of written results (int)
+        :raises: first fetch or parse error, e.g. TooManyRedirects for
+                 the captcha; fetching stops then
+
+        """
+        job_q = queue.Queue()
+        for job in jobs:
+            job_q.put(job)
+        raw_q = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=self._fetcher,
+                args=(fetch or self.fetch, job_q, raw_q, stop),
+                daemon=True
+            ) for _ in range(min(self.fetch_workers, job_q.qsize()))
+        ]
+        for t in threads:
+            t.start()
+
+        # (job, Future of parse) in arrival order
+        pending = deque()
+        running = len(threads)
+        written = 0
+        try:
+            while running:
+                item = raw_q.get()
+                if item is None:
+                    running -= 1
+                    continue
+                job, raw = item
+                if isinstance(raw, Exception):
+                    raise raw
+                pending.append(
+                    (job, self.executor.submit(self.parse, job, raw))
+                )
+                # write what is parsed; wait if too much is in flight
+                while pending and (
+                    pending[0][1].done() or len(pending) >= self.queue_size
+                ):
+                    done_job, future = pending.popleft()
+                    self.write(done_job, future.result())
+                    written += 1
+
+            while pending:
+                done_job, future = pending.popleft()
+                self.write(done_job, future.result())
+                written += 1
+        finally:
+            stop.set()
+            for _, future in pending:
+                future.cancel()
+            # unblock fetchers waiting on the full queue
+            while any(t.is_alive() for t in threads):
+                try:
+                    raw_q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+        return written
+
+    def close(self):
+        self.executor.shutdown(wait=True)
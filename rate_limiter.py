@@ -0,0 +1,257 @@
+import time
+import threading
+
+
+class HostBucket:
+
+    """
+
+    Token bucket of one host
+
+    refilled with rate tokens per second up to burst; a request takes
+    one token. tokens is the level at last, which lies in the future
+    if requests already wait for their slot
+
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.paused_until = 0
+        self.latency = None
+        self.requests = 0
+        self.throttled = 0
+        self.captchas = 0
+
+    def refill(self, now):
+        if now > self.last:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.last) * self.rate
+            )
+            self.last = now
+
+    def cooldown(self, seconds):
+        # one request right after the pause; waiting requests whose
+        # slot falls into it reserve a new one
+        self.paused_until = max(
+            self.paused_until, time.monotonic() + seconds
+        )
+        self.last = self.paused_until
+        self.tokens = 1
+
+
+class RateLimiter:
+
+    """
+
+    Adaptive per-host rate limiter
+
+    token bucket per host whose rate follows AIMD: every fast
+    successful response adds increase requests/s up to max_rate
+    (the maximum safe throughput of the site); a 429, a captcha or a
+    latency above latency_target multiplies the rate by decrease down
+    to min_rate. 429s and captchas additionally pause the host
+    (Retry-After or captcha_cooldown seconds)
+
+    thread safe; the fetch threads of one client share the buckets
+
+    """
+
+    settings = (
+        "rate", "min_rate", "max_rate", "burst", "increase", "decrease",
+        "latency_target", "captcha_cooldown"
+    )
+
+    def __init__(self, rate=0.5, min_rate=0.05, max_rate=2, burst=1,
+                 increase=0.05, decrease=0.5, latency_target=3,
+                 captcha_cooldown=600, hosts=None):
+        """
+
+        :rate: start rate in requests per second (float)
+        :min_rate: lower bound of the rate (float)
+        :max_rate: upper bound of the rate, the maximum safe
+                   throughput (float)
+        :burst: requests allowed at once after an idle period (int)
+        :increase: rate added per successful response (float)
+        :decrease: factor for the rate on throttling (float)
+        :latency_target: responses slower than this (seconds, smoothed)
+                         count as throttling; 0 disables (float)
+        :captcha_cooldown: pause of the host after a captcha (seconds)
+        :hosts: only limit these hosts; default all (iterable)
+
+        """
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.captcha_cooldown = captcha_cooldown
+        self.hosts = set(hosts) if hosts else None
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    @classmethod
+    def from_config(cls, config, source, hosts=None, **defaults):
+        """
+
+        settings from cfg.ini section [RATE_LIMIT_<SOURCE>], falling
+        back to [RATE_LIMIT]: rate, min_rate, max_rate, burst, increase,
+        decrease, latency_target, captcha_cooldown and hosts (comma
+        separated)
+
+        :config: ConfigParser of cfg.ini
+        :source: e.g. "wg_gesucht", "immoscout", "nominatim" (string)
+        :hosts: hosts to limit if not configured (iterable)
+        :defaults: fallbacks for the settings, e.g. max_rate=1
+
+        """
+        section = "RATE_LIMIT_" + source.upper()
+        kwargs = {}
+        for key in cls.settings:
+            value = config.getfloat(
+                "RATE_LIMIT", key, fallback=defaults.get(key)
+            )
+            value = config.getfloat(section, key, fallback=value)
+            if value is not None:
+                kwargs[key] = value
+        if "burst" in kwargs:
+            kwargs["burst"] = int(kwargs["burst"])
+        hosts = config.get(
+            section, "hosts",
+            fallback=config.get(
+                "RATE_LIMIT", "hosts",
+                fallback=",".join(hosts) if hosts else ""
+            )
+        )
+        kwargs["hosts"] = [x.strip() for x in hosts.split(",") if x.strip()]
+
+        return cls(**kwargs)
+
+    def bucket(self, host):
+        """
+
+        :host: e.g. "www.wg-gesucht.de" (string)
+        :returns: HostBucket or None if host is not limited
+
+        """
+        if self.hosts is not None and host not in self.hosts:
+            return None
+        if host not in self.buckets:
+            self.buckets[host] = HostBucket(self.rate, self.burst)
+
+        return self.buckets[host]
+
+    def acquire(self, host):
+        """
+
+        block until a request to host is allowed
+
+        :host: e.g. "www.wg-gesucht.de" (string)
+        :returns: seconds waited (float)
+
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                b = self.bucket(host)
+                if b is None:
+                    return waited
+                now = time.monotonic()
+                b.refill(now)
+                # reserve the slot: next token after the queued requests
+                slot = max(b.last, now)
+                if b.tokens < 1:
+                    slot += (1 - b.tokens) / b.rate
+                    b.tokens = 1
+                b.last = slot
+                b.tokens -= 1
+            if slot > now:
+                time.sleep(slot - now)
+                waited += slot - now
+            with self.lock:
+                # no cooldown started while waiting
+                if b.paused_until <= slot:
+                    b.requests += 1
+                    return waited
+
+    def _slower(self, b):
+        b.rate = max(self.min_rate, b.rate * self.decrease)
+
+    def success(self, host, latency):
+        """
+
+        feedback of a successful response
+
+        :host: e.g. "www.wg-gesucht.de" (string)
+        :latency: response time (seconds)
+
+        """
+        with self.lock:
+            b = self.bucket(host)
+            if b is None:
+                return
+            # smoothed latency; a single slow page does not count
+            if b.latency is None:
+                b.latency = latency
+            else:
+                b.latency = 0.8 * b.latency + 0.2 * latency
+            if self.latency_target and b.latency > self.latency_target:
+                self._slower(b)
+                # start again at the target
+                b.latency = self.latency_target
+            else:
+                b.rate = min(self.max_rate, b.rate + self.increase)
+
+    def throttled(self, host, retry_after=None):
+        """
+
+        feedback of a 429 (or 503) response
+
+        :host: e.g. "www.wg-gesucht.de" (string)
+        :retry_after: Retry-After header in seconds (float)
+
+        """
+        with self.lock:
+            b = self.bucket(host)
+            if b is None:
+                return
+            b.throttled += 1
+            self._slower(b)
+            b.cooldown(retry_after if retry_after else 1 / b.rate)
+
+    def captcha(self, host):
+        """
+
+        feedback of a captcha; the host is paused for captcha_cooldown
+        seconds and continues at min_rate
+
+        :host: e.g. "www.wg-gesucht.de" (string)
+
+        """
+        with self.lock:
+            b = self.bucket(host)
+            if b is None:
+                return
+            b.captchas += 1
+            b.rate = self.min_rate
+            b.cooldown(self.captcha_cooldown)
+
+    def summary(self):
+        """
+
+        :returns: one line per host with the learned rate (string)
+
+        """
+        lines = []
+        with self.lock:
+            for host, b in self.buckets.items():
+                lines.append(
+                    f"{host}: {b.rate:.2f} requests/s, "
+                    f"{b.throttled} throttled, {b.captchas} captchas"
+                )
+
+        return "\n".join(lines)
@@ -2,26 +2,51 @@ import os
 import geojson as gj
 import geopandas as gpd
 
-f_path = os.getcwd() + "/geojson/augsburg/"
-
-aux_gdf = gpd.read_file(f_path + "/augsburg_viertel_all.geojson")
-roads_gdf = gpd.read_file(f_path + "/augsburg_roads.geojson")
-with open(f_path + "/augsburg_roads.geojson") as f:
-    roads_gj = gj.load(f)
-
-osm_ids = roads_gdf["osm_id"]
-for osm_id in osm_ids:
-    sub_gdf = roads_gdf[roads_gdf["osm_id"] == osm_id]
-    sjoin = gpd.sjoin(aux_gdf, sub_gdf, how="inner", op="intersects")
-    display_name = sjoin["display_name"]
-    viertel = ", ".join([x.split(", ")[0] for x in display_name])
-    print(viertel)
-    # find feature with "osm_id"
-    feat = [
-        x for x in roads_gj["features"] if x["properties"]["osm_id"] == osm_id
-    ]
-    # add viertel to properties
-    feat[0]["properties"]["viertel"] = viertel
-
-with open(f_path + "/augsburg_roads.geojson", "w") as outfile:
-    gj.dump(roads_gj, outfile)
+
+def assign_viertel(roads_gj, viertel_gdf):
+    """
+
+    adds property "viertel" to every road feature
+    one bulk spatial join of all roads against all viertel
+
+    :roads_gj: FeatureCollection of roads (geojson)
+    :viertel_gdf: viertel polygons with "display_name" (GeoDataFrame)
+
+    :returns: roads_gj; "viertel" is a ", " separated list of viertel
+              names in viertel_gdf order, "" if no viertel intersects
+
+    """
+    roads_gdf = gpd.GeoDataFrame.from_features(
+        roads_gj["features"], crs=viertel_gdf.crs
+    )
+    # position of feature in roads_gj["features"]
+    roads_gdf["feature_ix"] = range(len(roads_gdf))
+
+    viertel = viertel_gdf[["geometry", "display_name"]].reset_index(drop=True)
+    viertel["viertel_ix"] = viertel.index
+    viertel["viertel"] = viertel["display_name"].str.split(", ").str[0]
+
+    sjoin = gpd.sjoin(
+        viertel, roads_gdf[["geometry", "feature_ix"]],
+        how="inner", predicate="intersects"
+    )
+    sjoin = sjoin.sort_values(["feature_ix", "viertel_ix"])
+    viertel_s = sjoin.groupby("feature_ix")["viertel"].agg(", ".join)
+
+    for feature_ix, feat in enumerate(roads_gj["features"]):
+        feat["properties"]["viertel"] = viertel_s.get(feature_ix, "")
+
+    return roads_gj
+
+
+if __name__ == "__main__":
+    f_path = os.getcwd() + "/geojson/augsburg/"
+
+    aux_gdf = gpd.read_file(f_path + "/augsburg_viertel_all.geojson")
+    with open(f_path + "/augsburg_roads.geojson") as f:
+        roads_gj = gj.load(f)
+
+    roads_gj = assign_viertel(roads_gj, aux_gdf)
+
+    with open(f_path + "/augsburg_roads.geojson", "w") as outfile:
+        gj.dump(roads_gj, outfile)
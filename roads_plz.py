@@ -1,31 +1,161 @@
 import os
-import geojson as gj
-import geopandas as gpd
-
-f_path = os.getcwd() + "/geojson/augsburg/"
-
-plz_shp = gpd.read_file("plz-gebiete.shp")
-aux_shp = plz_shp[plz_shp["note"].str.contains("Augsburg")]
-roads_gdf = gpd.read_file(f_path + "/augsburg_roads.geojson")
-with open(f_path + "/augsburg_roads.geojson") as f:
-    roads_gj = gj.load(f)
-
-osm_ids = roads_gdf["osm_id"]
-for osm_id in osm_ids:
-    sub_gdf = roads_gdf[roads_gdf["osm_id"] == osm_id]
-    sjoin = gpd.sjoin(aux_shp, sub_gdf, how="inner", op="intersects")
-    if len(sjoin) != 1:
-        print(sjoin)
-        break
-    #plz = sjoin["plz"]
-    """
-    # find feature with "osm_id"
-    feat = [
-        x for x in roads_gj["features"] if x["properties"]["osm_id"] == osm_id
-    ]
-    # add viertel to properties
-    feat[0]["properties"]["viertel"] = viertel
-
-with open(f_path + "/augsburg_roads.geojson", "w") as outfile:
-    gj.dump(roads_gj, outfile)
+import re
+import json
+
+# path of script
+script_path = os.path.dirname(os.path.realpath(__file__))
+
+# metric crs for lengths (ETRS89 / UTM zone 32N)
+metric_crs = "EPSG:25832"
+
+# city -> {street: set of plz}; loaded once per process
+_street_plz = {}
+
+
+def normalize_street(street):
+    """
+
+    "Hauptstr. 5" / "Hauptstrasse" -> "hauptstraße"
+
+    :street: street name, optionally with house number (string)
+    :returns: normalized street name (string)
+
     """
+    street = " ".join(street.lower().split())
+    # strip house number like "5", "5a", "5 a", "5-7"
+    street = re.sub(r"\s+\d+\s*[a-z]?(\s*-\s*\d+\s*[a-z]?)?$", "", street)
+    street = re.sub(r"str\.?$", "straße", street)
+    street = street.replace("strasse", "straße")
+
+    return street
+
+
+def assign_plz(roads_gdf, plz_gdf):
+    """
+
+    one-pass vectorized road -> plz assignment
+    roads spanning several postcodes are split by length share
+
+    :roads_gdf: roads with "osm_id", "name" (GeoDataFrame)
+    :plz_gdf: postcode polygons with "plz" (GeoDataFrame)
+
+    :returns: DataFrame with osm_id, name, plz, length (m) and share
+              (length / length of road inside all plz)
+
+    """
+    import shapely
+    import pandas as pd
+
+    roads = roads_gdf[["osm_id", "name", "geometry"]].to_crs(metric_crs)
+    plz = plz_gdf[["plz", "geometry"]].to_crs(metric_crs)
+    roads = roads.reset_index(drop=True)
+    plz = plz.reset_index(drop=True)
+
+    # candidate pairs (road, plz polygon) from the spatial index
+    road_ix, plz_ix = plz.sindex.query(roads.geometry, predicate="intersects")
+    pieces = shapely.intersection(
+        roads.geometry.values[road_ix], plz.geometry.values[plz_ix]
+    )
+    result = pd.DataFrame({
+        "osm_id": roads["osm_id"].values[road_ix],
+        "name": roads["name"].values[road_ix],
+        "plz": plz["plz"].values[plz_ix],
+        "length": shapely.length(pieces)
+    })
+    # roads touching a plz border only in a point have length 0
+    result = result[result["length"] > 0]
+    result["share"] = result["length"] / result.groupby(
+        "osm_id"
+    )["length"].transform("sum")
+
+    return result.reset_index(drop=True)
+
+
+def street_plz_path(city):
+    return os.path.join(
+        script_path, "geojson", city.lower(),
+        city.lower() + "_street_plz.json"
+    )
+
+
+def build_street_plz(city, plz_shp):
+    """
+
+    assign all roads of city to plz and cache
+    street name -> plz set as geojson/<city>/<city>_street_plz.json
+
+    :city: city with a <city>_roads.geojson (string)
+    :plz_shp: path of plz-gebiete shapefile (string)
+    :returns: road -> plz assignment (DataFrame)
+
+    """
+    import geopandas as gpd
+
+    plz_shp = gpd.read_file(plz_shp)
+    aux_shp = plz_shp[plz_shp["note"].str.contains(city)]
+    roads_gdf = gpd.read_file(os.path.join(
+        script_path, "geojson", city.lower(), city.lower() + "_roads.geojson"
+    ))
+    road_plz = assign_plz(roads_gdf, aux_shp)
+
+    street_plz = {}
+    for name, plz in road_plz[["name", "plz"]].dropna().itertuples(
+        index=False
+    ):
+        street_plz.setdefault(normalize_street(name), set()).add(str(plz))
+
+    with open(street_plz_path(city), "w") as f:
+        json.dump(
+            {k: sorted(v) for k, v in sorted(street_plz.items())},
+            f, ensure_ascii=False, indent=0
+        )
+    _street_plz.pop(city.lower(), None)
+
+    return road_plz
+
+
+def get_street_plz(city):
+    """
+
+    cached lookup table street -> plz set; no shapefile needed
+
+    :city: city (string)
+    :returns: dict street -> set of plz; empty if not built for city
+
+    """
+    key = city.lower()
+    if key not in _street_plz:
+        try:
+            with open(street_plz_path(city)) as f:
+                _street_plz[key] = {
+                    k: set(v) for k, v in json.load(f).items()
+                }
+        except FileNotFoundError:
+            _street_plz[key] = {}
+
+    return _street_plz[key]
+
+
+def street_has_plz(city, street, plz):
+    """
+
+    validate a plz parsed from a listing
+
+    :city: city (string)
+    :street: street, optionally with house number (string)
+    :plz: plz (string)
+
+    :returns: True/False; None if the street is unknown
+
+    """
+    plz_set = get_street_plz(city).get(normalize_street(street))
+    if plz_set is None:
+        return None
+
+    return str(plz) in plz_set
+
+
+if __name__ == "__main__":
+    road_plz = build_street_plz("Augsburg", "plz-gebiete.shp")
+    multi = road_plz.groupby("osm_id")["plz"].nunique()
+    print(f"{len(multi)} roads, {(multi > 1).sum()} in several plz")
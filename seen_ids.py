@@ -0,0 +1,306 @@
+import os
+import math
+import fcntl
+import struct
+import hashlib
+
+from contextlib import contextmanager
+
+
+class BloomFilter:
+
+    """
+
+    compact probabilistic set; no false negatives,
+    false positives with rate ~error_rate up to capacity items
+
+    watermark is the number of db rows the filter is known to hold;
+    -1 if unknown
+
+    """
+
+    header = struct.Struct("<4sQQQq")
+    magic = b"BLM2"
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        """
+
+        :capacity: expected number of items (int)
+        :error_rate: false positive rate at capacity (float)
+
+        """
+        # optimal size in bits and number of hash functions
+        self.m = max(
+            8, int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.count = 0
+        self.watermark = -1
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing: k positions from one 128 bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(
+            self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key)
+        )
+
+    def merge(self, other):
+        """
+
+        add all items of other; both need the same size
+
+        :other: BloomFilter
+        :returns: False if the sizes differ and nothing was merged (bool)
+
+        """
+        if (self.m, self.k) != (other.m, other.k):
+            return False
+        self.bits = bytearray(
+            (int.from_bytes(self.bits, "little")
+             | int.from_bytes(other.bits, "little")).to_bytes(
+                len(self.bits), "little"
+            )
+        )
+        self.count = max(self.count, other.count)
+
+        return True
+
+    def save(self, path):
+        """
+
+        write filter to path; atomic via rename
+
+        :path: file path (string)
+
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.header.pack(
+                self.magic, self.m, self.k, self.count, self.watermark
+            ))
+            f.write(self.bits)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+
+        :path: file path written by save (string)
+        :returns: BloomFilter or None if the file has an older format
+
+        """
+        with open(path, "rb") as f:
+            header = f.read(cls.header.size)
+            if header[:4] != cls.magic:
+                return None
+            magic, m, k, count, watermark = cls.header.unpack(header)
+            bloom = cls.__new__(cls)
+            bloom.m, bloom.k, bloom.count = m, k, count
+            bloom.watermark = watermark
+            bloom.bits = bytearray(f.read())
+
+        return bloom
+
+
+class SeenIds:
+
+    """
+
+    Index of already stored inserat ids
+
+    ids are held in a hash set, so "id in seen" is O(1).
+    Optionally a bloom filter of all ids is persisted to disk; then the
+    full SELECT of the history table is skipped at startup and only
+    bloom filter hits are confirmed with a single-row exists_sql query.
+
+    the file keeps the number of db rows it covers (watermark). on load
+    it is compared with the row count of select_sql and the filter is
+    rebuilt if they differ: rows inserted by other scripts or committed
+    before a crash are never missed. load and save hold a lock on the
+    file; save merges the filter on disk, so parallel runs sharing a
+    file do not drop each other's ids
+
+    ids are normalized to strings, so int and string ids compare equal
+
+    """
+
+    def __init__(self, cur, select_sql, params=(), exists_sql=None,
+                 bloom_path=None, error_rate=0.001):
+        """
+
+        :cur: db cursor
+        :select_sql: query returning all stored ids in the first column
+        :params: params for select_sql and exists_sql (tuple)
+        :exists_sql: query returning a row if id (first param) is stored;
+                     required for the bloom filter
+        :bloom_path: file of persisted bloom filter (string)
+        :error_rate: false positive rate of the bloom filter (float)
+
+        """
+        self.cur = cur
+        self.select_sql = select_sql
+        self.params = tuple(params)
+        self.exists_sql = exists_sql
+        self.bloom_path = bloom_path if exists_sql else None
+        self.error_rate = error_rate
+        # confirmed stored and confirmed missing ids
+        self.ids = set()
+        self.missing = set()
+        self.bloom = None
+        # ids added since the last save; each is one new db row
+        self.added = set()
+
+        if self.bloom_path:
+            with self._locked():
+                if os.path.exists(self.bloom_path):
+                    self.bloom = BloomFilter.load(self.bloom_path)
+                if (self.bloom is None
+                        or self.bloom.watermark != self.db_count()):
+                    self.rebuild()
+        else:
+            self.rebuild()
+
+    @classmethod
+    def from_config(cls, config, name, cur, select_sql, params=(),
+                    exists_sql=None):
+        """
+
+        create SeenIds; bloom filter is used if cfg.ini has a
+        [SEEN_IDS] section with bloom_dir
+
+        :config: ConfigParser of cfg.ini
+        :name: name of bloom filter file (string)
+
+        """
+        bloom_dir = config.get("SEEN_IDS", "bloom_dir", fallback=None)
+        bloom_path = None
+        if bloom_dir:
+            os.makedirs(bloom_dir, exist_ok=True)
+            bloom_path = os.path.join(bloom_dir, name + ".bloom")
+
+        return cls(cur, select_sql, params, exists_sql, bloom_path)
+
+    @contextmanager
+    def _locked(self):
+        # exclusive lock of the bloom filter file across processes
+        with open(self.bloom_path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def db_count(self):
+        """
+
+        :returns: number of rows of select_sql (int)
+
+        """
+        self.cur.execute(
+            "SELECT count(*) FROM ("
+            + self.select_sql.strip().rstrip(";")
+            + ") AS seen_ids;",
+            self.params
+        )
+
+        return self.cur.fetchone()[0]
+
+    def rebuild(self):
+        """
+
+        load all stored ids with select_sql
+        and (re)build the bloom filter from them
+
+        """
+        self.cur.execute(self.select_sql, self.params)
+        rows = self.cur.fetchall()
+        self.ids = {str(x[0]) for x in rows}
+        self.missing = set()
+        self.added = set()
+        if self.bloom_path:
+            # leave room for growth; more items only raise the
+            # false positive rate, never cause misses
+            self.bloom = BloomFilter(
+                max(100000, 2 * len(self.ids)), self.error_rate
+            )
+            for x in self.ids:
+                self.bloom.add(x)
+            self.bloom.watermark = len(rows)
+            self.bloom.save(self.bloom_path)
+
+    def __contains__(self, inserat_id):
+        key = str(inserat_id)
+        if key in self.ids:
+            return True
+        if self.bloom is None or key in self.missing:
+            return False
+        if key not in self.bloom:
+            return False
+        # bloom filter hit -> confirm in db
+        self.cur.execute(self.exists_sql, (key,) + self.params)
+        if self.cur.fetchone():
+            self.ids.add(key)
+            return True
+        self.missing.add(key)
+
+        return False
+
+    def __len__(self):
+        return self.bloom.count if self.bloom else len(self.ids)
+
+    def add(self, inserat_id):
+        """
+
+        mark inserat_id as stored; call after its row is committed
+
+        :inserat_id: id (string or int)
+
+        """
+        key = str(inserat_id)
+        if key in self.ids:
+            return
+        self.ids.add(key)
+        self.missing.discard(key)
+        if self.bloom is not None:
+            self.bloom.add(key)
+            self.added.add(key)
+
+    def save(self):
+        """
+
+        persist bloom filter; no-op without bloom_path
+
+        merged with the file on disk (other runs); the watermark grows
+        by the ids added here, so it only matches the db if every
+        committed row went through add
+
+        """
+        if not self.bloom_path or self.bloom is None:
+            return
+        with self._locked():
+            disk = None
+            if os.path.exists(self.bloom_path):
+                disk = BloomFilter.load(self.bloom_path)
+            # the other runs' ids and watermark are kept; with a
+            # different size the file is replaced and its watermark
+            # falls behind the db, so the next load rebuilds
+            if disk is not None and disk.merge(self.bloom):
+                self.bloom = disk
+            if self.bloom.watermark >= 0:
+                self.bloom.watermark += len(self.added)
+            self.bloom.save(self.bloom_path)
+        self.added = set()
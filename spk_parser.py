@@ -3,25 +3,35 @@ import re
 import sys
 import json
 import psycopg2
-import requests
 import configparser
 
+from html import unescape
 from bs4 import BeautifulSoup
-from selenium import webdriver
 from psycopg2.extras import Json
-from requests.exceptions import HTTPError
-from requests.exceptions import TooManyRedirects
+from seen_ids import SeenIds
+from db_writer import BulkWriter
+from http_client import HttpClient
+from crawl_state import CrawlState, KnownPages
+from image_store import ImagePipeline
+from listing_extractor import charset
+from browser_pool import BrowserPool, install_capture, take_captured
 from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import TimeoutException
-from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.support import expected_conditions as EC
 
+# faster json decoder if available
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 
-assert (len(sys.argv) == 3), "Too few/many arguments"
+# spk_parser.py <wtype> <city> [<city> ...]
+assert (len(sys.argv) >= 3), "Too few arguments"
 wtype = sys.argv[1]
-city = (sys.argv[2]).lower()
+cities = [x.lower() for x in sys.argv[2:]]
 
 wtype_d = {
     "0": "Wohnung",
@@ -49,14 +59,16 @@ conn.autocommit = True
 cur = conn.cursor()
 
 images_sql = """
-    INSERT INTO spk.images_inserate_json(image, id, tag)
-    VALUES (%s, %s, %s);
+    INSERT INTO spk.images_inserate_json(image_hash, id, tag)
+    VALUES (%s, %s, %s)
+    ON CONFLICT DO NOTHING;
     """
 
 inserat_sql = """
     INSERT INTO spk.inserate_json (such_str, fio_id,
     data, wohnungs_type)
-    VALUES (%s, %s, %s, %s);
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT DO NOTHING;
     """
 
 inserat_ids_sql = """
@@ -64,117 +76,265 @@ inserat_ids_sql = """
     FROM spk.inserate_json;
     """
 
+inserat_exists_sql = """
+    SELECT 1 FROM spk.inserate_json WHERE fio_id = %s;
+    """
+
 # get stored inserat_ids
-cur.execute(inserat_ids_sql)
-rows = cur.fetchall()
-inserat_ids = [x[0] for x in rows] if len(rows) > 0 else []
-print(f"Bisher {len(inserat_ids)} inserate für {city} und {wtype_d[wtype]}")
+inserat_ids = SeenIds.from_config(
+    config, "spk", cur, inserat_ids_sql, exists_sql=inserat_exists_sql
+)
+print(f"Bisher {len(inserat_ids)} inserate für {wtype_d[wtype]}")
+
+# shared, pooled http client
+client = HttpClient()
+http_get = client.get
+http_get_to_soup = client.get_to_soup
+# gallery images are streamed in parallel into the content-addressed
+# store; [IMAGES] workers caps all downloads, listing_workers those of
+# one listing, so a large gallery does not take every worker
+images = ImagePipeline.from_config(client, config, "spk")
+listing_workers = config.getint("IMAGES", "listing_workers", fallback=4)
+
+# SPI Id  Beispiel: '/FIO-10915855820'
+p = re.compile(r"/FIO-\d*")
+# in json responses without the leading "/"
+fio_re = re.compile(r"FIO-(\d+)")
+
+def find_fio_ids(html):
+    # fio ids of all links in html; in page order, without duplicates
+    soup = BeautifulSoup(html, "lxml")
+    links = soup.find_all("a")
+    fio_ids = p.findall(",".join([x.get("href") or "" for x in links]))
+
+    return list(dict.fromkeys(fio_ids))
+
+# <input ... name="estate" ... value="{&quot;estate&quot;: ...}">
+estate_input_re = re.compile(rb"<input\b[^>]*\bname=[\"']estate[\"'][^>]*>")
+# value=, but not data-value=
+value_re = re.compile(rb"(?<![-\w])value=(?:\"([^\"]*)\"|'([^']*)')")
+
+def extract_estate(page, encoding="utf-8"):
+    """
+
+    estate json of a detail page without building the DOM
+
+    byte scan for the hidden input "estate"; its value is unescaped
+    and decoded. falls back to BeautifulSoup (which detects the
+    encoding) if the markup differs or the value is no json
+
+    :page: detail page (bytes)
+    :encoding: charset of the page, e.g. of the Content-Type (string)
+    :returns: estate (dict)
+
+    """
+    m = estate_input_re.search(page)
+    v = value_re.search(m.group(0)) if m else None
+    if v:
+        try:
+            return json_loads(unescape(
+                (v.group(1) or v.group(2) or b"").decode(encoding)
+            ))["estate"]
+        except (LookupError, ValueError):
+            # UnicodeDecodeError and JSONDecodeError are ValueErrors
+            pass
+    soup = BeautifulSoup(page, "lxml")
+    value = soup.find("input", {"name": "estate"}).get("value")
+
+    return json_loads(value)["estate"]
+
+def fio_ids_of_responses(bodies):
+    # fio ids in captured json responses; in order, without duplicates
+    fio_ids = fio_re.findall(" ".join(bodies))
+
+    return list(dict.fromkeys("/FIO-" + x for x in fio_ids))
+
+def click_all(driver, button_str, timeout):
+    # solange auf weitere Ergebnisse drücken, bis Button verschwindet
+    try:
+        while True:
+            WebDriverWait(driver, timeout).until(
+                EC.element_to_be_clickable((By.XPATH, button_str))
+            ).click()
+    except TimeoutException:
+        print("keine weiteren Pages mehr")
+
+def collect_fio_ids(driver, city):
+    """
+
+    search city and load further results until the button vanishes
+
+    the fio ids are taken from the json responses behind the result
+    list (captured fetch/XHR); if none are captured, the button is
+    clicked until it vanishes and the ids are read from the DOM
+
+    :driver: WebDriver of the browser pool
+    :city: city (string)
+    :returns: fio ids like "/FIO-10915855820" (list of strings)
+
+    """
+    timeout = config.getint("BROWSER", "timeout", fallback=10)
+    driver.get("https://immobilien.sparkasse.de")
+    install_capture(driver, "FIO-")
+    input_element = "//div/input[@placeholder='PLZ / Ort / SIP-ID*']"
+    city_input = driver.find_element(By.XPATH, input_element)
+
+    # Nach Stadt suchen und "Suchen" Button klicken
+    city_input.send_keys(city)
+    suchen_btn = WebDriverWait(driver, timeout).until(
+        EC.presence_of_element_located((By.CLASS_NAME, "btn-label"))
+    )
+    suchen_btn.click()
 
-def http_get(url):
+    # the search may load a new page: wait for the first results and
+    # install the capture there again (no-op on the same page)
     try:
-        r = requests.get(url)
-        if r.status_code == 200:
-            return r
-        else:
-            raise requests.HTTPError(
-                f"Request failed with status_code {r.status_code}"
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located(
+                (By.CSS_SELECTOR, "a[href*='/FIO-']")
             )
-    except requests.ConnectionError as e:
-        print(url + " probably offline!")
-        raise e
-
-def http_get_to_soup(url):
-    r = http_get(url)
-    # only allow content type "text/html"
-    if "text/html" in r.headers["Content-Type"]:
-        return BeautifulSoup(r.text, "lxml")
-
-    else:
-        print(f"Expected Content Type text/html, but got \
-              {r.headers['Content-Type']} instead")
-        raise TypeError
-
-# selenium Page interaktion mit Firefox headless
-options = Options()
-options.headless = True
-driver = webdriver.Firefox(options=options)
-# driver = webdriver.Firefox()
-driver.get("https://immobilien.sparkasse.de")
-input_element = "//div/input[@placeholder='PLZ / Ort / SIP-ID*']"
-city_input = driver.find_element_by_xpath(input_element)
-
-# Nach Stadt suchen und "Suchen" Button klicken
-city_input.send_keys(city)
-suchen_btn = WebDriverWait(driver, 10).until(
-    EC.presence_of_element_located((By.CLASS_NAME, "btn-label"))
-)
-suchen_btn.click()
+        )
+    except TimeoutException:
+        print("keine Ergebnisse")
+        return []
+    install_capture(driver, "FIO-")
 
-try:
-    # solange auf weitere Ergebnisse drücken, bis Button verschwindet
+    # the search sets no sort order and newest first is not confirmed,
+    # so [CRAWL] known_pages does not apply: all batches are loaded
+    known_pages = KnownPages(n=0)
+    fio_ids = []
+    seen = set()
+    button_str = "//div[@class='sip-estate-list']//span/button/div/span"
+    # poll the captured responses, not the DOM
+    wait = WebDriverWait(driver, timeout, poll_frequency=0.1)
+    # first batch: from the DOM after a page load, else captured
+    batch = find_fio_ids(driver.page_source) + fio_ids_of_responses(
+        take_captured(driver)
+    )
     while True:
-        button_str = "//div[@class='sip-estate-list']//span/button/div/span"
-        element = WebDriverWait(driver, 10).until(
-        EC.presence_of_element_located((By.XPATH, button_str))
+        batch = [x for x in dict.fromkeys(batch) if x not in seen]
+        seen.update(batch)
+        fio_ids += batch
+        new = [x for x in batch if x[1:] not in inserat_ids]
+        if known_pages.update(len(new)):
+            print("keine neuen Inserate mehr")
+            break
+        try:
+            WebDriverWait(driver, timeout).until(
+                EC.element_to_be_clickable((By.XPATH, button_str))
+            ).click()
+        except TimeoutException:
+            print("keine weiteren Pages mehr")
+            break
+        try:
+            batch = fio_ids_of_responses(wait.until(take_captured))
+        except TimeoutException:
+            # no json with fio ids captured: old DOM loop
+            print("keine Ergebnisse abgefangen, lese Seite")
+            click_all(driver, button_str, timeout)
+            fio_ids += [
+                x for x in find_fio_ids(driver.page_source) if x not in seen
+            ]
+            break
+
+    return fio_ids
+
+# galleries are large; inserat and its images are written
+# in one transaction per listing
+writer = BulkWriter(conn)
+
+def crawl(city, fio_ids, state):
+    """
+
+    parse and write all inserate of fio_ids
+
+    :city: city (string)
+    :fio_ids: fio ids like "/FIO-10915855820" (list of strings)
+    :state: CrawlState of city
+    :returns: number of new inserate (int)
+
+    """
+    for fio in fio_ids:
+        inserat_url = f"https://immobilien.sparkasse.de{fio}#?detailPage=1"
+        print(f"parsing {inserat_url}")
+        r = http_get(inserat_url)
+        inserat_data = extract_estate(
+            r.content, charset(r.headers.get("Content-Type"))
         )
-        driver.find_element_by_xpath(button_str).click()
-except (NoSuchElementException, TimeoutException):
-    print("keine weiteren Pages mehr")
-finally:
-    page_all = driver.page_source
-    driver.quit()
 
-soup = BeautifulSoup(page_all, "lxml")
-links = soup.find_all("a")
+        # prepare list for insert in inserate
+        preped_l = [
+            city,
+            inserat_data["id"],
+            Json(inserat_data),
+            wtype
+        ]
 
-# SPI Id  Beispiel: '/FIO-10915855820'
-p = re.compile(r"/FIO-\d*")
-fio_ids = p.findall(",".join([x.get("href") for x in links]))
-
-# bereits bearbeitete Inserate uebersrpingen
-# x[1:] weil "/" nicht nicht ids enthalten
-fio_ids = [x for x in fio_ids if x[1:] not in inserat_ids]
-print(fio_ids)
-
-for fio in fio_ids:
-    inserat_url = f"https://immobilien.sparkasse.de{fio}#?detailPage=1"
-    print(f"parsing {inserat_url}")
-    soup = http_get_to_soup(inserat_url)
-    inserat = soup.find("input", {"name": "estate"})
-    inserat_data = json.loads(inserat.get("value"))
-    inserat_data = inserat_data["estate"]
-
-
-    # prepare list for insert in inserate
-    preped_l = [
-        city,
-        inserat_data["id"],
-        Json(inserat_data),
-        wtype
-    ]
-
-    cur.execute(inserat_sql, preped_l)
-
-    # get images from "gallery"
-    g_images = inserat_data["estate"]["galleryImages"]
-    
-    # filter for only "image"
-    images_data = [x for x in g_images if x["type"] == "image"]
-
-    for i in images_data:
-        # multiple formats for images -> only take "original"
-        orig = [x for x in i["resources"] if x["size"] == "original"]
-        assert len(orig) == 1
-        orig_url = orig[0]["url"]
-        r = http_get(orig_url)
-
-        tag = i["description"]
-
-
-        cur.execute(
-            images_sql,
-            [r.content, inserat_data["id"], tag]
+        writer.add(inserat_sql, preped_l)
+
+        # get images from "gallery"
+        g_images = inserat_data["estate"]["galleryImages"]
+
+        # filter for only "image"
+        images_data = [x for x in g_images if x["type"] == "image"]
+
+        # (url, tag)
+        gallery = []
+        for i in images_data:
+            # multiple formats for images -> only take "original"
+            orig = [x for x in i["resources"] if x["size"] == "original"]
+            assert len(orig) == 1
+            gallery.append((orig[0]["url"], i["description"]))
+
+        image_hashes = images.fetch_all(
+            [url for url, _ in gallery], max_concurrent=listing_workers
         )
+        for url, tag in gallery:
+            writer.add(
+                images_sql,
+                [image_hashes[url], inserat_data["id"], tag]
+            )
+
+        # one transaction; the images in one multi-row INSERT
+        writer.flush()
+        inserat_ids.add(inserat_data["id"])
+        state.listings_done([inserat_data["id"]])
+
+    # once per city; a crash before only costs a rebuild of the index
+    inserat_ids.save()
+    state.complete()
+
+    return len(fio_ids)
+
+# browsers stay open from one city to the next
+browsers = BrowserPool.from_config(config)
+n_new = 0
+try:
+    for city in cities:
+        with browsers.session() as driver:
+            fio_ids = collect_fio_ids(driver, city)
+
+        # bereits bearbeitete Inserate uebersrpingen
+        # x[1:] weil "/" nicht nicht ids enthalten
+        fio_ids = [x for x in fio_ids if x[1:] not in inserat_ids]
+
+        # crawl progress: all results are one page; resume skips
+        # written inserate
+        state = CrawlState.from_config(config, "spk", city, wtype)
+        state.begin()
+        fio_ids = [x for x in fio_ids if not state.is_done(x[1:])]
+        print(fio_ids)
+
+        n_city = crawl(city, fio_ids, state)
+        print(f"{n_city} neue Inserate für {city} und {wtype_d[wtype]}")
+        n_new += n_city
+finally:
+    browsers.close()
+print(f"{n_new} neue Inserate für {wtype_d[wtype]}")
 
+images.close()
+print(images.summary())
+print(client.stats_summary())
+client.close()
 cur.close()
 conn.close()
@@ -0,0 +1,18 @@
+-- images are stored once in a content-addressed store on disk
+-- (image_store.py, [IMAGES] store in cfg.ini);
+-- rows only keep the sha256 hex digest of the image
+ALTER TABLE wg_gesucht.images_inserate ADD COLUMN image_hash character(64);
+ALTER TABLE immoscout.images_inserate ADD COLUMN image_hash character(64);
+ALTER TABLE immoscout.images_eigentum_inserate ADD COLUMN image_hash character(64);
+ALTER TABLE spk.images_inserate_json ADD COLUMN image_hash character(64);
+
+CREATE INDEX images_inserate_image_hash_idx
+    ON wg_gesucht.images_inserate (image_hash);
+CREATE INDEX images_inserate_image_hash_idx
+    ON immoscout.images_inserate (image_hash);
+CREATE INDEX images_eigentum_inserate_image_hash_idx
+    ON immoscout.images_eigentum_inserate (image_hash);
+CREATE INDEX images_inserate_json_image_hash_idx
+    ON spk.images_inserate_json (image_hash);
+
+-- existing bytea images: python image_store.py moves them into the store
@@ -0,0 +1,109 @@
+-- one row per listing: the scrapers insert with ON CONFLICT DO NOTHING,
+-- so a listing that slipped past the seen-ids index (seen_ids.py) is
+-- never stored twice
+--
+-- WARNING: duplicates of earlier runs are DELETED first; the oldest row
+-- is kept. the deleted rows are copied into <table>_duplicates before,
+-- drop those tables once checked. run it once, in one transaction:
+--     psql -1 -f sql/unique_ids.sql
+
+CREATE TABLE wg_gesucht.inserate_duplicates AS
+    SELECT * FROM wg_gesucht.inserate a WHERE EXISTS (
+        SELECT 1 FROM wg_gesucht.inserate b
+        WHERE a.ctid > b.ctid
+        AND a.wg_gesucht_id = b.wg_gesucht_id
+        AND a.wohnungs_type = b.wohnungs_type
+    );
+DELETE FROM wg_gesucht.inserate a USING wg_gesucht.inserate b
+    WHERE a.ctid > b.ctid
+    AND a.wg_gesucht_id = b.wg_gesucht_id
+    AND a.wohnungs_type = b.wohnungs_type;
+CREATE UNIQUE INDEX inserate_wg_gesucht_id_type_key
+    ON wg_gesucht.inserate (wg_gesucht_id, wohnungs_type);
+
+CREATE TABLE immoscout.inserate_duplicates AS
+    SELECT * FROM immoscout.inserate a WHERE EXISTS (
+        SELECT 1 FROM immoscout.inserate b
+        WHERE a.ctid > b.ctid AND a.inserat_id = b.inserat_id
+    );
+DELETE FROM immoscout.inserate a USING immoscout.inserate b
+    WHERE a.ctid > b.ctid AND a.inserat_id = b.inserat_id;
+CREATE UNIQUE INDEX inserate_inserat_id_key
+    ON immoscout.inserate (inserat_id);
+
+CREATE TABLE immoscout.inserate_eigentum_duplicates AS
+    SELECT * FROM immoscout.inserate_eigentum a WHERE EXISTS (
+        SELECT 1 FROM immoscout.inserate_eigentum b
+        WHERE a.ctid > b.ctid AND a.inserat_id = b.inserat_id
+    );
+DELETE FROM immoscout.inserate_eigentum a
+    USING immoscout.inserate_eigentum b
+    WHERE a.ctid > b.ctid AND a.inserat_id = b.inserat_id;
+CREATE UNIQUE INDEX inserate_eigentum_inserat_id_key
+    ON immoscout.inserate_eigentum (inserat_id);
+
+CREATE TABLE spk.inserate_json_duplicates AS
+    SELECT * FROM spk.inserate_json a WHERE EXISTS (
+        SELECT 1 FROM spk.inserate_json b
+        WHERE a.ctid > b.ctid AND a.fio_id = b.fio_id
+    );
+DELETE FROM spk.inserate_json a USING spk.inserate_json b
+    WHERE a.ctid > b.ctid AND a.fio_id = b.fio_id;
+CREATE UNIQUE INDEX inserate_json_fio_id_key
+    ON spk.inserate_json (fio_id);
+
+CREATE TABLE gis.osm_duplicates AS
+    SELECT * FROM gis.osm a WHERE EXISTS (
+        SELECT 1 FROM gis.osm b
+        WHERE a.ctid > b.ctid AND a.osm_id = b.osm_id
+    );
+DELETE FROM gis.osm a USING gis.osm b
+    WHERE a.ctid > b.ctid AND a.osm_id = b.osm_id;
+CREATE UNIQUE INDEX osm_osm_id_key ON gis.osm (osm_id);
+
+-- images: an image once per listing (rows without hash are not unique)
+CREATE TABLE wg_gesucht.images_inserate_duplicates AS
+    SELECT * FROM wg_gesucht.images_inserate a WHERE EXISTS (
+        SELECT 1 FROM wg_gesucht.images_inserate b
+        WHERE a.ctid > b.ctid AND a.id = b.id AND a.image_hash = b.image_hash
+    );
+DELETE FROM wg_gesucht.images_inserate a
+    USING wg_gesucht.images_inserate b
+    WHERE a.ctid > b.ctid AND a.id = b.id AND a.image_hash = b.image_hash;
+CREATE UNIQUE INDEX images_inserate_id_image_hash_key
+    ON wg_gesucht.images_inserate (id, image_hash);
+
+CREATE TABLE immoscout.images_inserate_duplicates AS
+    SELECT * FROM immoscout.images_inserate a WHERE EXISTS (
+        SELECT 1 FROM immoscout.images_inserate b
+        WHERE a.ctid > b.ctid AND a.id = b.id AND a.image_hash = b.image_hash
+    );
+DELETE FROM immoscout.images_inserate a
+    USING immoscout.images_inserate b
+    WHERE a.ctid > b.ctid AND a.id = b.id AND a.image_hash = b.image_hash;
+CREATE UNIQUE INDEX images_inserate_id_image_hash_key
+    ON immoscout.images_inserate (id, image_hash);
+
+CREATE TABLE immoscout.images_eigentum_inserate_duplicates AS
+    SELECT * FROM immoscout.images_eigentum_inserate a WHERE EXISTS (
+        SELECT 1 FROM immoscout.images_eigentum_inserate b
+        WHERE a.ctid > b.ctid AND a.id = b.id AND a.image_hash = b.image_hash
+    );
+DELETE FROM immoscout.images_eigentum_inserate a
+    USING immoscout.images_eigentum_inserate b
+    WHERE a.ctid > b.ctid AND a.id = b.id AND a.image_hash = b.image_hash;
+CREATE UNIQUE INDEX images_eigentum_inserate_id_image_hash_key
+    ON immoscout.images_eigentum_inserate (id, image_hash);
+
+CREATE TABLE spk.images_inserate_json_duplicates AS
+    SELECT * FROM spk.images_inserate_json a WHERE EXISTS (
+        SELECT 1 FROM spk.images_inserate_json b
+        WHERE a.ctid > b.ctid AND a.id = b.id AND a.image_hash = b.image_hash
+        AND a.tag IS NOT DISTINCT FROM b.tag
+    );
+DELETE FROM spk.images_inserate_json a
+    USING spk.images_inserate_json b
+    WHERE a.ctid > b.ctid AND a.id = b.id AND a.image_hash = b.image_hash
+    AND a.tag IS NOT DISTINCT FROM b.tag;
+CREATE UNIQUE INDEX images_inserate_json_id_image_hash_tag_key
+    ON spk.images_inserate_json (id, image_hash, tag);
@@ -0,0 +1,52 @@
+from crawl_state import CrawlState, KnownPages
+
+
+def test_interrupted_crawl_resumes(tmp_path):
+    path = str(tmp_path / "wg_gesucht_berlin_0.json")
+    state = CrawlState(path)
+    assert state.begin() == 0
+    state.page_done(0)
+    state.listings_done(["11", 12])
+
+    # killed here; the next run continues on page 1
+    state = CrawlState(path)
+    assert state.begin() == 1
+    assert state.is_done(11) and state.is_done("12")
+    assert not state.is_done("13")
+
+
+def test_completed_crawl_starts_again(tmp_path):
+    path = str(tmp_path / "spk_berlin_0.json")
+    state = CrawlState(path, first_page=1)
+    state.begin()
+    state.page_done(1)
+    state.listings_done(["11"])
+    state.complete()
+
+    state = CrawlState(path, first_page=1)
+    assert state.last_completed is not None
+    assert state.begin() == 1
+    assert not state.is_done("11")
+
+
+def test_legacy_counter_is_taken_over(tmp_path):
+    counter = tmp_path / "wg_counter"
+    counter.write_text("7\n")
+
+    state = CrawlState(str(tmp_path / "s.json"),
+                       legacy_counter=str(counter))
+    assert state.begin() == 7
+
+
+def test_known_pages_stops_after_n_pages_without_new():
+    known_pages = KnownPages(n=2)
+
+    assert [known_pages.update(x) for x in (3, 0, 1, 0, 0)] == [
+        False, False, False, False, True
+    ]
+
+
+def test_known_pages_zero_crawls_everything():
+    known_pages = KnownPages(n=0)
+
+    assert not any(known_pages.update(0) for _ in range(100))
@@ -0,0 +1,108 @@
+from datetime import datetime
+
+from psycopg2.extras import Json
+
+from db_writer import BulkWriter
+
+
+insert_sql = """
+    INSERT INTO wg_gesucht.images_inserate (id, image, image_hash)
+    VALUES (%s, %s, %s)
+    ON CONFLICT DO NOTHING;
+    """
+
+
+class Cursor:
+
+    def __init__(self):
+        self.sql = []
+        self.copied = None
+
+    def execute(self, sql):
+        self.sql.append(sql)
+
+    def copy_expert(self, sql, f):
+        self.sql.append(sql)
+        self.copied = f.read()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class Connection:
+
+    autocommit = True
+
+    def __init__(self):
+        self.cur = Cursor()
+        self.committed = False
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+
+def test_split_positional_with_on_conflict():
+    table, columns, template, on_conflict = BulkWriter(None)._split(
+        insert_sql
+    )
+
+    assert table == "wg_gesucht.images_inserate"
+    assert columns == ["id", "image", "image_hash"]
+    assert template == "(%s, %s, %s)"
+    assert on_conflict == "ON CONFLICT DO NOTHING"
+
+
+def test_split_named_without_on_conflict():
+    table, columns, template, on_conflict = BulkWriter(None)._split(
+        "INSERT INTO spk.inserate_json (fio_id, data)\n"
+        "VALUES (%(fio_id)s, %(data)s)"
+    )
+
+    assert table == "spk.inserate_json"
+    assert columns == ["fio_id", "data"]
+    assert template == "(%(fio_id)s, %(data)s)"
+    assert on_conflict == ""
+
+
+def test_csv_value():
+    assert BulkWriter._csv_value(None) == ""
+    assert BulkWriter._csv_value("") == '""'
+    assert BulkWriter._csv_value('a "b"') == '"a ""b"""'
+    assert BulkWriter._csv_value(b"\x00\xff") == '"\\x00ff"'
+    assert BulkWriter._csv_value(True) == '"t"'
+    assert BulkWriter._csv_value(datetime(2024, 1, 2, 3, 4)) == (
+        '"2024-01-02T03:04:00"'
+    )
+    assert BulkWriter._csv_value(Json({"a": 1})) == '"{""a"": 1}"'
+
+
+def test_copy_with_on_conflict_goes_through_staging():
+    conn = Connection()
+    writer = BulkWriter(conn, copy_threshold=2)
+    writer.add(insert_sql, (1, b"\x01", "h1"))
+    writer.add(insert_sql, (1, b"\x01", "h1"))
+
+    assert writer.flush() == 2
+    create, copy, insert, drop = conn.cur.sql
+    assert create.startswith("CREATE TEMP TABLE bulk_writer_staging")
+    assert "LIKE wg_gesucht.images_inserate" in create
+    assert copy.startswith("COPY bulk_writer_staging (id, image, image_hash)")
+    assert insert == (
+        "INSERT INTO wg_gesucht.images_inserate (id, image, image_hash) "
+        "SELECT id, image, image_hash FROM bulk_writer_staging "
+        "ON CONFLICT DO NOTHING"
+    )
+    assert drop == "DROP TABLE bulk_writer_staging"
+    assert conn.cur.copied == '"1","\\x01","h1"\n' * 2
+    assert conn.committed
+    assert conn.autocommit
+    assert len(writer) == 0
@@ -0,0 +1,52 @@
+import http_cache
+
+from http_cache import HttpCache
+
+
+class Response:
+
+    def __init__(self, content=b"", status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_validators_are_sent_after_set(tmp_path):
+    cache = HttpCache(str(tmp_path / "c.sqlite"))
+    assert cache.headers("https://a/1") == {}
+
+    cache.set("https://a/1", Response(b"1", headers={
+        "ETag": '"abc"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"
+    }))
+    assert cache.headers("https://a/1") == {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"
+    }
+    assert cache.headers("https://a/2") == {}
+    cache.close()
+
+
+def test_unchanged(tmp_path):
+    cache = HttpCache(str(tmp_path / "c.sqlite"))
+    url = "https://a/1"
+    # not processed yet
+    assert not cache.unchanged(url, Response(b"1"))
+
+    cache.set(url, Response(b"1"))
+    assert cache.unchanged(url, Response(status_code=304))
+    # no validators, but the same body
+    assert cache.unchanged(url, Response(b"1"))
+    assert not cache.unchanged(url, Response(b"2"))
+    assert (cache.hits, cache.misses) == (2, 2)
+    cache.close()
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache = HttpCache(str(tmp_path / "c.sqlite"), ttl=60)
+    cache.set("https://a/1", Response(b"1", headers={"ETag": '"abc"'}))
+    now = http_cache.time.time()
+    monkeypatch.setattr(http_cache.time, "time", lambda: now + 61)
+
+    assert cache.headers("https://a/1") == {}
+    assert not cache.unchanged("https://a/1", Response(b"1"))
+    cache.close()
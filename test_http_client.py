@@ -0,0 +1,80 @@
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_client import HttpClient, retry_after
+from rate_limiter import RateLimiter
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    # status codes answered in turn, then 200
+    statuses = []
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = b"<html></html>"
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.statuses = []
+    Handler.requests = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_retry_after_is_handled_by_rate_limiter(server):
+    Handler.statuses = [429]
+    host = "127.0.0.1:%d" % server.server_address[1]
+    limiter = RateLimiter(rate=10, max_rate=10, latency_target=0)
+    client = HttpClient(retries=2, backoff_factor=0, rate_limiter=limiter)
+
+    r = client.get(f"http://{host}/")
+
+    assert r.status_code == 200
+    assert Handler.requests == 2
+    b = limiter.buckets[host]
+    assert b.throttled == 1
+    assert b.rate < 10
+    client.close()
+
+
+def test_429_without_rate_limiter_fails(server):
+    Handler.statuses = [429, 429, 429]
+    host = "127.0.0.1:%d" % server.server_address[1]
+    client = HttpClient(retries=0)
+
+    with pytest.raises(requests.HTTPError):
+        client.get(f"http://{host}/")
+    client.close()
+
+
+def test_retry_after_header():
+    class Response:
+        headers = {"Retry-After": "7"}
+
+    assert retry_after(Response()) == 7.0
+    Response.headers = {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert retry_after(Response()) == 0.0
+    Response.headers = {}
+    assert retry_after(Response()) is None
@@ -0,0 +1,72 @@
+from listing_extractor import charset, iter_listing_cards
+
+
+def card(card_id, realtor="Müller", badge="", ribbon=""):
+    return f"""
+    <div id="{card_id}" class="offer_list_item">
+      <div class="card">
+        <a href="/wg-zimmer-in-Berlin.{card_id[-3:]}.html"
+           style="background-image: url('https://img/{card_id}.jpg');"></a>
+        {badge}{ribbon}
+        <div class="col-sm-12 flex_space_between"><span>x</span></div>
+        <div class="col-sm-12 flex_space_between">
+          <span>{realtor}</span><span>Online: 3 Stunden</span>
+        </div>
+      </div>
+    </div>"""
+
+
+def page(*cards):
+    return (
+        "<html><head><title>WG</title></head><body><div id='main'>"
+        + "".join(cards) + "</div></body></html>"
+    )
+
+
+def test_charset():
+    assert charset("text/html; charset=ISO-8859-1") == "ISO-8859-1"
+    assert charset('text/html; charset="utf-8"') == "utf-8"
+    assert charset("text/html") == "utf-8"
+    assert charset(None, default=None) is None
+
+
+def test_cards_are_extracted():
+    html = page(
+        card("liste-details-ad-101"),
+        card("liste-details-ad-102", ribbon=(
+            '<span class="ribbon ribbon-deactivated">deaktiviert</span>'
+        ))
+    ).encode()
+
+    cards = list(iter_listing_cards(html))
+    assert [x.id for x in cards] == ["101", "102"]
+    assert cards[0].href == "/wg-zimmer-in-Berlin.101.html"
+    assert "liste-details-ad-101.jpg" in cards[0].img_style
+    assert cards[0].realtor == "Müller"
+    assert cards[0].online == "Online: 3 Stunden"
+    assert not cards[0].deactivated
+    assert cards[1].deactivated
+
+
+def test_hidden_uebernachtung_and_tauschangebot_are_filtered():
+    html = page(
+        card("liste-details-ad-hidden-103"),
+        card("liste-details-ad-104",
+             badge='<span title="übernachtung">Ü</span>'),
+        card("liste-details-ad-105",
+             badge='<span title="tauschangebot">T</span>'),
+        card("liste-details-ad-106")
+    ).encode()
+
+    assert [x.id for x in iter_listing_cards(html)] == ["106"]
+
+
+def test_encoding():
+    html = page(
+        card("liste-details-ad-107", realtor="Jürgen"),
+        card("liste-details-ad-108",
+             badge='<span title="übernachtung">Ü</span>')
+    )
+
+    cards = list(iter_listing_cards(html.encode("latin-1"), "ISO-8859-1"))
+    assert [(x.id, x.realtor) for x in cards] == [("107", "Jürgen")]
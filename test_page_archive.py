@@ -0,0 +1,58 @@
+import page_archive
+
+from page_archive import PageArchive
+
+
+def test_pages_are_read_back(tmp_path):
+    archive = PageArchive(str(tmp_path), "wg_gesucht")
+    archive.add("https://a/1", b"<html>1</html>", ts=1,
+                content_type="text/html; charset=utf-8")
+    archive.add("https://a/2", b"<html>2\n</html>", ts=2)
+    archive.add("https://a/1", b"<html>1 neu</html>", ts=3)
+    archive.close()
+
+    entries = PageArchive(str(tmp_path), "wg_gesucht").index()
+    assert [(e.url, e.ts) for e in entries] == [
+        ("https://a/1", 1), ("https://a/2", 2), ("https://a/1", 3)
+    ]
+    record = archive.read(entries[0])
+    assert record.body == b"<html>1</html>"
+    assert record.status == 200
+    assert record.content_type == "text/html; charset=utf-8"
+    latest = archive.latest(entries)
+    assert archive.read(latest["https://a/1"]).body == b"<html>1 neu</html>"
+    assert archive.read(latest["https://a/2"]).body == b"<html>2\n</html>"
+
+
+def test_segments_are_rotated(tmp_path):
+    archive = PageArchive(str(tmp_path), "immoscout", segment_size=1)
+    for i in range(3):
+        archive.add(f"https://a/{i}", b"x" * 100, ts=i)
+    archive.close()
+
+    entries = archive.index()
+    assert len({e.segment for e in entries}) == 3
+    assert [archive.read(e).url for e in entries] == [
+        "https://a/0", "https://a/1", "https://a/2"
+    ]
+
+
+def test_incomplete_index_line_is_skipped(tmp_path):
+    archive = PageArchive(str(tmp_path), "wg_gesucht")
+    archive.add("https://a/1", b"1", ts=1)
+    with open(archive.segment + ".idx", "a") as f:
+        f.write('{"url": "https://a/2", "ts"')
+    archive.close()
+
+    assert [e.url for e in archive.index()] == ["https://a/1"]
+
+
+def test_gzip_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_archive, "zstandard", None)
+    archive = PageArchive(str(tmp_path), "wg_gesucht")
+    archive.add("https://a/1", b"1", ts=1)
+    archive.close()
+
+    entry, = archive.index()
+    assert entry.segment.endswith(".seg.gz")
+    assert archive.read(entry).body == b"1"
@@ -0,0 +1,65 @@
+import pytest
+
+from pipeline import Pipeline
+
+
+# module level, the forked workers call them by name
+def fetch(job):
+    if job == "fetch error":
+        raise ConnectionError(job)
+    return job.encode()
+
+
+def parse(job, raw):
+    if job == "parse error":
+        raise ValueError(job)
+    return raw.decode().upper()
+
+
+@pytest.fixture
+def written():
+    return []
+
+
+@pytest.fixture
+def pipeline(written):
+    pipeline = Pipeline(
+        fetch, parse, lambda job, result: written.append((job, result)),
+        fetch_workers=2, parse_workers=2, queue_size=4
+    )
+    yield pipeline
+    pipeline.close()
+
+
+def test_all_jobs_are_written(pipeline, written):
+    jobs = [f"job{i}" for i in range(20)]
+
+    assert pipeline.run(jobs) == 20
+    assert sorted(written) == sorted((x, x.upper()) for x in jobs)
+
+
+def test_run_with_other_fetch(pipeline, written):
+    assert pipeline.run(["a", "b"], fetch=lambda job: b"archived") == 2
+    assert sorted(written) == [("a", "ARCHIVED"), ("b", "ARCHIVED")]
+
+
+def test_fetch_error_is_raised(pipeline):
+    with pytest.raises(ConnectionError):
+        pipeline.run(["a", "fetch error"] + [f"job{i}" for i in range(20)])
+
+
+def test_parse_error_is_raised(pipeline):
+    with pytest.raises(ValueError):
+        pipeline.run(["a", "parse error", "b"])
+
+
+def test_pipeline_runs_again_after_an_error(pipeline, written):
+    with pytest.raises(ValueError):
+        pipeline.run(["parse error"])
+
+    assert pipeline.run(["a"]) == 1
+    assert written[-1] == ("a", "A")
+
+
+def test_no_jobs(pipeline):
+    assert pipeline.run([]) == 0
@@ -0,0 +1,132 @@
+import configparser
+
+import pytest
+
+import rate_limiter
+
+from rate_limiter import RateLimiter
+
+
+class Clock:
+
+    # time.monotonic and time.sleep without waiting
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_slots_are_spaced_by_rate(clock):
+    limiter = RateLimiter(rate=2, max_rate=2, burst=1)
+
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    assert limiter.acquire("a") == pytest.approx(0.5)
+    # other hosts have their own bucket
+    assert limiter.acquire("b") == 0
+
+
+def test_burst_after_idle(clock):
+    limiter = RateLimiter(rate=1, max_rate=1, burst=3)
+    limiter.acquire("a")
+    clock.now += 60
+
+    waits = [limiter.acquire("a") for _ in range(4)]
+    assert waits == pytest.approx([0, 0, 0, 1])
+
+
+def test_unlimited_hosts(clock):
+    limiter = RateLimiter(rate=0.1, hosts=["a"])
+
+    assert limiter.acquire("b") == 0
+    assert limiter.acquire("b") == 0
+    assert "b" not in limiter.buckets
+
+
+def test_additive_increase(clock):
+    limiter = RateLimiter(rate=1, max_rate=1.2, increase=0.1)
+    limiter.acquire("a")
+
+    limiter.success("a", 0.1)
+    assert limiter.buckets["a"].rate == pytest.approx(1.1)
+    limiter.success("a", 0.1)
+    limiter.success("a", 0.1)
+    assert limiter.buckets["a"].rate == pytest.approx(1.2)
+
+
+def test_multiplicative_decrease_on_429(clock):
+    limiter = RateLimiter(rate=1, min_rate=0.3, decrease=0.5)
+    limiter.acquire("a")
+
+    limiter.throttled("a", retry_after=10)
+    b = limiter.buckets["a"]
+    assert b.rate == pytest.approx(0.5)
+    assert b.throttled == 1
+    # paused for Retry-After
+    assert limiter.acquire("a") == pytest.approx(10)
+    limiter.throttled("a")
+    limiter.throttled("a")
+    assert b.rate == pytest.approx(0.3)
+
+
+def test_cooldown_moves_waiting_slots(clock, monkeypatch):
+    limiter = RateLimiter(rate=1, max_rate=1)
+    limiter.acquire("a")
+    b = limiter.buckets["a"]
+
+    def sleep(seconds):
+        clock.sleep(seconds)
+        # a 429 arrives while a request waits for its slot
+        if b.throttled == 0:
+            limiter.throttled("a", retry_after=5)
+
+    monkeypatch.setattr(rate_limiter.time, "sleep", sleep)
+    start = clock.now
+    limiter.acquire("a")
+    assert clock.now - start >= 5
+    assert b.requests == 2
+
+
+def test_slow_responses_count_as_throttling(clock):
+    limiter = RateLimiter(rate=1, decrease=0.5, latency_target=2)
+    limiter.acquire("a")
+
+    limiter.success("a", 5)
+    assert limiter.buckets["a"].rate == pytest.approx(0.5)
+
+
+def test_captcha_pauses_at_min_rate(clock):
+    limiter = RateLimiter(rate=1, min_rate=0.1, captcha_cooldown=600)
+    limiter.acquire("a")
+
+    limiter.captcha("a")
+    assert limiter.buckets["a"].rate == 0.1
+    assert limiter.acquire("a") == pytest.approx(600)
+
+
+def test_from_config_source_section_overrides():
+    config = configparser.ConfigParser()
+    config.read_string(
+        "[RATE_LIMIT]\nrate = 1\nmax_rate = 3\nburst = 2\n"
+        "[RATE_LIMIT_NOMINATIM]\nmax_rate = 0.5\nhosts = a, b\n"
+    )
+
+    limiter = RateLimiter.from_config(config, "nominatim", min_rate=0.01)
+    assert limiter.rate == 0.5
+    assert limiter.max_rate == 0.5
+    assert limiter.min_rate == 0.01
+    assert limiter.burst == 2
+    assert limiter.hosts == {"a", "b"}
@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+from seen_ids import BloomFilter, SeenIds
+
+
+select_sql = "SELECT inserat_id FROM inserate;"
+exists_sql = "SELECT 1 FROM inserate WHERE inserat_id = ?;"
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE inserate (inserat_id TEXT)")
+    yield conn
+    conn.close()
+
+
+def insert(db, *ids):
+    db.executemany("INSERT INTO inserate VALUES (?)", [(x,) for x in ids])
+
+
+def seen(db, path):
+    return SeenIds(db.cursor(), select_sql, exists_sql=exists_sql,
+                   bloom_path=str(path))
+
+
+def test_bloom_filter_roundtrip(tmp_path):
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(100):
+        bloom.add(str(i))
+    bloom.watermark = 100
+    bloom.save(str(tmp_path / "f.bloom"))
+
+    loaded = BloomFilter.load(str(tmp_path / "f.bloom"))
+    assert all(str(i) in loaded for i in range(100))
+    assert (loaded.m, loaded.k, loaded.count, loaded.watermark) == (
+        bloom.m, bloom.k, 100, 100
+    )
+
+
+def test_bloom_filter_old_format_is_ignored(tmp_path):
+    path = tmp_path / "f.bloom"
+    path.write_bytes(b"\x00" * 64)
+
+    assert BloomFilter.load(str(path)) is None
+
+
+def test_ids_without_bloom_filter(db):
+    insert(db, "1", "2")
+    ids = SeenIds(db.cursor(), select_sql)
+
+    assert "1" in ids and 2 in ids
+    assert "3" not in ids
+    ids.add(3)
+    assert "3" in ids
+
+
+def test_saved_filter_is_used(db, tmp_path):
+    path = tmp_path / "s.bloom"
+    insert(db, "1", "2")
+    ids = seen(db, path)
+    insert(db, "3")
+    ids.add("3")
+    ids.save()
+
+    ids = seen(db, path)
+    # loaded from the file, not from the select
+    assert ids.ids == set()
+    assert ids.bloom.watermark == 3
+    assert "3" in ids and "1" in ids
+    assert "4" not in ids
+
+
+def test_rows_missing_in_filter_rebuild_it(db, tmp_path):
+    path = tmp_path / "s.bloom"
+    insert(db, "1")
+    seen(db, path)
+    # committed by another script or before a crash, never saved
+    insert(db, "2")
+
+    ids = seen(db, path)
+    assert ids.ids == {"1", "2"}
+    assert ids.bloom.watermark == 2
+    assert "2" in ids
+
+
+def test_parallel_saves_keep_both_runs(db, tmp_path):
+    path = tmp_path / "s.bloom"
+    insert(db, "1")
+    a = seen(db, path)
+    b = seen(db, path)
+    insert(db, "2", "3")
+    a.add("2")
+    b.add("3")
+    a.save()
+    b.save()
+
+    ids = seen(db, path)
+    assert ids.ids == set()
+    assert ids.bloom.watermark == 3
+    assert "2" in ids and "3" in ids
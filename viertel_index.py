@@ -0,0 +1,152 @@
+import os
+import json
+import shapely
+
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+# path of script
+script_path = os.path.dirname(os.path.realpath(__file__))
+
+# city -> ViertelIndex; built once per process
+_indexes = {}
+
+
+class ViertelIndex:
+
+    """
+
+    Offline point-in-polygon lookup (lon, lat) -> viertel
+
+    built once over geojson/<city>/<city>_viertel_all.geojson with an
+    STRtree; viertel are named like gis.viertel.viertel_city,
+    e.g. "Pfersee_Augsburg"
+
+    """
+
+    def __init__(self, city):
+        """
+
+        :city: city with a viertel geojson, e.g. "Augsburg" (string)
+
+        """
+        path = os.path.join(
+            script_path, "geojson", city.lower(),
+            city.lower() + "_viertel_all.geojson"
+        )
+        with open(path) as f:
+            fc = json.load(f)
+
+        self.names = []
+        geoms = []
+        for feat in fc["features"]:
+            # "Pfersee, Augsburg, Bayern, 86157, Germany"
+            display_name = feat["properties"]["display_name"].split(", ")
+            self.names.append(display_name[0] + "_" + display_name[1])
+            geoms.append(shape(feat["geometry"]))
+        self.geoms = geoms
+        self.tree = STRtree(geoms)
+
+    def lookup(self, lon, lat):
+        """
+
+        :lon: longitude (float)
+        :lat: latitude (float)
+        :returns: viertel (string) or None if outside of all viertel
+
+        """
+        hits = self.tree.query(shapely.Point(lon, lat), predicate="intersects")
+
+        return self.names[min(hits)] if len(hits) else None
+
+    def lookup_many(self, lons, lats):
+        """
+
+        vectorized lookup for arrays of coordinates
+
+        :lons: longitudes (sequence of floats)
+        :lats: latitudes (sequence of floats)
+        :returns: list of viertel (string or None), same order as input
+
+        """
+        points = shapely.points(lons, lats)
+        result = [None] * len(points)
+        # [[point index, ...], [polygon index, ...]]; points on a shared
+        # boundary hit several polygons -> take the first one
+        point_ix, poly_ix = self.tree.query(points, predicate="intersects")
+        for p, v in sorted(zip(point_ix, poly_ix), reverse=True):
+            result[p] = self.names[v]
+
+        return result
+
+
+def get_viertel_index(city):
+    """
+
+    process-wide ViertelIndex for city
+
+    :city: city (string)
+    :returns: ViertelIndex or None if there is no viertel geojson for city
+
+    """
+    key = city.lower()
+    if key not in _indexes:
+        try:
+            _indexes[key] = ViertelIndex(city)
+        except FileNotFoundError:
+            _indexes[key] = None
+
+    return _indexes[key]
+
+
+if __name__ == "__main__":
+    # backfill viertel of all geocoded inserate without any HTTP
+    import configparser
+    import psycopg2
+
+    from psycopg2.extras import execute_values
+
+    select_sql = """
+        SELECT inserat_id, city, lon, lat
+        FROM wg_gesucht.inserate
+        WHERE lon IS NOT NULL AND lat IS NOT NULL;
+        """
+
+    update_sql = """
+        UPDATE wg_gesucht.inserate AS i
+        SET viertel = v.viertel
+        FROM (VALUES %s) AS v (inserat_id, viertel)
+        WHERE i.inserat_id = v.inserat_id;
+        """
+
+    config = configparser.ConfigParser()
+    config.read(script_path + "/cfg.ini")
+    conn = psycopg2.connect(
+        dbname=config["DATABASE"]["dbname"],
+        user=config["DATABASE"]["user"],
+        host=config["DATABASE"]["host"]
+    )
+    cur = conn.cursor()
+    cur.execute(select_sql)
+    rows = cur.fetchall()
+
+    # group by city; one vectorized lookup per city
+    by_city = {}
+    for row in rows:
+        by_city.setdefault(row[1], []).append(row)
+
+    updates = []
+    for city, city_rows in by_city.items():
+        index = get_viertel_index(city) if city else None
+        if index is None:
+            continue
+        viertel = index.lookup_many(
+            [x[2] for x in city_rows], [x[3] for x in city_rows]
+        )
+        updates += [(x[0], v) for x, v in zip(city_rows, viertel)]
+
+    execute_values(cur, update_sql, updates, page_size=1000)
+    conn.commit()
+    print(f"{len(updates)} inserate aktualisiert")
+    cur.close()
+    conn.close()
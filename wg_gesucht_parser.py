@@ -3,15 +3,30 @@ import re
 import sys
 import time
 import psycopg2
-import requests
 import configparser
 
-from bs4 import BeautifulSoup
 from psycopg2.extras import Json
+from seen_ids import SeenIds
+from db_writer import BulkWriter
+from roads_plz import street_has_plz
+from detail_page import DetailPage
+from listing_extractor import iter_listing_cards, charset
+from http_client import HttpClient
+from http_cache import HttpCache
+from rate_limiter import RateLimiter
+from page_archive import PageArchive
+from crawl_state import CrawlState, KnownPages
+from pipeline import Pipeline
+from image_store import ImagePipeline
 from datetime import datetime, timedelta
-from requests.exceptions import TooManyRedirects, HTTPError
+from functools import cached_property
 
 
+# --reparse: parse the archived pages again, without network
+reparse = "--reparse" in sys.argv
+if reparse:
+    sys.argv.remove("--reparse")
+
 assert (len(sys.argv) == 3), "Too few/many arguments"
 wtype = sys.argv[1]
 city = sys.argv[2]
@@ -78,6 +93,7 @@ angaben_map = {
     "dining-set": "küche"
 }
 
+# results are listed newest first
 get_string = f"{url}{wtype_d[wtype]}-in-{city}.{city_codes[city]}.{wtype}.1."
 
 inserat_sql = """
@@ -86,12 +102,14 @@ inserat_sql = """
     kaution, abstandszahlung, verfuegbar, city, frei_ab,
     frei_bis, groesse, mitbewohner, wohnungs_type, angaben,
     details, online_seit, realtor, adress_str, inserat_id, plz) VALUES
-    (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);
+    (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+    ON CONFLICT DO NOTHING;
     """
 
 images_sql = """
-    INSERT INTO wg_gesucht.images_inserate (id, image)
-    VALUES (%s,%s);
+    INSERT INTO wg_gesucht.images_inserate (id, image_hash)
+    VALUES (%s,%s)
+    ON CONFLICT DO NOTHING;
     """
 
 inserat_ids_sql = """
@@ -99,6 +117,11 @@ inserat_ids_sql = """
     WHERE wohnungs_type = %s;
     """
 
+inserat_exists_sql = """
+    SELECT 1 FROM wg_gesucht.inserate
+    WHERE wg_gesucht_id = %s AND wohnungs_type = %s;
+    """
+
 # read config
 config = configparser.ConfigParser()
 config.read(script_path + "/cfg.ini")
@@ -114,145 +137,149 @@ conn.autocommit = True
 cur = conn.cursor()
 
 # get stored inserat_ids
-cur.execute(inserat_ids_sql, (wtype,))
-rows = cur.fetchall()
-inserat_ids = [x[0] for x in rows] if len(rows) > 0 else []
+inserat_ids = SeenIds.from_config(
+    config, f"wg_gesucht_{wtype}", cur, inserat_ids_sql, (wtype,),
+    inserat_exists_sql
+)
 print(f"Bisher {len(inserat_ids)} inserate für {city} und {wtype_d[wtype]}")
 
-def http_get(url):
-    try:
-        r = requests.get(url)
-        # check if captcha
-        if "https://www.wg-gesucht.de/cuba.html" in r.url:
-            raise TooManyRedirects("Captcha appeared! Exit")
-
-        if r.status_code == 200:
-            return r
-        else:
-            raise requests.HTTPError(
-                f"Request failed with status_code {r.status_code}"
-            )
-    except requests.ConnectionError as e:
-        print(url + " probably offline!")
-        raise e
-
-def http_get_to_soup(url):
-    r = http_get(url)
-    # only allow content type "text/html"
-    if "text/html" in r.headers["Content-Type"]:
-        return BeautifulSoup(r.text, "lxml")
-
-    else:
-        print(f"Expected Content Type text/html, but got \
-              {r.headers['Content-Type']} instead")
-        raise TypeError
-
-def get_insert_dt(soup):
-    t_string = soup.find_all(
-        "div", class_="col-sm-12 flex_space_between"
-    )[-1].find_all("span")[-1].text.lower()
+# shared, pooled http client; paced by the adaptive rate limiter, a
+# captcha (cuba.html) pauses the host and raises TooManyRedirects if it
+# is still there after the cooldown
+# every fetched page is archived for --reparse
+archive = PageArchive.from_config(config, "wg_gesucht")
+rate_limiter = RateLimiter.from_config(
+    config, "wg_gesucht", hosts=["www.wg-gesucht.de"]
+)
+client = HttpClient(
+    pool_size=8, stop_url="https://www.wg-gesucht.de/cuba.html",
+    archive=archive, rate_limiter=rate_limiter
+)
+http_get = client.get
+http_get_to_soup = client.get_to_soup
+# results pages are fetched conditionally; unchanged ones are not parsed
+http_cache = HttpCache.from_config(config)
+# images are downloaded in the background into the content-addressed store
+images = ImagePipeline.from_config(client, config, "wg_gesucht")
+
+def get_insert_dt(card, now=None):
+    # "online: 5 minuten" is relative to the fetch time
+    now = now or datetime.now()
+    t_string = card.online.lower()
     # split at "online"
     online_since = t_string.split("online: ")[1]
     # since when is offer online?
     if "minute" in online_since:
         t = int(online_since.split(" minute")[0])
-        insert_datetime = datetime.now() - timedelta(minutes=t)
+        insert_datetime = now - timedelta(minutes=t)
     elif "stunde" in online_since:
         # t = int(online_since.split(": ")[1].split("stunde")[0])
         t = int(online_since.split(" stunde")[0])
-        insert_datetime = datetime.now() - timedelta(hours=t)
+        insert_datetime = now - timedelta(hours=t)
     elif "tag" in online_since:
         t = int(online_since.split(" tag")[0])
-        insert_datetime = datetime.now() - timedelta(days=t)
+        insert_datetime = now - timedelta(days=t)
     else:
         insert_datetime = datetime.strptime(online_since, "%d.%m.%Y")
 
     return insert_datetime
 
-def get_image(soup):
-    img_url = soup.find("a").get("style").split("image: ")[1][4:-2]
-    if "placeholder" in img_url:
-        img_raw = None
-    else:
-        try:
-            img_raw = http_get(img_url).content
-        except HTTPError:
-            img_raw = None
+def get_image_url(card):
+    img_url = card.img_style.split("image: ")[1][4:-2]
+    # placeholder -> no image available
+    return None if "placeholder" in img_url else img_url
 
-    return img_raw
+def get_id(card):
+    return card.id
 
-def get_id(soup):
-    inserat_id = soup.get("id").split("-")[-1]
+def is_available(card):
+    return not card.deactivated
 
-    return inserat_id
+class Listing:
 
-def is_available(soup):
-    if soup.find("span", class_="ribbon-deactivated"):
-        available = False
-    else:
-        available = True
+    """
+
+    Lazy record of one listing card of a results page
 
-    return available
+    every field is computed on first access and memoized, so the cheap
+    id decides about a card before anything else is derived from it
 
-def get_details_from_main(soup):
+    """
+
+    def __init__(self, card, now=None):
+        """
+
+        :card: ListingCard
+        :now: fetch time of the results page (datetime)
+
+        """
+        self.card = card
+        self.now = now
+
+    @cached_property
+    def id(self):
+        return get_id(self.card)
+
+    @cached_property
+    def url(self):
+        return url + self.card.href
+
+    @cached_property
+    def insert_dt(self):
+        return get_insert_dt(self.card, self.now)
+
+    @cached_property
+    def inserat_id(self):
+        # cast to int to strip away the "time" info
+        return f"{self.id}_{wtype}_{int(self.insert_dt.timestamp())}"
+
+    @cached_property
+    def img_url(self):
+        return get_image_url(self.card)
+
+    @cached_property
+    def available(self):
+        return is_available(self.card)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "realtor": self.card.realtor,
+            "insert_dt": self.insert_dt,
+            "img_url": self.img_url,
+            "available": self.available,
+            "inserat_id": self.inserat_id
+        }
+
+def get_details_from_main(html, now=None, encoding="utf-8"):
     """
 
     retrieve availabe ids of adverts from main page
     also generates info like realtor and ids
-    :soup: soup of main page withe inserate (beautifulsoup object)
+    :html: main page with inserate (bytes)
+    :now: fetch time of html; default now (datetime)
+    :encoding: charset of html (string)
 
-    :returns: list of ids to available wgs
+    :returns: list of ids to available wgs; empty if all are known
 
     """
-    # wgs list
-    wgs_list = soup.find_all("div", id=re.compile("^liste-details-ad"))
-    # filter out "hidden" items
-    wgs_list = [x for x in wgs_list if "hidden" not in x.get("id")]
-    # filter out "übernachtung"
-    wgs_list = [
-        x for x in wgs_list if not x.find("span", title="übernachtung")
-    ]
-    # filter out "tauschangebot"
-    wgs_list = [
-        x for x in wgs_list if not x.find("span", title="tauschangebot")
-    ]
-    # filter out already parsed wgs
-    wgs_list = [x for x in wgs_list if int(get_id(x)) not in inserat_ids]
-    if len(wgs_list) == 0:
-        print(f"{datetime.now()} keine neuen Inserate mehr für {city}")
-        sys.exit(0)
-
-    # get genral info of wg inserat from main page
-    wg_items = []
-
-    for x in wgs_list:
-        wg_gesucht_id = get_id(x)
-        inserat_url = url + x.find("a").get("href")
-        realtor = x.find_all(
-            "div", class_="col-sm-12 flex_space_between"
-        )[-1].span.text
-        insert_dt = get_insert_dt(x)
-        img_raw = get_image(x)
-        available = is_available(x)
-        # cast to int to strip away the "time" info
-        dt_date_only = int(get_insert_dt(x).timestamp())
-        inserat_id = f"{get_id(x)}_{wtype}_{dt_date_only}"
-
-        inserat_d = {
-            "id": wg_gesucht_id,
-            "url": inserat_url,
-            "realtor": realtor,
-            "insert_dt": insert_dt,
-            "img_raw": img_raw,
-            "available": available,
-            "inserat_id": inserat_id
-        }
-        wg_items.append(inserat_d)
+    # single streaming pass; hidden, übernachtung and tauschangebot
+    # cards are already filtered out by the extractor
+    listings = (
+        Listing(x, now) for x in iter_listing_cards(html, encoding)
+    )
 
-    return wg_items
+    # filter out already parsed wgs; only their id is computed
+    return [x.to_dict() for x in listings if int(x.id) not in inserat_ids]
 
-def parse_wg(details_d):
-    soup = http_get_to_soup(details_d["url"])
+def parse_wg(details_d, html=None):
+    # html may be prefetched (Pipeline); otherwise get it here
+    if html is None:
+        html = http_get(details_d["url"]).text
+    # panel headlines are indexed once
+    page = DetailPage(html)
+    soup = page.soup
 
     # get title
     main = soup.find("div", id="main_column")
@@ -324,13 +351,8 @@ def parse_wg(details_d):
     }
 
     # angaben zum objekt
-    h3 = soup.find_all(
-        "h3", class_="headline headline-detailed-view-panel-title"
-    )
     try:
-        angaben_row = [
-            x.parent for x in h3 if x.text.strip() == "Angaben zum Objekt"
-        ][0]
+        angaben_row = page.panel("Angaben zum Objekt").parent
         # filter hidden div tags and div tags that have a span tag
         a_filtered = [
             x for x in angaben_row.find_all("div") if (
@@ -344,7 +366,7 @@ def parse_wg(details_d):
              " ".join(x.text.replace("\n", "").strip().split())
              ) for x in a_filtered
         ])
-    except IndexError:
+    except KeyError:
         angaben_d = None
 
     # rename keys
@@ -361,9 +383,7 @@ def parse_wg(details_d):
     # roommates
     # nur bei wtype 0 (WGs) nach Details suchen
     if wtype == "0":
-        details = [
-            x for x in h3 if x.text.strip() == "WG-Details"
-        ][0].parent.parent
+        details = page.panel("WG-Details").parent.parent
         d_list = [
             " ".join(x.text.strip().replace("\n", "").split()) for x in
                   details.find_all("li")
@@ -436,9 +456,7 @@ def parse_wg(details_d):
 
     # Adresse
     # get respective "div" element
-    adresse_row = [
-        x for x in h3 if x.text.strip() == "Adresse"
-    ][0].parent.a
+    adresse_row = page.panel("Adresse").parent.a
     adress_lines = adresse_row.text.splitlines()
     adress_lines = [x.strip() for x in adress_lines if x.strip()]
 
@@ -458,14 +476,17 @@ def parse_wg(details_d):
     except AssertionError:
         plz = None
 
+    # plausibility check against local street -> plz table
+    if plz and len(adress_lines) == 2:
+        if street_has_plz(city, adress_lines[0], plz) is False:
+            print(f"plz {plz} passt nicht zu {adress_lines[0]}")
+
     details_d["adress_str"] = adress_str
     details_d["plz"] = plz
 
     # available: "frei_ab", "frei_bis"
     if details_d["available"]:
-        avlblty_row = [
-            x for x in h3 if x.text.strip() == "Verfügbarkeit"
-        ][0].parent.parent
+        avlblty_row = page.panel("Verfügbarkeit").parent.parent
         avlblty_p = avlblty_row.p.text.splitlines()
         avlblty_l = [
             x.strip() for x in avlblty_p if x.strip() != ""
@@ -491,67 +512,183 @@ def parse_wg(details_d):
 
     return details_d
 
-# read current counter
-with open(script_path + "/wg_counter_" + wtype) as f:
-    wg_counter = f.read()
-print("wg-gesucht momentan bei " + wg_counter)
-
-# get available pages
-soup = http_get_to_soup(get_string + "0.html")
-# find page_bar with numbers of pages
-page_bar = soup.find_all("ul", class_="pagination pagination-sm")[0]
-page_counter = int(page_bar.find_all("li")[-2].get_text().strip())
-print(f"There are {page_counter} pages available")
-
-# iterate lists of inserate
-for i in range(int(wg_counter), page_counter):
-    print(get_string + f"{i}.html")
-    soup = http_get_to_soup(get_string + f"{i}.html")
-    # get initial details from main listing
-    main_details = get_details_from_main(soup)
-
-    # filter out already parsed wgs
-    main_details = [
-        x for x in main_details if x["inserat_id"] not in inserat_ids
+def fetch_wg(d):
+    print("parsing WG " + d["url"])
+    # captcha raises TooManyRedirects and stops the whole run
+    return http_get(d["url"]).content
+
+def write_wg(d, inserat_parsed):
+    print(inserat_parsed)
+    preped_l = [
+        inserat_parsed["id"],
+        inserat_parsed["title"],
+        inserat_parsed["costs"]["miete_gesamt"],
+        inserat_parsed["costs"]["miete_kalt"],
+        inserat_parsed["costs"]["miete_sonstige"],
+        inserat_parsed["costs"]["nebenkosten"],
+        inserat_parsed["costs"]["kaution"],
+        inserat_parsed["costs"]["abstandszahlung"],
+        inserat_parsed["available"],
+        city,
+        inserat_parsed["availability"]["frei_ab"],
+        inserat_parsed["availability"]["frei_bis"],
+        Json(inserat_parsed["sizes"]),
+        inserat_parsed["roommates_b"],
+        wtype,
+        Json(inserat_parsed["angaben"]),
+        Json(inserat_parsed["details"]),
+        inserat_parsed["insert_dt"],
+        inserat_parsed["realtor"],
+        inserat_parsed["adress_str"],
+        inserat_parsed["inserat_id"],
+        inserat_parsed["plz"],
     ]
 
-    print("parsing WGS")
-    for d in main_details:
-        print("parsing WG " + d["url"])
-        inserat_parsed = parse_wg(d)
-        print({k: v for k, v in inserat_parsed.items() if k != "img_raw"})
-        preped_l = [
-            inserat_parsed["id"],
-            inserat_parsed["title"],
-            inserat_parsed["costs"]["miete_gesamt"],
-            inserat_parsed["costs"]["miete_kalt"],
-            inserat_parsed["costs"]["miete_sonstige"],
-            inserat_parsed["costs"]["nebenkosten"],
-            inserat_parsed["costs"]["kaution"],
-            inserat_parsed["costs"]["abstandszahlung"],
-            inserat_parsed["available"],
-            city,
-            inserat_parsed["availability"]["frei_ab"],
-            inserat_parsed["availability"]["frei_bis"],
-            Json(inserat_parsed["sizes"]),
-            inserat_parsed["roommates_b"],
-            wtype,
-            Json(inserat_parsed["angaben"]),
-            Json(inserat_parsed["details"]),
-            inserat_parsed["insert_dt"],
-            inserat_parsed["realtor"],
-            inserat_parsed["adress_str"],
-            inserat_parsed["inserat_id"],
-            inserat_parsed["plz"],
+    writer.add(inserat_sql, preped_l)
+    image_hash = None
+    # no image downloads in --reparse mode
+    if d["img_url"] and not reparse:
+        image_hash = images.submit(d["img_url"]).result()
+    writer.add(images_sql, [inserat_parsed["inserat_id"], image_hash])
+    inserat_ids.add(inserat_parsed["id"])
+    written.append(inserat_parsed["id"])
+    if len(written) >= checkpoint_every:
+        checkpoint()
+
+def checkpoint():
+    # commit written inserate, then record them in the crawl state
+    writer.flush()
+    inserat_ids.save()
+    # --reparse does not touch the state of the live crawl
+    if not reparse:
+        state.listings_done(written)
+    written.clear()
+
+# detail pages are fetched in threads and parsed in worker processes;
+# stage sizes in [PIPELINE] of cfg.ini. the workers fork here, after
+# the parse functions and before any thread (images, fetchers) exist
+pipeline = Pipeline.from_config(config, fetch_wg, parse_wg, write_wg)
+# inserate and images are written in one transaction per checkpoint
+writer = BulkWriter(conn)
+# crawl progress: page and written inserate of it
+state = CrawlState.from_config(
+    config, "wg_gesucht", city, wtype,
+    legacy_counter=script_path + "/wg_counter_" + wtype
+)
+checkpoint_every = config.getint(
+    "CRAWL_STATE", "checkpoint_every", fallback=10
+)
+# ids written since the last checkpoint
+written = []
+
+def reparse_archive():
+    """
+
+    run the current parsers over all archived results pages (oldest
+    first) and the newest archived detail page of every listing;
+    listings not in the db yet are written. no network
+
+    :returns: number of written inserate (int)
+
+    """
+    entries = archive.index()
+    details = archive.latest(entries)
+
+    def fetch_archived(d):
+        return archive.read(details[d["url"]]).body
+
+    n_new = 0
+    for entry in entries:
+        if not entry.url.startswith(get_string):
+            continue
+        record = archive.read(entry)
+        main_details = get_details_from_main(
+            record.body, datetime.fromtimestamp(record.ts),
+            charset(record.content_type)
+        )
+        # detail pages never fetched can not be parsed offline
+        jobs = [d for d in main_details if d["url"] in details]
+        print(f"{entry.url}: {len(jobs)} inserate")
+        n_new += pipeline.run(jobs, fetch=fetch_archived)
+        checkpoint()
+
+    return n_new
+
+def crawl():
+    """
+
+    incremental crawl: resume an interrupted run or start at page 0
+    and stop after [CRAWL] known_pages consecutive pages without new
+    inserate
+
+    :returns: number of new inserate (int)
+
+    """
+    start_page = state.begin()
+    print(f"wg-gesucht momentan bei {start_page}")
+
+    # get available pages
+    soup = http_get_to_soup(get_string + "0.html")
+    # find page_bar with numbers of pages
+    page_bar = soup.find_all("ul", class_="pagination pagination-sm")[0]
+    page_counter = int(page_bar.find_all("li")[-2].get_text().strip())
+    print(f"There are {page_counter} pages available")
+
+    known_pages = KnownPages.from_config(config)
+    n_new = 0
+    # iterate lists of inserate
+    for i in range(start_page, page_counter):
+        page_url = get_string + f"{i}.html"
+        print(page_url)
+        page, changed = client.get_if_changed(page_url, http_cache)
+        if changed:
+            # get initial details from main listing
+            # already parsed wgs are filtered out there
+            main_details = get_details_from_main(
+                page.content,
+                encoding=charset(page.headers.get("Content-Type"))
+            )
+        else:
+            # processed by an earlier run and unchanged since
+            print("unverändert")
+            main_details = []
+        if known_pages.update(len(main_details)):
+            print(f"{datetime.now()} keine neuen Inserate mehr für {city}")
+            break
+        # written before an interruption
+        main_details = [
+            d for d in main_details if not state.is_done(d["id"])
         ]
 
-        cur.execute(inserat_sql, preped_l)
-        cur.execute(images_sql,
-                    [inserat_parsed["inserat_id"], inserat_parsed["img_raw"]]
-                    )
+        # images download while the detail pages are fetched and parsed
+        for d in main_details:
+            if d["img_url"]:
+                images.submit(d["img_url"])
+
+        print("parsing WGS")
+        n_new += pipeline.run(main_details)
+
+        checkpoint()
+        if changed:
+            http_cache.set(page_url, page)
+        state.page_done(i)
+
+    state.complete()
+
+    return n_new
 
-    with open(script_path + "/wg_counter_" + wtype, "w") as f:
-        f.write(str(i))
+if reparse:
+    n_new = reparse_archive()
+else:
+    n_new = crawl()
+print(f"{n_new} neue Inserate für {city} und {wtype_d[wtype]}")
 
+pipeline.close()
+images.close()
+print(images.summary())
+print(http_cache.summary())
+http_cache.close()
+print(client.stats_summary())
+client.close()
 cur.close()
 conn.close()
@@ -1,15 +1,16 @@
-from bs4 import BeautifulSoup
 import configparser
 from datetime import datetime, timedelta
-import geopandas as gpd
 import os
-import pandas as pd
-import psycopg2
-from psycopg2.extras import Json
 import re
-import requests
 import sys
 
+from seen_ids import SeenIds
+from crawl_state import CrawlState, KnownPages
+from geodata_cache import read_geodata
+
+# heavy imports (psycopg2, requests, bs4, shapely) are deferred to first
+# use, so importing this module is cheap and has no side effects
+
 
 class WohnungsMarkt:
 
@@ -30,14 +31,88 @@ class WohnungsMarkt:
         "Augsburg": "2"
     }
 
-    conn = psycopg2.connect("dbname=wohnungsmarkt_db user=sepp")
     config = configparser.ConfigParser()
-    session = requests.Session()
+    # db connection, http client and image pipeline are created on first use
+    _conn = None
+    _client = None
+    _images = None
 
     def __init__(self):
+        self.conn = self.get_connection()
         self.conn.autocommit = True
         self.cur = self.conn.cursor()
 
+    @classmethod
+    def get_connection(cls):
+        """
+
+        shared db connection, opened on first call
+
+        :returns: psycopg2 connection
+
+        """
+        if WohnungsMarkt._conn is None or WohnungsMarkt._conn.closed:
+            import psycopg2
+            WohnungsMarkt._conn = psycopg2.connect(
+                "dbname=wohnungsmarkt_db user=sepp"
+            )
+
+        return WohnungsMarkt._conn
+
+    @property
+    def client(self):
+        """
+
+        shared, pooled http client; created on first access
+
+        paced by an adaptive rate limiter ([RATE_LIMIT_WOHNUNGSMARKT]
+        in cfg.ini); a captcha pauses wg-gesucht and raises
+        TooManyRedirects if it is still there after the cooldown
+
+        """
+        if WohnungsMarkt._client is None:
+            from http_client import HttpClient
+            from rate_limiter import RateLimiter
+            # nominatim usage policy: max. 1 request per second
+            rate_limiter = RateLimiter.from_config(
+                self.config, "wohnungsmarkt", hosts=[
+                    "www.wg-gesucht.de", "www.immobilienscout24.de",
+                    "nominatim.openstreetmap.org"
+                ], max_rate=1
+            )
+            WohnungsMarkt._client = HttpClient(
+                stop_url="https://www.wg-gesucht.de/cuba.html",
+                rate_limiter=rate_limiter
+            )
+
+        return WohnungsMarkt._client
+
+    @property
+    def images(self):
+        """
+
+        shared image pipeline into the content-addressed image store
+        ([IMAGES] and [IMAGES_WG_GESUCHT] in cfg.ini); created on
+        first access
+
+        """
+        if WohnungsMarkt._images is None:
+            from image_store import ImagePipeline
+            WohnungsMarkt._images = ImagePipeline.from_config(
+                self.client, self.config, "wg_gesucht"
+            )
+
+        return WohnungsMarkt._images
+
+    @property
+    def session(self):
+        """
+
+        requests session of client; login cookies live here
+
+        """
+        return self.client.session
+
     def http_get(self, url):
         """
         Simple Helper method to HTTP GET urls and validate
@@ -45,16 +120,7 @@ class WohnungsMarkt:
         :url: the url to get (string) -> default get_string
         :returns: requests Response object
         """
-        try:
-            r = requests.get(url)
-            if r.status_code == 200:
-                return r
-            else:
-                raise requests.HTTPError(
-                    f"Request failed with status_code {r.status_code}"
-                )
-        except requests.ConnectionError:
-            raise url + " probably offline!"
+        return self.client.get(url)
 
     def http_get_to_soup(self, url):
         """
@@ -70,6 +136,7 @@ class WohnungsMarkt:
 
         # only allow content type "text/html"
         if "text/html" in r.headers["Content-Type"]:
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(r.text, "lxml")
             self.soup = soup
             return soup
@@ -100,12 +167,14 @@ class WgGesucht(WohnungsMarkt):
         kaution, abstandszahlung, verfuegbar, online_seit, stadt, frei_ab,
         frei_bis, adresse, groesse, mitbewohner, wohnungs_type, angaben,
         details) VALUES
-        (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s, %s);
+        (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s, %s)
+        ON CONFLICT DO NOTHING;
         """
 
     images_sql = """
-        INSERT INTO wg_gesucht.images_inserate (id, image)
-        VALUES (%s,%s);
+        INSERT INTO wg_gesucht.images_inserate (id, image_hash)
+        VALUES (%s,%s)
+        ON CONFLICT DO NOTHING;
         """
 
     inserat_ids_sql = """
@@ -114,11 +183,21 @@ class WgGesucht(WohnungsMarkt):
         AND wohnungs_type = %s;
         """
 
+    inserat_exists_sql = """
+        SELECT 1 FROM wg_gesucht.inserate
+        WHERE inserat_id = %s
+        AND stadt = %s
+        AND wohnungs_type = %s;
+        """
+
     # store current page content
     p_cnt = 0
     soup = None
     urls = []
     current_url = None
+    # geodata is loaded lazily on first access
+    _viertel = None
+    _roads = None
 
     def __init__(self, wtype, stadt):
         """
@@ -138,14 +217,25 @@ class WgGesucht(WohnungsMarkt):
         self.config.read(
             os.path.dirname(os.path.realpath(__file__)) + "/cfg.ini"
         )
-        self.viertel = self.__get_viertel(stadt)
-        self.roads = self.__get_roads(stadt)
         self.inserat_ids = self.__get_inserat_ids(stadt, wtype)
         self.__sign_in(
             "https://www.wg-gesucht.de/ajax/api/Smp/api.php?action=login"
         )
-        self.get_string = self.url + self.wtype_d[wtype] \
-        + "-in-" + stadt + "." + self.city_codes[stadt] + f".{wtype}.0."
+        self.get_string = self.build_get_string(wtype, stadt)
+
+    @classmethod
+    def build_get_string(cls, wtype, stadt):
+        """
+
+        url prefix of result pages; append "<page>.html"
+
+        :wtype: wohnungstype code (int)
+        :stadt: welche Stadt? (string)
+        :returns: url prefix (string)
+
+        """
+        return cls.url + cls.wtype_d[wtype] \
+        + "-in-" + stadt + "." + cls.city_codes[stadt] + f".{wtype}.0."
 
     def __sign_in(self, login_str):
         """
@@ -154,6 +244,7 @@ class WgGesucht(WohnungsMarkt):
         sets requests session
 
         """
+        import requests
 
         payload = {
             "login_email_username": self.config["WGGESUCHT"]["email"],
@@ -186,13 +277,39 @@ class WgGesucht(WohnungsMarkt):
         :city: city to filter inserate (string)
         :wtype: wtype to filter inserate (string)
 
-        :returns: list of inserat_ids
+        :returns: SeenIds of inserat_ids
+
+        """
+        return SeenIds.from_config(
+            self.config, f"wohnungsmarkt_{city}_{wtype}", self.cur,
+            self.inserat_ids_sql, (city, wtype,), self.inserat_exists_sql
+        )
+
+    @property
+    def viertel(self):
+        """
+
+        administrative areas of city (GeoDataFrame)
+        loaded on first access
+
+        """
+        if self._viertel is None:
+            self._viertel = self.__get_viertel(self.stadt)
+
+        return self._viertel
 
+    @property
+    def roads(self):
         """
-        self.cur.execute(self.inserat_ids_sql, (city, wtype,))
-        rows = self.cur.fetchall()
 
-        return [x[0] for x in rows] if len(rows) > 0 else []
+        roads of city (GeoDataFrame)
+        loaded on first access
+
+        """
+        if self._roads is None:
+            self._roads = self.__get_roads(self.stadt)
+
+        return self._roads
 
     def __get_viertel(self, city):
         """
@@ -200,8 +317,6 @@ class WgGesucht(WohnungsMarkt):
         Loads administrative areas of city
         areas are stored as geojson files
 
-        viertel are stored as attribute
-
         :city: city to build geodatframe from (string)
 
         """
@@ -212,12 +327,10 @@ class WgGesucht(WohnungsMarkt):
                     + "/geojson/" + city.lower() + "/viertel")
         )[0]
         # create GeoDataFrame from all available "viertel"
-        gdf = gpd.GeoDataFrame(
-            pd.concat([
-                gpd.read_file(root + "/" + file) for file in files
-            ])
+        # cached per process and on disk
+        return read_geodata(
+            city.lower() + "_viertel", [root + "/" + file for file in files]
         )
-        return gdf
 
     def __get_roads(self, city):
         """
@@ -228,12 +341,11 @@ class WgGesucht(WohnungsMarkt):
 
         """
         # create GeoDataFrame from "city"_roads.geojson file
-        gdf = gpd.read_file(
+        # cached per process and on disk
+        return read_geodata(city.lower() + "_roads", [
             os.path.dirname(os.path.realpath(__file__)) + "/geojson/" \
             + city.lower() + "/" + city.lower() + "_roads.geojson"
-        )
-
-        return gdf
+        ])
 
     def nominatim_request(self, string_l):
         """
@@ -254,9 +366,19 @@ class WgGesucht(WohnungsMarkt):
             # FC should only have one feature if there is a
             # housenumber provided
             if len(json["features"]) == 1:
-                display_n = json["features"][0]["properties"]["display_name"]
-                # viertel is the 4th item in the string
-                viertel = display_n.split(", ")[3]
+                feature = json["features"][0]
+                from viertel_index import get_viertel_index
+                viertel_index = get_viertel_index(self.stadt)
+                if viertel_index and feature["geometry"]["type"] == "Point":
+                    # local point-in-polygon lookup; "Pfersee_Augsburg"
+                    lon, lat = feature["geometry"]["coordinates"]
+                    viertel = viertel_index.lookup(lon, lat)
+                    if viertel:
+                        viertel = viertel.rsplit("_", 1)[0]
+                else:
+                    display_n = feature["properties"]["display_name"]
+                    # viertel is the 4th item in the string
+                    viertel = display_n.split(", ")[3]
         else:
             print("wrong format")
 
@@ -348,7 +470,8 @@ class WgGesucht(WohnungsMarkt):
         Get wg image
 
         :soup: BeautifulSoup object
-        :returns: TODO
+        :returns: sha256 of image in the image store (string);
+                  None if there is no image
 
         """
         # TODO bei request wird nur 1 Bild angezeigt -> Versuchen alle Bilder
@@ -358,16 +481,11 @@ class WgGesucht(WohnungsMarkt):
         # wg images are optional
         # https://img.wg-gesucht.de/ is the default img url
         if img_link == "https://img.wg-gesucht.de/":
-            img_raw = None
-        else:
-            # wg_gesucht seems to delete images
-            # http requests result in 404
-            try:
-                img_raw = self.http_get(img_link).content
-            except requests.exceptions.HTTPError:
-                img_raw = None
+            return None
 
-        return img_raw
+        # wg_gesucht seems to delete images
+        # http requests result in 404 -> None
+        return self.images.submit(img_link).result()
 
     def get_address(self, soup):
         """
@@ -499,25 +617,20 @@ class WgGesucht(WohnungsMarkt):
             "transfer_fee": abst
         }
 
-    def get_angaben(self, soup):
+    def get_angaben(self, page):
         """
 
         Get angaben of wg
         (house type, wifi, furniture, parking, ...)
 
-        :soup: BeautifulSoup object
+        :page: DetailPage object
         :returns: dict
 
         """
 
         # angaben zum objekt
-        h3 = soup.find_all(
-            "h3", class_="headline headline-detailed-view-panel-title"
-        )
         try:
-            angaben_row = [
-                x.parent for x in h3 if x.text.strip() == "Angaben zum Objekt"
-            ][0]
+            angaben_row = page.panel("Angaben zum Objekt").parent
             # filter hidden div tags and div tags that have a span tag
             a_filtered = [
                 x for x in angaben_row.find_all("div") if (
@@ -531,27 +644,22 @@ class WgGesucht(WohnungsMarkt):
                  " ".join(x.text.replace("\n", "").strip().split())
                  ) for x in a_filtered
             ])
-        except IndexError:
+        except KeyError:
             angaben_dict = None
 
         return angaben_dict
 
-    def get_roommates(self, soup):
+    def get_roommates(self, page):
         """
 
         Get roommates of wg
 
-        :soup: BeautifulSoup object
+        :page: DetailPage object
         :returns: bytes
 
         """
 
-        h3 = soup.find_all(
-            "h3", class_="headline headline-detailed-view-panel-title"
-        )
-        details = [
-            x for x in h3 if x.text.strip() == "WG-Details"
-        ][0].parent.parent
+        details = page.panel("WG-Details").parent.parent
         d_list = [
             " ".join(x.text.strip().replace("\n", "").split()) for x in
                   details.find_all("li")
@@ -565,7 +673,7 @@ class WgGesucht(WohnungsMarkt):
         else:
             # parse roommates:
             # 4 Bytes [FF: All, FF: Women, FF: Men, FF: Diverse]
-            r = soup.find_all("span", title=re.compile("WG"))[0]
+            r = page.soup.find_all("span", title=re.compile("WG"))[0]
             r_title = r.get("title")
             r_splits = r_title.split(" ")
             # format for roommates: 2er WG (1 Frau und 0 Männer und 0 Divers)
@@ -577,24 +685,19 @@ class WgGesucht(WohnungsMarkt):
 
         return roommates_bytes
 
-    def get_details(self, soup):
+    def get_details(self, page):
         """
 
         Get details of wg
         (roommates, constellation, age, smoking, ...)
 
-        :soup: BeautifulSoup object
+        :page: DetailPage object
         :returns: dict
 
         """
 
         # wg-details
-        h3 = soup.find_all(
-            "h3", class_="headline headline-detailed-view-panel-title"
-        )
-        details = [
-            x for x in h3 if x.text.strip() == "WG-Details"
-        ][0].parent.parent
+        details = page.panel("WG-Details").parent.parent
         d_list = [
             " ".join(x.text.strip().replace("\n", "").split()) for x in
                   details.find_all("li")
@@ -617,25 +720,20 @@ class WgGesucht(WohnungsMarkt):
             "looking_for": d_list[7]
         }
 
-    def get_availability(self, soup):
+    def get_availability(self, page):
         """
 
         Get availability
         (from, until, online since)
 
-        :soup: BeautifulSoup object
+        :page: DetailPage object
         :returns: avlblty_dict
 
         """
 
-        if self.check_wg_available(soup):
+        if self.check_wg_available(page.soup):
             # availability
-            h3 = soup.find_all(
-                "h3", class_="headline headline-detailed-view-panel-title"
-            )
-            avlblty_row = [
-                x for x in h3 if x.text.strip() == "Verfügbarkeit"
-            ][0].parent.parent
+            avlblty_row = page.panel("Verfügbarkeit").parent.parent
             avlblty_p = avlblty_row.p.text.splitlines()
             avlblty_l = [
                 x.strip() for x in avlblty_p if x.strip() != ""
@@ -651,7 +749,7 @@ class WgGesucht(WohnungsMarkt):
             else:
                 avlblty_dict["frei_bis"] = None
             # since when is offer online?
-            online_raw = soup.find_all("b", class_="noprint")
+            online_raw = page.soup.find_all("b", class_="noprint")
             online_since = online_raw[0].text.strip().split(": ")[1]
             # deduct time delta
             if "Minute" in online_since:
@@ -711,18 +809,21 @@ class WgGesucht(WohnungsMarkt):
         if "https://www.wg-gesucht.de/cuba.html" in self.current_url:
             return 1
         else:
+            from detail_page import DetailPage
+            # panel headlines are indexed once for all getters
+            page = DetailPage(soup)
             return {
                 "inserat_id": inserat_id,
                 "title": self.get_title(soup),
                 "address": self.get_address(soup),
                 "sizes": self.get_sizes(soup),
                 "costs": self.get_costs(soup),
-                "angaben": self.get_angaben(soup),
-                "details": self.get_details(soup),
-                "availability": self.get_availability(soup),
+                "angaben": self.get_angaben(page),
+                "details": self.get_details(page),
+                "availability": self.get_availability(page),
                 "check_available": self.check_wg_available(soup),
                 "wg_images": self.get_wg_images(soup),
-                "roommates": self.get_roommates(soup)
+                "roommates": self.get_roommates(page)
             }
 
     def insert_into_inserate(self, parsed_wg):
@@ -734,6 +835,8 @@ class WgGesucht(WohnungsMarkt):
         :parsed_wg: items to fill into wg_gesucht.inserate (dict)
 
         """
+        from psycopg2.extras import Json
+
         preped_l = [
             parsed_wg["inserat_id"],
             parsed_wg["address"]["viertel"] + "_" + self.stadt,
@@ -763,20 +866,22 @@ class WgGesucht(WohnungsMarkt):
         self.insert_into_images(
             parsed_wg["inserat_id"], parsed_wg["wg_images"]
         )
+        # saved once per page (crawl)
+        self.inserat_ids.add(parsed_wg["inserat_id"])
 
-    def insert_into_images(self, inserat_id, images_bytes):
+    def insert_into_images(self, inserat_id, image_hash):
         """
 
-        Inserts bytes of image into DB
+        Inserts hash of stored image into DB
         Used in conjunction with self.get_wg_images
 
         :inserat_id: uid of inserat
-        :images_bytes: bytes of image to fill into wg_gesucht.images_inserate
+        :image_hash: sha256 of image in the image store (string)
 
         """
         self.execute_sql(self.cur,
                          self.images_sql,
-                         [inserat_id, images_bytes])
+                         [inserat_id, image_hash])
 
 class ImmoScout(WohnungsMarkt):
 
@@ -790,12 +895,14 @@ class ImmoScout(WohnungsMarkt):
         kaution, abstandszahlung, verfuegbar, online_seit, stadt, frei_ab,
         frei_bis, adresse, groesse, mitbewohner, wohnungs_type, angaben,
         details) VALUES
-        (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s, %s);
+        (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s, %s)
+        ON CONFLICT DO NOTHING;
         """
 
     images_sql = """
-        INSERT INTO wg_gesucht.images_inserate (id, image)
-        VALUES (%s,%s);
+        INSERT INTO wg_gesucht.images_inserate (id, image_hash)
+        VALUES (%s,%s)
+        ON CONFLICT DO NOTHING;
         """
 
     inserat_ids_sql = """
@@ -1029,25 +1136,20 @@ class ImmoScout(WohnungsMarkt):
             "transfer_fee": abst
         }
 
-    def get_angaben(self, soup):
+    def get_angaben(self, page):
         """
 
         Get angaben of wg
         (house type, wifi, furniture, parking, ...)
 
-        :soup: BeautifulSoup object
+        :page: DetailPage object
         :returns: dict
 
         """
 
         # angaben zum objekt
-        h3 = soup.find_all(
-            "h3", class_="headline headline-detailed-view-panel-title"
-        )
         try:
-            angaben_row = [
-                x.parent for x in h3 if x.text.strip() == "Angaben zum Objekt"
-            ][0]
+            angaben_row = page.panel("Angaben zum Objekt").parent
             # filter hidden div tags and div tags that have a span tag
             a_filtered = [
                 x for x in angaben_row.find_all("div") if (
@@ -1061,27 +1163,22 @@ class ImmoScout(WohnungsMarkt):
                  " ".join(x.text.replace("\n", "").strip().split())
                  ) for x in a_filtered
             ])
-        except IndexError:
+        except KeyError:
             angaben_dict = None
 
         return angaben_dict
 
-    def get_roommates(self, soup):
+    def get_roommates(self, page):
         """
 
         Get roommates of wg
 
-        :soup: BeautifulSoup object
+        :page: DetailPage object
         :returns: bytes
 
         """
 
-        h3 = soup.find_all(
-            "h3", class_="headline headline-detailed-view-panel-title"
-        )
-        details = [
-            x for x in h3 if x.text.strip() == "WG-Details"
-        ][0].parent.parent
+        details = page.panel("WG-Details").parent.parent
         d_list = [
             " ".join(x.text.strip().replace("\n", "").split()) for x in
                   details.find_all("li")
@@ -1095,7 +1192,7 @@ class ImmoScout(WohnungsMarkt):
         else:
             # parse roommates:
             # 4 Bytes [FF: All, FF: Women, FF: Men, FF: Diverse]
-            r = soup.find_all("span", title=re.compile("WG"))[0]
+            r = page.soup.find_all("span", title=re.compile("WG"))[0]
             r_title = r.get("title")
             r_splits = r_title.split(" ")
             # format for roommates: 2er WG (1 Frau und 0 Männer und 0 Divers)
@@ -1107,24 +1204,19 @@ class ImmoScout(WohnungsMarkt):
 
         return roommates_bytes
 
-    def get_details(self, soup):
+    def get_details(self, page):
         """
 
         Get details of wg
         (roommates, constellation, age, smoking, ...)
 
-        :soup: BeautifulSoup object
+        :page: DetailPage object
         :returns: dict
 
         """
 
         # wg-details
-        h3 = soup.find_all(
-            "h3", class_="headline headline-detailed-view-panel-title"
-        )
-        details = [
-            x for x in h3 if x.text.strip() == "WG-Details"
-        ][0].parent.parent
+        details = page.panel("WG-Details").parent.parent
         d_list = [
             " ".join(x.text.strip().replace("\n", "").split()) for x in
                   details.find_all("li")
@@ -1147,25 +1239,20 @@ class ImmoScout(WohnungsMarkt):
             "looking_for": d_list[7]
         }
 
-    def get_availability(self, soup):
+    def get_availability(self, page):
         """
 
         Get availability
         (from, until, online since)
 
-        :soup: BeautifulSoup object
+        :page: DetailPage object
         :returns: avlblty_dict
 
         """
 
-        if self.check_wg_available(soup):
+        if self.check_wg_available(page.soup):
             # availability
-            h3 = soup.find_all(
-                "h3", class_="headline headline-detailed-view-panel-title"
-            )
-            avlblty_row = [
-                x for x in h3 if x.text.strip() == "Verfügbarkeit"
-            ][0].parent.parent
+            avlblty_row = page.panel("Verfügbarkeit").parent.parent
             avlblty_p = avlblty_row.p.text.splitlines()
             avlblty_l = [
                 x.strip() for x in avlblty_p if x.strip() != ""
@@ -1181,7 +1268,7 @@ class ImmoScout(WohnungsMarkt):
             else:
                 avlblty_dict["frei_bis"] = None
             # since when is offer online?
-            online_raw = soup.find_all("b", class_="noprint")
+            online_raw = page.soup.find_all("b", class_="noprint")
             online_since = online_raw[0].text.strip().split(": ")[1]
             # deduct time delta
             if "Minute" in online_since:
@@ -1241,18 +1328,21 @@ class ImmoScout(WohnungsMarkt):
         if "https://www.wg-gesucht.de/cuba.html" in self.current_url:
             return 1
         else:
+            from detail_page import DetailPage
+            # panel headlines are indexed once for all getters
+            page = DetailPage(soup)
             return {
                 "inserat_id": inserat_id,
                 "title": self.get_title(soup),
                 "address": self.get_address(soup),
                 "sizes": self.get_sizes(soup),
                 "costs": self.get_costs(soup),
-                "angaben": self.get_angaben(soup),
-                "details": self.get_details(soup),
-                "availability": self.get_availability(soup),
+                "angaben": self.get_angaben(page),
+                "details": self.get_details(page),
+                "availability": self.get_availability(page),
                 "check_available": self.check_wg_available(soup),
                 "wg_images": self.get_wg_images(soup),
-                "roommates": self.get_roommates(soup)
+                "roommates": self.get_roommates(page)
             }
 
     def insert_into_inserate(self, parsed_wg):
@@ -1264,6 +1354,8 @@ class ImmoScout(WohnungsMarkt):
         :parsed_wg: items to fill into wg_gesucht.inserate (dict)
 
         """
+        from psycopg2.extras import Json
+
         preped_l = [
             parsed_wg["inserat_id"],
             parsed_wg["address"]["viertel"] + "_" + self.stadt,
@@ -1294,16 +1386,112 @@ class ImmoScout(WohnungsMarkt):
             parsed_wg["inserat_id"], parsed_wg["wg_images"]
         )
 
-    def insert_into_images(self, inserat_id, images_bytes):
+    def insert_into_images(self, inserat_id, image_hash):
         """
 
-        Inserts bytes of image into DB
+        Inserts hash of stored image into DB
         Used in conjunction with self.get_wg_images
 
         :inserat_id: uid of inserat
-        :images_bytes: bytes of image to fill into wg_gesucht.images_inserate
+        :image_hash: sha256 of image in the image store (string)
 
         """
         self.execute_sql(self.cur,
                          self.images_sql,
-                         [inserat_id, images_bytes])
+                         [inserat_id, image_hash])
+
+
+def crawl(wtype, stadt):
+    """
+
+    crawl all new wg-gesucht inserate of wtype and stadt into the db
+    an interrupted crawl resumes at its checkpoint (CrawlState);
+    stops after [CRAWL] known_pages consecutive pages without new
+    inserate (results are listed newest first)
+
+    :wtype: wohnungstype code (int)
+    :stadt: welche Stadt? (string)
+    :returns: number of new inserate (int)
+
+    """
+    from requests.exceptions import TooManyRedirects
+
+    print(datetime.now())
+    wg = WgGesucht(wtype, stadt)
+    p_cnt = wg.get_page_counter()
+    state = CrawlState.from_config(
+        wg.config, "wohnungsmarkt", stadt, wtype,
+        legacy_counter=os.path.dirname(os.path.realpath(__file__))
+        + "/wg_counter"
+    )
+    start_page = state.begin()
+    print(f"Seite: {start_page}")
+    known_pages = KnownPages.from_config(wg.config)
+    n_new = 0
+    for i in range(start_page, p_cnt):
+        urls_a = wg.get_urls(i)
+        urls = [
+            x for x in urls_a if wg.get_id_of_url(x) not in wg.inserat_ids
+        ]
+        if known_pages.update(len(urls)):
+            print(f"{datetime.now()} keine neuen Inserate mehr für {stadt}")
+            break
+        # written before an interruption
+        urls = [x for x in urls if not state.is_done(wg.get_id_of_url(x))]
+        for url in urls:
+            print(url)
+            try:
+                parsed_wg = wg.parse_wgs(url)
+            except TooManyRedirects:
+                print("Captcha appeared!")
+                sys.exit(1)
+            wg.insert_into_inserate(parsed_wg)
+            state.listings_done([wg.get_id_of_url(url)])
+            n_new += 1
+        # a crash before the save only costs a rebuild of the index
+        wg.inserat_ids.save()
+        state.page_done(i)
+        print(f"Seite {i} fertig")
+    state.complete()
+
+    return n_new
+
+
+def main(argv=None):
+    """
+
+    command line entry point: python -m wohnungsmarkt
+
+    :argv: arguments without program name (list); default sys.argv[1:]
+    :returns: exit code (int)
+
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m wohnungsmarkt",
+        description="Crawl new wg-gesucht.de inserate into the db."
+    )
+    parser.add_argument(
+        "wtype", type=int, choices=sorted(WgGesucht.wtype_d),
+        help="0: wg-zimmer, 1: 1-zimmer-wohnungen, 2: wohnungen, 3: haeuser"
+    )
+    parser.add_argument("stadt", choices=sorted(WgGesucht.city_codes))
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="only print what would be crawled; no db, no network"
+    )
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        print(WgGesucht.build_get_string(args.wtype, args.stadt) + "0.html")
+        return 0
+
+    n_new = crawl(args.wtype, args.stadt)
+    print(f"{n_new} neue Inserate")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())